@@ -0,0 +1,9 @@
+import pytest
+
+
+@pytest.fixture(scope='session', autouse=True)
+def isolated_caches(django_test_environment):
+    # pytest-django does not use TEST_RUNNER, see planetarium_api/runner.py
+    from planetarium_api.runner import isolated_caches
+    with isolated_caches():
+        yield
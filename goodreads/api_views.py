@@ -1,6 +1,10 @@
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from django.conf import settings
+from django.db.models import F
+from django.shortcuts import get_object_or_404
 
 # filtering and searching
 from django_filters.rest_framework import DjangoFilterBackend
@@ -9,21 +13,61 @@ from rest_framework.filters import SearchFilter, OrderingFilter
 from rest_framework.pagination import PageNumberPagination
 
 # models and serializers
-from .models import GoodreadsAccount
+from .models import Book, GoodreadsAccount, UserBook
 from .serializers import GoodreadsAccountSerializer
-from planetarium_api.mixins import OptionalAuthMixin
+from planetarium_api import instrumentation
+from planetarium_api import export as streaming
+from planetarium_api.mixins import OptionalAuthMixin, ConditionalGetMixin, ReplicaReadMixin
 from .serializers import BookSerializer
+from . import network
 from rest_framework.decorators import action
 # path action
 from rest_framework.decorators import action
 
 
-class GoodreadsViewSet(OptionalAuthMixin, ModelViewSet):
+def parse_depth(depth):
+    """
+    ?depth= of network_books/recommendations, None when absent.
+    """
+    if depth is None:
+        return None
+    max_depth = getattr(settings, 'GOODREADS_NETWORK_MAX_DEPTH', 4)
+    try:
+        depth = int(depth)
+    except ValueError:
+        depth = 0
+    if not 1 <= depth <= max_depth:
+        raise ValidationError({'depth': f'Must be an integer between 1 and {max_depth}.'})
+    return depth
+
+
+def network_books_by_depth(user_username, depth, own, books, truncated, visited):
+    return {
+        'user': user_username,
+        'depth': depth,
+        'visited': visited,
+        'truncated': truncated,
+        'user_books': [{'id': book_id, 'name': name, 'author': author} for book_id, name, author in own],
+        'friends_books': [
+            {'id': book_id, 'name': name, 'author': author, 'distance': distance, 'owners': list(owners)}
+            for book_id, name, author, distance, owners in books
+        ],
+    }
+
+
+class GoodreadsViewSet(OptionalAuthMixin, ConditionalGetMixin, ReplicaReadMixin, ModelViewSet):
     """
     Handles list, retrieve, create, update, and delete for Goodreads accounts.
     GET: /api/v1/goodreads/ =>  List all goodreads accounts
     GET: /api/v1/goodreads/{id}/ => Retrieve a specific goodreads account by ID
     GET: /api/v1/goodreads/{user_username}/network_books/ => Get friends' books for a given user ID
+    GET: /api/v1/goodreads/{user_username}/network_books/?depth=2 => books up to 2 friend hops away,
+         with the hop distance and owners of each book
+    GET: /api/v1/goodreads/{user_username}/recommendations/?depth=2&limit=10 => books the user does not own,
+         ranked by the friends owning them, nearer friends weighing more
+    GET: /api/v1/goodreads/export/books/?format=csv&author=... => every book, streamed as NDJSON or CSV
+    GET: /api/v1/goodreads/export/user_books/?format=ndjson&user__username=... => every owned book, streamed
+    Account and network_books responses carry an ETag and answer If-None-Match with 304.
     """
     queryset = GoodreadsAccount.objects.all()
     serializer_class = GoodreadsAccountSerializer
@@ -34,34 +78,146 @@ class GoodreadsViewSet(OptionalAuthMixin, ModelViewSet):
     ordering_fields = ['user__username']
     ordering = ['user__username']
     lookup_field = 'user__username'  # assuming user is identified by username
+    book_export_fields = ('id', 'name', 'author')
+    user_book_export_fields = ('id', 'user', 'book_id', 'book_name', 'author')
 
     def get_queryset(self):
         queryset = super().get_queryset()
         return queryset
 
-    @action(detail=False, methods=['get'], url_path=r'(?P<user_username>[^/.]+)/network_books')
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        # the serializer only exposes the user, friend ids and book ids
+        not_modified = self.conditional_response(
+            request,
+            instance.pk,
+            tuple(sorted(instance.friends.values_list('pk', flat=True))),
+            tuple(sorted(instance.user_books.values_list('pk', flat=True))),
+        )
+        if not_modified is not None:
+            return not_modified
+        return super().retrieve(request, *args, **kwargs)
+
+    def network_validators(self, goodreads_account):
+        """
+        Everything network_books renders, as compact rows: no model instances, no serializer.
+        """
+        own = goodreads_account.user_books.order_by('pk').values_list('pk', 'name', 'author')
+        indexed = self.network_books_queryset(goodreads_account).order_by('pk').values_list('pk', 'name', 'author')
+        return (goodreads_account.pk, tuple(own), tuple(indexed))
+
+    def network_books_queryset(self, goodreads_account):
+        # single indexed read of the materialized index, see goodreads/network.py
+        return Book.objects.filter(network_entries__goodreads_account=goodreads_account)
+
+    def get_depth(self, request):
+        return parse_depth(request.query_params.get('depth'))
+
+    def get_limit(self, request):
+        max_limit = getattr(settings, 'GOODREADS_RECOMMENDATIONS_MAX_LIMIT', 100)
+        limit = request.query_params.get('limit', 10)
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= max_limit:
+            raise ValidationError({'limit': f'Must be an integer between 1 and {max_limit}.'})
+        return limit
+
+    def get_network_books_by_depth(self, request, goodreads_account, user_username, depth):
+        books, truncated, visited = network.discover_books(goodreads_account.pk, depth)
+        own = tuple(goodreads_account.user_books.order_by('name').values_list('pk', 'name', 'author'))
+        not_modified = self.conditional_response(request, goodreads_account.pk, own, tuple(books), truncated)
+        if not_modified is not None:
+            return not_modified
+        data = network_books_by_depth(user_username, depth, own, books, truncated, visited)
+        return Response(data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path=r'(?P<user_username>[^/.]+)/network_books', url_name='network-books')
     def get_network_books(self, request, user_username=None):
 
         # Get the account
-        goodreads_account = GoodreadsAccount.objects.get(user__username=user_username)
+        goodreads_account = get_object_or_404(GoodreadsAccount, user__username=user_username)
+        depth = self.get_depth(request)
+        if depth is not None:
+            return self.get_network_books_by_depth(request, goodreads_account, user_username, depth)
 
-        # Get friends' books
-        friends = goodreads_account.friends.prefetch_related('user_books').all()  # fixing N+1 query problem after check theory
-        friends_books = set()
-        for friend in friends:
-            friends_books.update(friend.user_books.all())
+        not_modified = self.conditional_response(request, *self.network_validators(goodreads_account))
+        if not_modified is not None:
+            return not_modified
 
-        friends_books_list = list(friends_books)
-        serializer = BookSerializer(friends_books_list, many=True)
+        # Get friends' books from the network books index
+        serializer = BookSerializer(self.network_books_queryset(goodreads_account), many=True)
 
         # Get user's books
         user_books = goodreads_account.user_books.all()
         user_serializer = BookSerializer(user_books, many=True)
 
+        with instrumentation.timed('serialize'):
+            data = {
+                'user': user_username,
+                'user_books': user_serializer.data,
+                'friends_books': serializer.data
+            }
+
+        return Response(data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path=r'(?P<user_username>[^/.]+)/recommendations', url_name='recommendations')
+    def get_recommendations(self, request, user_username=None):
+        goodreads_account = get_object_or_404(GoodreadsAccount, user__username=user_username)
+        depth = self.get_depth(request)
+        if depth is None:
+            depth = min(2, getattr(settings, 'GOODREADS_NETWORK_MAX_DEPTH', 4))
+        limit = self.get_limit(request)
+
+        ranked, truncated, visited = network.recommend(goodreads_account.pk, depth, limit)
+        not_modified = self.conditional_response(request, goodreads_account.pk, tuple(ranked), truncated)
+        if not_modified is not None:
+            return not_modified
+
+        books = Book.objects.in_bulk([book_id for book_id, _, _ in ranked])
         data = {
             'user': user_username,
-            'user_books': user_serializer.data,
-            'friends_books': serializer.data
+            'depth': depth,
+            'visited': visited,
+            'truncated': truncated,
+            'recommendations': [
+                {
+                    'id': book_id,
+                    'name': books[book_id].name,
+                    'author': books[book_id].author,
+                    'score': round(score, 4),
+                    'owners': owners,
+                }
+                for book_id, score, owners in ranked
+            ],
         }
-
         return Response(data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='export/books', url_name='export-books',
+            renderer_classes=streaming.RENDERERS)
+    def export_books(self, request):
+        books = Book.objects.order_by('id')
+        author = request.query_params.get('author')
+        if author:
+            books = books.filter(author=author)
+        return streaming.export_response(
+            request, streaming.chunks(books.values(*self.book_export_fields)),
+            self.book_export_fields, request.accepted_renderer.format, 'books',
+        )
+
+    @action(detail=False, methods=['get'], url_path='export/user_books', url_name='export-user-books',
+            renderer_classes=streaming.RENDERERS)
+    def export_user_books(self, request):
+        # usernames and book names joined in, no per-row lookups
+        user_books = UserBook.objects.order_by('id').values(
+            'id', 'book_id', user=F('goodreads_account__user__username'),
+            book_name=F('book__name'), author=F('book__author'),
+        )
+        username = request.query_params.get('user__username')
+        if username:
+            user_books = user_books.filter(goodreads_account__user__username=username)
+        return streaming.export_response(
+            request, streaming.chunks(user_books), self.user_book_export_fields,
+            request.accepted_renderer.format, 'user_books',
+        )
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class GoodreadsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'goodreads'
+
+    def ready(self):
+        # network books index maintenance
+        from . import signals  # noqa: F401
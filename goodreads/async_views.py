@@ -0,0 +1,46 @@
+"""
+Async-native network_books, served next to the DRF view under /api/v1/async/.
+
+Same payload as GoodreadsViewSet.get_network_books. The default response is
+two reads (own books, the materialized network index) through the async ORM;
+`?depth=N` runs the synchronous breadth-first walk of goodreads/network.py in
+one sync_to_async call.
+"""
+from asgiref.sync import sync_to_async
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import ValidationError
+
+from planetarium_api.async_support import json_response, optional_auth
+
+from . import network
+from .api_views import network_books_by_depth, parse_depth
+from .models import Book, GoodreadsAccount
+
+BOOK_FIELDS = ('id', 'name', 'author')
+
+
+@require_GET
+@optional_auth
+async def network_books(request, user_username):
+    try:
+        depth = parse_depth(request.GET.get('depth'))
+    except ValidationError as exc:
+        return json_response(exc.detail, status=400)
+    try:
+        goodreads_account = await GoodreadsAccount.objects.aget(user__username=user_username)
+    except GoodreadsAccount.DoesNotExist:
+        return json_response({'detail': 'No GoodreadsAccount matches the given query.'}, status=404)
+
+    if depth is not None:
+        books, truncated, visited = await sync_to_async(network.discover_books)(goodreads_account.pk, depth)
+        own = goodreads_account.user_books.order_by('name').values_list('pk', 'name', 'author')
+        own = [row async for row in own]
+        return json_response(network_books_by_depth(user_username, depth, own, books, truncated, visited))
+
+    friends_books = Book.objects.filter(network_entries__goodreads_account=goodreads_account).values(*BOOK_FIELDS)
+    user_books = goodreads_account.user_books.values(*BOOK_FIELDS)
+    return json_response({
+        'user': user_username,
+        'user_books': [book async for book in user_books],
+        'friends_books': [book async for book in friends_books],
+    })
@@ -0,0 +1,58 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from goodreads import network
+
+
+class Command(BaseCommand):
+    help = 'Time goodreads recommendations on an in-memory synthetic friend graph (no database access)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--books', type=int, default=50000)
+        parser.add_argument('--avg-friends', type=int, default=20)
+        parser.add_argument('--avg-books', type=int, default=10)
+        parser.add_argument('--depth', type=int, nargs='+', default=[1, 2, 3])
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--samples', type=int, default=20, help='users ranked per depth')
+        parser.add_argument('--max-visited', type=int, default=100000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        users, books = options['users'], options['books']
+        start = time.perf_counter()
+        edges = [rng.sample(range(users), rng.randint(0, 2 * options['avg_friends'])) for _ in range(users)]
+        owned = [rng.sample(range(books), rng.randint(0, 2 * options['avg_books'])) for _ in range(users)]
+        self.stdout.write(
+            f'graph: {users} users, {sum(map(len, edges))} edges, {sum(map(len, owned))} owned books '
+            f'built in {time.perf_counter() - start:.1f} s'
+        )
+
+        def fetch_edges(frontier):
+            return ((user, friend) for user in frontier for friend in edges[user])
+
+        def fetch_owned(accounts):
+            return ((account, book) for account in accounts for book in owned[account])
+
+        sample = rng.sample(range(users), options['samples'])
+        for depth in options['depth']:
+            timings, visited, truncated = [], [], 0
+            for user in sample:
+                start = time.perf_counter()
+                _, was_truncated, reached = network.recommend(
+                    user, depth, options['limit'], fetch_edges=fetch_edges, fetch_owned=fetch_owned,
+                    max_visited=options['max_visited'], time_budget_ms=60 * 1000,
+                )
+                timings.append(time.perf_counter() - start)
+                visited.append(reached)
+                truncated += was_truncated
+            timings.sort()
+            self.stdout.write(
+                f'depth {depth}: p50 {statistics.median(timings) * 1000:8.2f} ms  '
+                f'max {timings[-1] * 1000:8.2f} ms  '
+                f'visited ~{int(statistics.mean(visited))}  truncated {truncated}/{len(sample)}'
+            )
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from goodreads import network
+from goodreads.models import GoodreadsAccount
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the network books index (NetworkBook) from friends and user books'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='usernames', help='only rebuild these usernames (repeatable)')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        account_ids = None
+        if options['usernames']:
+            account_ids = list(GoodreadsAccount.objects.filter(user__username__in=options['usernames']).values_list('pk', flat=True))
+        with transaction.atomic():
+            written = network.rebuild(account_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Network books index rebuilt: {written} rows in {time.perf_counter() - start:.2f}s'
+        ))
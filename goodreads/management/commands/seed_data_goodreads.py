@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from goodreads.models import Book, GoodreadsAccount, UserBook, Friend
+from goodreads import network
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -71,6 +72,8 @@ class Command(BaseCommand):
             Friend(user=charlie_account, friend=momo_account),
             Friend(user=charlie_account, friend=bob_account),
         ])
+        # bulk_create skips the signals that maintain the network books index
+        network.rebuild()
 
     def flush_data(self):
         Book.objects.all().delete()
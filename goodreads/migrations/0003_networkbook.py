@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def build_network_books(apps, schema_editor):
+    UserBook = apps.get_model('goodreads', 'UserBook')
+    NetworkBook = apps.get_model('goodreads', 'NetworkBook')
+    rows = UserBook.objects.filter(goodreads_account__friendship_to__isnull=False).values(
+        'goodreads_account__friendship_to__user_id', 'book_id'
+    ).annotate(owners=Count('id')).order_by()
+    NetworkBook.objects.bulk_create([
+        NetworkBook(goodreads_account_id=row['goodreads_account__friendship_to__user_id'], book_id=row['book_id'], owners=row['owners'])
+        for row in rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goodreads', '0002_alter_goodreadsaccount_friends'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NetworkBook',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('owners', models.PositiveIntegerField(default=1)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='network_entries', to='goodreads.book')),
+                ('goodreads_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='network_books', to='goodreads.goodreadsaccount')),
+            ],
+            options={
+                'verbose_name': 'NetworkBook',
+                'verbose_name_plural': 'NetworkBooks',
+                'db_table': 'network_books',
+                'ordering': ['goodreads_account', 'book'],
+                'constraints': [models.UniqueConstraint(fields=('goodreads_account', 'book'), name='unique_network_book')],
+            },
+        ),
+        migrations.RunPython(build_network_books, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:15
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_friendships(apps, schema_editor):
+    """
+    Keep the first row of every (user, friend) pair. The network books index
+    counted each duplicate as an owner, rebuild it when rows were removed.
+    """
+    Friend = apps.get_model('goodreads', 'Friend')
+    UserBook = apps.get_model('goodreads', 'UserBook')
+    NetworkBook = apps.get_model('goodreads', 'NetworkBook')
+    duplicates = Friend.objects.values('user_id', 'friend_id').annotate(keep=Min('id'), rows=Count('id')).filter(rows__gt=1)
+    removed = 0
+    for pair in duplicates:
+        removed += Friend.objects.filter(user_id=pair['user_id'], friend_id=pair['friend_id']).exclude(id=pair['keep']).delete()[0]
+    if not removed:
+        return
+    NetworkBook.objects.all().delete()
+    rows = UserBook.objects.filter(goodreads_account__friendship_to__isnull=False).values(
+        'goodreads_account__friendship_to__user_id', 'book_id'
+    ).annotate(owners=Count('id')).order_by()
+    NetworkBook.objects.bulk_create([
+        NetworkBook(goodreads_account_id=row['goodreads_account__friendship_to__user_id'], book_id=row['book_id'], owners=row['owners'])
+        for row in rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goodreads', '0003_networkbook'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_friendships, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='friend',
+            constraint=models.UniqueConstraint(fields=('user', 'friend'), name='unique_friendship'),
+        ),
+    ]
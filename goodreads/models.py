@@ -55,6 +55,28 @@ class Friend(models.Model):
         verbose_name = 'Friend'
         verbose_name_plural = 'Friends'
         db_table = 'friends_relationships'
-books = Book.objects.all()  # 1 query for all books
-for book in books:
-    print(book.author.name)  # 1 query per book → N queries
\ No newline at end of file
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'friend'], name='unique_friendship')
+        ]
+
+
+class NetworkBook(models.Model):
+    """
+    Materialized "network books" index: one row per (account, book) where the
+    book is owned by at least one of the account's friends. `owners` counts the
+    friend edges owning it, so the row is removed when it drops to zero.
+    Maintained by goodreads/signals.py, rebuilt by `manage.py rebuild_network_books`.
+    """
+    id = models.BigAutoField(primary_key=True)
+    goodreads_account = models.ForeignKey(GoodreadsAccount, on_delete=models.CASCADE, related_name='network_books')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='network_entries')
+    owners = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        ordering = ['goodreads_account', 'book']
+        verbose_name = 'NetworkBook'
+        verbose_name_plural = 'NetworkBooks'
+        db_table = 'network_books'
+        constraints = [
+            models.UniqueConstraint(fields=['goodreads_account', 'book'], name='unique_network_book')
+        ]
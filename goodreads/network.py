@@ -0,0 +1,219 @@
+"""
+Social network helpers.
+
+Maintenance of the NetworkBook index: every change is applied set based, a
+friendship edge shifts the counters of all the friend's books for one
+account, an owned book shifts the counters of one book for every account
+that has the owner as a friend.
+
+Multi-hop discovery: a bounded breadth-first walk over Friend edges with one
+set based query per hop.
+
+Recommendations: books the user does not own, scored by the friends that own
+them, every owner weighted by its hop distance.
+"""
+import heapq
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F
+
+from .models import Book, Friend, NetworkBook, UserBook
+
+CHUNK_SIZE = 500
+
+
+def shift(account_ids, book_ids, delta):
+    """
+    Add `delta` to the owners counter of every (account, book) pair.
+    """
+    account_ids, book_ids = list(account_ids), list(book_ids)
+    if not account_ids or not book_ids or not delta:
+        return
+    rows = NetworkBook.objects.filter(goodreads_account_id__in=account_ids, book_id__in=book_ids)
+    rows.update(owners=F('owners') + delta)
+    if delta > 0:
+        existing = set(rows.values_list('goodreads_account_id', 'book_id'))
+        NetworkBook.objects.bulk_create([
+            NetworkBook(goodreads_account_id=account_id, book_id=book_id, owners=delta)
+            for account_id in account_ids for book_id in book_ids
+            if (account_id, book_id) not in existing
+        ], batch_size=CHUNK_SIZE)
+    else:
+        rows.filter(owners__lte=0).delete()
+
+
+def friendship_changed(user_id, friend_id, delta):
+    """
+    `user_id` gained (delta=1) or lost (delta=-1) the friend `friend_id`.
+    """
+    book_ids = UserBook.objects.filter(goodreads_account_id=friend_id).values_list('book_id', flat=True)
+    shift([user_id], book_ids, delta)
+
+
+def ownership_changed(owner_id, book_id, delta):
+    """
+    `owner_id` gained (delta=1) or lost (delta=-1) the book `book_id`.
+    """
+    # duplicated friendship rows count twice, like the rebuild does
+    followers = Counter(Friend.objects.filter(friend_id=owner_id).values_list('user_id', flat=True))
+    by_multiplicity = {}
+    for account_id, edges in followers.items():
+        by_multiplicity.setdefault(edges, []).append(account_id)
+    for edges, account_ids in by_multiplicity.items():
+        shift(account_ids, [book_id], delta * edges)
+
+
+def rebuild(account_ids=None):
+    """
+    Recompute the index for the given accounts, or for everyone.
+    Returns the number of index rows written.
+    """
+    if account_ids is None:
+        NetworkBook.objects.all().delete()
+        scopes = [None]
+    else:
+        account_ids = sorted(set(account_ids))
+        scopes = [account_ids[start:start + CHUNK_SIZE] for start in range(0, len(account_ids), CHUNK_SIZE)]
+
+    written = 0
+    for scope in scopes:
+        if scope is None:
+            rows = UserBook.objects.filter(goodreads_account__friendship_to__isnull=False)
+        else:
+            NetworkBook.objects.filter(goodreads_account_id__in=scope).delete()
+            # a single filter() call, so the Friend join is not duplicated
+            rows = UserBook.objects.filter(goodreads_account__friendship_to__user_id__in=scope)
+        rows = rows.values('goodreads_account__friendship_to__user_id', 'book_id').annotate(owners=Count('id')).order_by()
+        batch = []
+        for row in rows.iterator(chunk_size=2000):
+            batch.append(NetworkBook(
+                goodreads_account_id=row['goodreads_account__friendship_to__user_id'],
+                book_id=row['book_id'],
+                owners=row['owners'],
+            ))
+            if len(batch) >= CHUNK_SIZE:
+                NetworkBook.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        NetworkBook.objects.bulk_create(batch)
+        written += len(batch)
+    return written
+
+
+def fetch_friend_edges(frontier):
+    """
+    (user_id, friend_id) for every Friend edge leaving `frontier`.
+    """
+    frontier = list(frontier)
+    for start in range(0, len(frontier), CHUNK_SIZE):
+        yield from Friend.objects.filter(user_id__in=frontier[start:start + CHUNK_SIZE]).values_list('user_id', 'friend_id')
+
+
+def walk(start_id, depth, max_visited=None, time_budget_ms=None, fetch_edges=fetch_friend_edges):
+    """
+    Breadth-first walk from `start_id` up to `depth` hops.
+
+    Returns `(distances, truncated)` where distances maps every reached account
+    (not the start) to its hop count. The walk stops early, with truncated set,
+    once `max_visited` accounts were reached or the time budget ran out.
+    """
+    if max_visited is None:
+        max_visited = getattr(settings, 'GOODREADS_NETWORK_MAX_VISITED', 10000)
+    if time_budget_ms is None:
+        time_budget_ms = getattr(settings, 'GOODREADS_NETWORK_TIME_BUDGET_MS', 250)
+    deadline = time.monotonic() + time_budget_ms / 1000
+
+    distances = {}
+    seen = {start_id}
+    frontier = {start_id}
+    for hop in range(1, depth + 1):
+        if not frontier:
+            break
+        if time.monotonic() > deadline:
+            return distances, True
+        next_frontier = set()
+        for index, (_, friend_id) in enumerate(fetch_edges(frontier)):
+            if not index % 1024 and time.monotonic() > deadline:
+                return distances, True
+            if friend_id in seen:
+                continue
+            if len(distances) >= max_visited:
+                return distances, True
+            seen.add(friend_id)
+            distances[friend_id] = hop
+            next_frontier.add(friend_id)
+        frontier = next_frontier
+    return distances, False
+
+
+def fetch_owned_books(account_ids):
+    """
+    (account_id, book_id) for every book owned by `account_ids`.
+    """
+    account_ids = list(account_ids)
+    for start in range(0, len(account_ids), CHUNK_SIZE):
+        ownership = UserBook.objects.filter(goodreads_account_id__in=account_ids[start:start + CHUNK_SIZE])
+        yield from ownership.values_list('goodreads_account_id', 'book_id')
+
+
+def discover_books(start_id, depth, **limits):
+    """
+    Books owned anywhere in the `depth` hop network of `start_id`.
+
+    Returns `(books, truncated, visited)`; every book row is
+    `(book_id, name, author, distance, owners)` with the hop distance of the
+    closest owner and the owners' usernames, nearest first.
+    """
+    distances, truncated = walk(start_id, depth, **limits)
+    owners = {}
+    for account_id, book_id in fetch_owned_books(distances):
+        owners.setdefault(book_id, []).append(account_id)
+
+    # GoodreadsAccount is keyed by its user, so account ids are user ids
+    usernames = {}
+    owner_ids = list({account_id for accounts in owners.values() for account_id in accounts})
+    book_ids = list(owners)
+    books = {}
+    for start in range(0, max(len(owner_ids), len(book_ids)), CHUNK_SIZE):
+        usernames.update(get_user_model().objects.filter(pk__in=owner_ids[start:start + CHUNK_SIZE]).values_list('pk', 'username'))
+        chunk = Book.objects.filter(pk__in=book_ids[start:start + CHUNK_SIZE]).values_list('pk', 'name', 'author')
+        books.update((row[0], row) for row in chunk)
+
+    rows = []
+    for book_id, accounts in owners.items():
+        accounts.sort(key=lambda account_id: (distances[account_id], usernames[account_id]))
+        _, name, author = books[book_id]
+        rows.append((book_id, name, author, distances[accounts[0]], tuple(usernames[account_id] for account_id in accounts)))
+    rows.sort(key=lambda row: (row[3], row[1]))
+    return rows, truncated, len(distances)
+
+
+def recommend(start_id, depth, limit, decay=None, fetch_edges=fetch_friend_edges, fetch_owned=fetch_owned_books, **limits):
+    """
+    Top `limit` books of the `depth` hop network that `start_id` does not own.
+
+    An owner at distance d adds `decay ** (d - 1)` to the book's score, so a
+    direct friend counts 1, a friend of a friend `decay`, and so on. Returns
+    `(ranked, truncated, visited)` with `(book_id, score, owners)` rows, best
+    first; ties go to the book with more owners, then the lower id.
+    """
+    if decay is None:
+        decay = getattr(settings, 'GOODREADS_RECOMMENDATION_DECAY', 0.5)
+    distances, truncated = walk(start_id, depth, fetch_edges=fetch_edges, **limits)
+    weights = [decay ** hop for hop in range(depth)]
+    owned = {book_id for _, book_id in fetch_owned([start_id])}
+
+    scores = defaultdict(float)
+    owners = Counter()
+    for account_id, book_id in fetch_owned(distances):
+        if book_id in owned:
+            continue
+        scores[book_id] += weights[distances[account_id] - 1]
+        owners[book_id] += 1
+
+    # k largest without sorting every candidate
+    best = heapq.nlargest(limit, scores, key=lambda book_id: (scores[book_id], owners[book_id], -book_id))
+    return [(book_id, scores[book_id], owners[book_id]) for book_id in best], truncated, len(distances)
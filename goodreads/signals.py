@@ -0,0 +1,73 @@
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import Friend, GoodreadsAccount, UserBook
+from . import network
+
+
+@receiver(pre_save, sender=Friend)
+@receiver(pre_save, sender=UserBook)
+def remember_previous_row(sender, instance, **kwargs):
+    # an edited row is treated as delete(old) + create(new)
+    instance._network_previous = None
+    if instance.pk is not None:
+        instance._network_previous = sender.objects.filter(pk=instance.pk).values().first()
+
+
+@receiver(post_save, sender=Friend)
+def friend_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_network_previous', None)
+    if previous:
+        if (previous['user_id'], previous['friend_id']) == (instance.user_id, instance.friend_id):
+            return
+        network.friendship_changed(previous['user_id'], previous['friend_id'], -1)
+    network.friendship_changed(instance.user_id, instance.friend_id, 1)
+
+
+@receiver(post_delete, sender=Friend)
+def friend_deleted(sender, instance, **kwargs):
+    network.friendship_changed(instance.user_id, instance.friend_id, -1)
+
+
+@receiver(post_save, sender=UserBook)
+def user_book_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_network_previous', None)
+    if previous:
+        if (previous['goodreads_account_id'], previous['book_id']) == (instance.goodreads_account_id, instance.book_id):
+            return
+        network.ownership_changed(previous['goodreads_account_id'], previous['book_id'], -1)
+    network.ownership_changed(instance.goodreads_account_id, instance.book_id, 1)
+
+
+@receiver(post_delete, sender=UserBook)
+def user_book_deleted(sender, instance, **kwargs):
+    network.ownership_changed(instance.goodreads_account_id, instance.book_id, -1)
+
+
+@receiver(m2m_changed, sender=GoodreadsAccount.friends.through)
+def friends_added(sender, instance, action, pk_set, **kwargs):
+    """
+    account.friends.add()/.set() bulk insert Friend rows without post_save.
+    Removals go through QuerySet.delete(), which already sends post_delete.
+    """
+    if action != 'post_add' or not pk_set:
+        return
+    # symmetrical: Django inserts the missing mirror rows right after this signal
+    mirrored = set(Friend.objects.filter(user_id__in=pk_set, friend_id=instance.pk).values_list('user_id', flat=True))
+    for friend_id in pk_set:
+        network.friendship_changed(instance.pk, friend_id, 1)
+        if friend_id not in mirrored:
+            network.friendship_changed(friend_id, instance.pk, 1)
+
+
+@receiver(m2m_changed, sender=GoodreadsAccount.user_books.through)
+def user_books_added(sender, instance, action, reverse, pk_set, **kwargs):
+    if action != 'post_add' or not pk_set:
+        return
+    if reverse:
+        # book.user_owned_books.add(account, ...)
+        for account_id in pk_set:
+            network.ownership_changed(account_id, instance.pk, 1)
+    else:
+        for book_id in pk_set:
+            network.ownership_changed(instance.pk, book_id, 1)
@@ -1,4 +1,7 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+from io import StringIO
+from asgiref.sync import sync_to_async
 
 
 class GoodreadsAPITestCase(TestCase):
@@ -26,3 +29,171 @@ class GoodreadsAPITestCase(TestCase):
         response = self.client.get('/api/v1/goodreads/test_1/network_books/')
         self.assertEqual(response.status_code, 200)
         # Add more assertions as needed
+
+    def test_network_books_conditional_get(self):
+        url = '/api/v1/goodreads/test_1/network_books/'
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # a friend's book changing invalidates the ETag
+        self.book2.author = 'A. Huxley'
+        self.book2.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['friends_books'][0]['author'], 'A. Huxley')
+
+    def test_account_conditional_get(self):
+        url = '/api/v1/goodreads/test_1/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        from .models import UserBook
+        UserBook.objects.create(goodreads_account=self.account1, book=self.book2)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    async def test_async_network_books(self):
+        for query in ('', '?depth=2', '?depth=9'):
+            response = await self.async_client.get('/api/v1/async/goodreads/test_1/network_books/' + query)
+            expected = await sync_to_async(self.client.get)('/api/v1/goodreads/test_1/network_books/' + query)
+            self.assertEqual(response.status_code, expected.status_code)
+            self.assertEqual(response.json(), expected.json())
+        response = await self.async_client.get('/api/v1/async/goodreads/nobody/network_books/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_exports(self):
+        response = self.client.get('/api/v1/goodreads/export/books/?format=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual(body.splitlines(), [
+            'id,name,author', f'{self.book1.pk},1984,George Orwell', f'{self.book2.pk},Brave New World,Aldous Huxley',
+        ])
+        from .models import UserBook
+        user_book = UserBook.objects.get(goodreads_account=self.account2)
+        response = self.client.get('/api/v1/goodreads/export/user_books/?user__username=test_2')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertEqual(b''.join(response.streaming_content).decode().splitlines(), [
+            f'{{"id":{user_book.pk},"book_id":{self.book2.pk},"user":"test_2","book_name":"Brave New World","author":"Aldous Huxley"}}',
+        ])
+
+    def index(self, account):
+        from .models import NetworkBook
+        return dict(NetworkBook.objects.filter(goodreads_account=account).values_list('book__name', 'owners'))
+
+    def test_network_books_index_is_maintained(self):
+        from django.contrib.auth.models import User
+        from .models import GoodreadsAccount, Book, UserBook, Friend, NetworkBook
+        self.assertEqual(self.index(self.account1), {'Brave New World': 1})
+
+        user3 = User.objects.create_user(username='test_3', password='password123')
+        account3 = GoodreadsAccount.objects.create(user=user3)
+        book3 = Book.objects.create(name='Dune', author='Frank Herbert')
+        UserBook.objects.create(goodreads_account=account3, book=book3)
+        UserBook.objects.create(goodreads_account=account3, book=self.book2)
+        friendship = Friend.objects.create(user=self.account1, friend=account3)
+        self.assertEqual(self.index(self.account1), {'Brave New World': 2, 'Dune': 1})
+
+        # through the symmetrical M2M manager (no post_save on Friend)
+        self.account2.friends.add(account3)
+        self.assertEqual(self.index(self.account2), {'Brave New World': 1, 'Dune': 1})
+        self.assertEqual(self.index(account3), {'Brave New World': 1})
+
+        UserBook.objects.get(goodreads_account=account3, book=self.book2).delete()
+        friendship.delete()
+        self.assertEqual(self.index(self.account1), {'Brave New World': 1})
+        self.account2.friends.remove(account3)
+        self.assertEqual(self.index(account3), {})
+        account3.user_books.add(self.book1)
+        self.account2.friends.set([account3])
+        self.assertEqual(self.index(self.account2), {'1984': 1, 'Dune': 1})
+
+        incremental = set(NetworkBook.objects.values_list('goodreads_account_id', 'book_id', 'owners'))
+        call_command('rebuild_network_books', stdout=StringIO())
+        self.assertEqual(set(NetworkBook.objects.values_list('goodreads_account_id', 'book_id', 'owners')), incremental)
+
+    def test_friendship_is_unique(self):
+        from django.db import IntegrityError, transaction
+        from .models import Friend
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Friend.objects.create(user=self.account1, friend=self.account2)
+
+    def test_network_books_reads_the_index(self):
+        url = '/api/v1/goodreads/test_1/network_books/'
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual([book['name'] for book in response.json()['friends_books']], ['Brave New World'])
+        self.assertEqual([book['name'] for book in response.json()['user_books']], ['1984'])
+
+    def make_chain(self):
+        """test_1 -> test_2 -> test_3 -> test_4, each owning one more book"""
+        from django.contrib.auth.models import User
+        from .models import GoodreadsAccount, Book, UserBook, Friend
+        previous = self.account2
+        for index in (3, 4):
+            account = GoodreadsAccount.objects.create(user=User.objects.create_user(username=f'test_{index}', password='password123'))
+            UserBook.objects.create(goodreads_account=account, book=Book.objects.create(name=f'Book {index}', author='Anon'))
+            UserBook.objects.create(goodreads_account=account, book=self.book2)
+            Friend.objects.create(user=previous, friend=account)
+            previous = account
+
+    def test_network_books_depth(self):
+        self.make_chain()
+        response = self.client.get('/api/v1/goodreads/test_1/network_books/?depth=2')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertFalse(data['truncated'])
+        self.assertEqual(data['visited'], 2)
+        books = {book['name']: book for book in data['friends_books']}
+        self.assertEqual(set(books), {'Brave New World', 'Book 3'})
+        self.assertEqual(books['Brave New World']['distance'], 1)
+        self.assertEqual(books['Brave New World']['owners'], ['test_2', 'test_3'])
+        self.assertEqual(books['Book 3']['distance'], 2)
+
+        # one query per hop, not per account
+        with self.assertNumQueries(8):
+            data = self.client.get('/api/v1/goodreads/test_1/network_books/?depth=3').json()
+        self.assertEqual([book['name'] for book in data['friends_books']], ['Brave New World', 'Book 3', 'Book 4'])
+
+    def test_network_books_depth_limits(self):
+        self.make_chain()
+        with override_settings(GOODREADS_NETWORK_MAX_VISITED=1):
+            data = self.client.get('/api/v1/goodreads/test_1/network_books/?depth=3').json()
+        self.assertTrue(data['truncated'])
+        self.assertEqual(data['visited'], 1)
+        with override_settings(GOODREADS_NETWORK_TIME_BUDGET_MS=0):
+            self.assertTrue(self.client.get('/api/v1/goodreads/test_1/network_books/?depth=3').json()['truncated'])
+        for depth in ('0', '9', 'two'):
+            response = self.client.get(f'/api/v1/goodreads/test_1/network_books/?depth={depth}')
+            self.assertEqual(response.status_code, 400)
+        for query in ('', '?depth=2'):
+            response = self.client.get(f'/api/v1/goodreads/nobody/network_books/{query}')
+            self.assertEqual(response.status_code, 404)
+
+    def test_recommendations(self):
+        from .models import UserBook, GoodreadsAccount
+        self.make_chain()
+        # already owned by test_1, never recommended
+        UserBook.objects.create(goodreads_account=GoodreadsAccount.objects.get(user__username='test_3'), book=self.book1)
+        response = self.client.get('/api/v1/goodreads/test_1/recommendations/?depth=3')
+        self.assertEqual(response.status_code, 200)
+        ranked = [(book['name'], book['score'], book['owners']) for book in response.json()['recommendations']]
+        self.assertEqual(ranked, [('Brave New World', 1.75, 3), ('Book 3', 0.5, 1), ('Book 4', 0.25, 1)])
+
+        response = self.client.get('/api/v1/goodreads/test_1/recommendations/?depth=3&limit=1')
+        self.assertEqual([book['name'] for book in response.json()['recommendations']], ['Brave New World'])
+        self.assertEqual(self.client.get('/api/v1/goodreads/test_1/recommendations/?limit=0').status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/goodreads/nobody/recommendations/').status_code, 404)
+
+    def test_recommend_ranking(self):
+        from . import network
+        # in-memory graph: 1 -> 2, 3 -> 4
+        edges = {1: [2, 3], 2: [4], 3: [4], 4: []}
+        books = {1: [10], 2: [11, 12], 3: [12], 4: [13, 10]}
+        ranked, truncated, visited = network.recommend(
+            1, 2, 2, decay=0.5,
+            fetch_edges=lambda frontier: [(user, friend) for user in frontier for friend in edges[user]],
+            fetch_owned=lambda accounts: [(account, book) for account in accounts for book in books[account]],
+        )
+        self.assertEqual(ranked, [(12, 2.0, 2), (11, 1.0, 1)])
+        self.assertFalse(truncated)
+        self.assertEqual(visited, 3)
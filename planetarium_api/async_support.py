@@ -0,0 +1,48 @@
+"""
+Helpers for the async-native views (planets/async_views.py, goodreads/async_views.py).
+
+Those are plain Django coroutine views, not DRF: under ASGI they run on the
+event loop with the async ORM and cache, without the sync_to_async thread hop
+every DRF view takes.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, safe=False, encoder=DjangoJSONEncoder)
+
+
+def authenticate(request):
+    """
+    The user DRF would see: DEFAULT_AUTHENTICATION_CLASSES run in order, so
+    session, basic and JWT bearer clients all get in. Sync, they may query.
+    """
+    authenticators = [authenticator() for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    return Request(request, authenticators=authenticators).user
+
+
+def optional_auth(view):
+    """
+    OptionalAuthMixin for coroutine views: with API_AUTH_REQUIRED, requests no
+    DRF authenticator accepts get the 403 DRF sends.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if getattr(settings, 'API_AUTH_REQUIRED', False):
+            try:
+                user = await sync_to_async(authenticate)(request)
+            except AuthenticationFailed as exc:
+                return json_response({'detail': exc.detail}, status=403)
+            if not user.is_authenticated:
+                return json_response({'detail': 'Authentication credentials were not provided.'}, status=403)
+            request.user = user
+        return await view(request, *args, **kwargs)
+    return wrapper
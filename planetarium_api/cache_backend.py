@@ -0,0 +1,389 @@
+"""
+Two-tier cache backend: a small in-process LRU (L1) in front of a shared
+backend (L2, another CACHES alias: file based or Redis), so every worker
+shares one cache while hot keys are served without I/O.
+
+Coherence: a write that may leave a stale copy in another process's L1 (set
+over an existing key, delete of one, incr, clear) bumps a generation counter
+stored in L2. Writing a new key does not (set goes through L2's add first),
+nor does add. A process that sees the counter move by more than its own writes
+starts a new L1 epoch, and L1 only serves entries of the current epoch; a
+process keeps its own L1 across its own writes, updating the keys it wrote.
+The shared generation is read at most every GENERATION_CHECK_INTERVAL seconds
+(0: before every read), so other processes' writes show within that interval.
+L1_TIMEOUT bounds how long an entry is served from L1, also when a backend
+without an atomic incr loses a concurrent bump, or L2 expired or culled a key.
+
+Keys starting with one of L2_ONLY_PREFIXES or ending in one of
+L2_ONLY_SUFFIXES skip L1 and never bump: counters every process must see the
+moment they move (the planet versions and list generations of
+planets/cache.py; the payload keys embed them, so the payloads can live in
+L1), and short lived coordination keys read by polling (the `:lock` locks).
+
+add() is atomic across processes when L2's is: Redis and FileCache below
+(FileBasedCache checks then writes). This backend also serializes add and incr
+within the process.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'planetarium_api.cache_backend.TwoTierCache',
+            'OPTIONS': {
+                'SHARED': 'shared', 'L1_MAX_ENTRIES': 500, 'L1_TIMEOUT': 5,
+                'L2_ONLY_PREFIXES': ['planet_version_'], 'L2_ONLY_SUFFIXES': [':lock'],
+            },
+        },
+        'shared': {'BACKEND': 'planetarium_api.cache_backend.FileCache', 'LOCATION': ...},
+    }
+"""
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+
+GENERATION_KEY = 'two_tier_cache_generation'
+_missing = object()
+
+
+def _write_stored_zlib(file, data):
+    """
+    Write `data` to `file` as a zlib stream of stored (uncompressed) deflate blocks.
+    """
+    view = memoryview(data)
+    file.write(b'\x78\x01')
+    start = 0
+    while True:
+        chunk = view[start:start + 0xFFFF]
+        start += len(chunk)
+        file.write(struct.pack('<BHH', start == len(data), len(chunk), len(chunk) ^ 0xFFFF))
+        file.write(chunk)
+        if start == len(data):
+            break
+    file.write(struct.pack('>I', zlib.adler32(data)))
+
+
+def _load(data):
+    # zlib's default output buffer is 16 KiB, the values are mostly far smaller
+    return pickle.loads(zlib.decompress(data, bufsize=max(len(data), 64)))
+
+
+class FileCache(FileBasedCache):
+    """
+    FileBasedCache cut down for small values and frequent writes:
+    * existing files are written in place under an exclusive lock, readers
+      take a shared one. Writing a temporary file and renaming it over the
+      key's, as FileBasedCache does, makes ext4 flush it: about 0.5 ms per
+      set or incr, against tens of microseconds
+    * add() is atomic across processes: a new file is linked into place,
+      which fails if the key has one, and an expired file is taken over
+      under its lock
+    * incr() keeps the expiry and is atomic across processes
+    * no compression: a zlib compressor costs about 270 KiB of buffers per
+      write, for values of a few KiB. Values are written as stored zlib
+      streams, so the files stay readable by FileBasedCache
+    * a write culls only when the directory holds MAX_ENTRIES files, counted
+      without listing their paths as FileBasedCache does on every write
+    """
+    def get(self, key, default=None, version=None):
+        try:
+            with open(self._key_to_file(key, version), 'rb', buffering=0) as f:
+                locks.lock(f, locks.LOCK_SH)
+                if not self._is_expired(f):
+                    return _load(f.read())
+        except FileNotFoundError:
+            pass
+        return default
+
+    def has_key(self, key, version=None):
+        try:
+            with open(self._key_to_file(key, version), 'rb', buffering=0) as f:
+                locks.lock(f, locks.LOCK_SH)
+                return not self._is_expired(f)
+        except FileNotFoundError:
+            return False
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        try:
+            with open(self._key_to_file(key, version), 'r+b') as f:
+                locks.lock(f, locks.LOCK_EX)
+                self._write_content(f, timeout, value)
+                f.truncate()
+        except FileNotFoundError:
+            super().set(key, value, timeout, version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        fname = self._key_to_file(key, version)
+        self._createdir()
+        self._cull()
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, 'wb') as f:
+                self._write_content(f, timeout, value)
+            while True:
+                try:
+                    # a link never replaces a file: the first process to link the key wins
+                    os.link(tmp_path, fname)
+                    return True
+                except FileExistsError:
+                    pass
+                try:
+                    with open(fname, 'r+b') as f:
+                        locks.lock(f, locks.LOCK_EX)
+                        expiry = pickle.load(f)
+                        if expiry is None or expiry >= time.time():
+                            return False
+                        f.seek(0)
+                        self._write_content(f, timeout, value)
+                        f.truncate()
+                        return True
+                except FileNotFoundError:
+                    # deleted in between, link again
+                    pass
+        finally:
+            os.remove(tmp_path)
+
+    def incr(self, key, delta=1, version=None):
+        try:
+            with open(self._key_to_file(key, version), 'r+b', buffering=0) as f:
+                locks.lock(f, locks.LOCK_EX)
+                expiry = pickle.load(f)
+                if expiry is None or expiry >= time.time():
+                    start = f.tell()
+                    value = _load(f.read()) + delta
+                    f.seek(start)
+                    _write_stored_zlib(f, pickle.dumps(value, self.pickle_protocol))
+                    f.truncate()
+                    return value
+        except FileNotFoundError:
+            pass
+        raise ValueError(f"Key '{key}' not found")
+
+    def _write_content(self, file, timeout, value):
+        expiry = self.get_backend_timeout(timeout)
+        file.write(pickle.dumps(expiry, self.pickle_protocol))
+        _write_stored_zlib(file, pickle.dumps(value, self.pickle_protocol))
+
+    def _cull(self):
+        try:
+            if len(os.listdir(self._dir)) < self._max_entries:
+                return
+        except FileNotFoundError:
+            return
+        super()._cull()
+
+
+class _ProcessTier:
+    """
+    L1 of one cache in this process, shared by its per-thread backend
+    instances (like LocMemCache's module level dicts).
+    """
+    def __init__(self):
+        self.entries = OrderedDict()  # L2 key -> (pickled value, expires at, epoch)
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()  # L2 add/incr, see above
+        self.generation = None  # last generation seen in L2
+        self.epoch = 0  # entries of earlier epochs are stale
+        self.checked_at = 0.0
+
+
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+class TwoTierCache(BaseCache):
+    def __init__(self, location, params):
+        options = dict(params.get('OPTIONS', {}))
+        self.shared_alias = options.pop('SHARED', 'shared')
+        self.l1_max_entries = int(options.pop('L1_MAX_ENTRIES', 500))
+        self.l1_timeout = float(options.pop('L1_TIMEOUT', 5))
+        self.check_interval = float(options.pop('GENERATION_CHECK_INTERVAL', 1))
+        self.l2_only_prefixes = tuple(options.pop('L2_ONLY_PREFIXES', ()))
+        self.l2_only_suffixes = tuple(options.pop('L2_ONLY_SUFFIXES', ()))
+        super().__init__({**params, 'OPTIONS': options})
+        with _tiers_lock:
+            self._tier = _tiers.setdefault((location, self.shared_alias), _ProcessTier())
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    # generation
+
+    def _epoch_now(self):
+        """
+        The current L1 epoch, a new one once the shared generation moved under us.
+        """
+        now = time.monotonic()
+        if self._tier.generation is not None and now - self._tier.checked_at < self.check_interval:
+            return self._tier.epoch
+        generation = self.shared.get(GENERATION_KEY)
+        if generation is None:
+            self.shared.add(GENERATION_KEY, 1, timeout=None)
+            generation = self.shared.get(GENERATION_KEY, 1)
+        with self._tier.lock:
+            if generation != self._tier.generation:
+                # another process wrote since: drop what L1 read before
+                self._tier.generation = generation
+                self._tier.epoch += 1
+            self._tier.checked_at = now
+            return self._tier.epoch
+
+    def _bump(self):
+        """
+        Tell the other processes about a write, returns the epoch to stamp it with.
+        """
+        self._epoch_now()
+        with self._tier.write_lock:
+            known = self._tier.generation
+            try:
+                generation = self.shared.incr(GENERATION_KEY)
+            except ValueError:
+                self.shared.add(GENERATION_KEY, 1, timeout=None)
+                generation = self.shared.incr(GENERATION_KEY)
+            with self._tier.lock:
+                if generation != known + 1:
+                    # other processes bumped in between (or L2 was cleared)
+                    self._tier.epoch += 1
+                self._tier.generation = generation
+                self._tier.checked_at = time.monotonic()
+                return self._tier.epoch
+
+    # L1
+
+    def _l1_key(self, key, version):
+        return self.shared.make_and_validate_key(key, version=version)
+
+    def _l1_get(self, l1_key):
+        with self._tier.lock:
+            entry = self._tier.entries.get(l1_key)
+            if entry is None:
+                return _missing
+            pickled, expires_at, epoch = entry
+            if expires_at <= time.monotonic() or epoch != self._tier.epoch:
+                del self._tier.entries[l1_key]
+                return _missing
+            self._tier.entries.move_to_end(l1_key)
+        return pickle.loads(pickled)
+
+    def _l1_set(self, l1_key, value, epoch, timeout=None):
+        lifetime = self.l1_timeout if timeout is None else min(self.l1_timeout, timeout)
+        if lifetime <= 0 or self.l1_max_entries <= 0:
+            self._l1_delete(l1_key)
+            return
+        # pickled like LocMemCache: callers may mutate what they get
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._tier.lock:
+            self._tier.entries[l1_key] = (pickled, time.monotonic() + lifetime, epoch)
+            self._tier.entries.move_to_end(l1_key)
+            while len(self._tier.entries) > self.l1_max_entries:
+                self._tier.entries.popitem(last=False)
+
+    def _l1_delete(self, l1_key):
+        with self._tier.lock:
+            self._tier.entries.pop(l1_key, None)
+
+    def _timeout(self, timeout):
+        # seconds or None, passed on to L2 as is
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def _l2_only(self, key):
+        return key.startswith(self.l2_only_prefixes) or key.endswith(self.l2_only_suffixes)
+
+    # cache API
+
+    def get(self, key, default=None, version=None):
+        if self._l2_only(key):
+            return self.shared.get(key, default, version=version)
+        epoch = self._epoch_now()
+        l1_key = self._l1_key(key, version)
+        value = self._l1_get(l1_key)
+        if value is not _missing:
+            return value
+        value = self.shared.get(key, _missing, version=version)
+        if value is _missing:
+            return default
+        self._l1_set(l1_key, value, epoch)
+        return value
+
+    def has_key(self, key, version=None):
+        return self.get(key, _missing, version=version) is not _missing
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._timeout(timeout)
+        if self._l2_only(key):
+            self.shared.set(key, value, timeout=timeout, version=version)
+            return
+        if self.shared.add(key, value, timeout=timeout, version=version):
+            # a new key, no other L1 holds it
+            epoch = self._epoch_now()
+        else:
+            self.shared.set(key, value, timeout=timeout, version=version)
+            epoch = self._bump()
+        self._l1_set(self._l1_key(key, version), value, epoch, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # decided by L2, the only tier every process sees
+        timeout = self._timeout(timeout)
+        with self._tier.write_lock:
+            added = self.shared.add(key, value, timeout=timeout, version=version)
+        if added and not self._l2_only(key):
+            self._l1_set(self._l1_key(key, version), value, self._epoch_now(), timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._timeout(timeout)
+        if timeout is not None and timeout <= 0 and not self._l2_only(key):
+            self._l1_delete(self._l1_key(key, version))
+        return self.shared.touch(key, timeout=timeout, version=version)
+
+    def delete(self, key, version=None):
+        deleted = self.shared.delete(key, version=version)
+        if self._l2_only(key):
+            return deleted
+        self._l1_delete(self._l1_key(key, version))
+        if deleted:
+            self._bump()
+        return deleted
+
+    def incr(self, key, delta=1, version=None):
+        with self._tier.write_lock:
+            value = self.shared.incr(key, delta, version=version)
+        if not self._l2_only(key):
+            # the remaining L2 timeout is unknown, L1 keeps it for L1_TIMEOUT at most
+            self._l1_set(self._l1_key(key, version), value, self._bump())
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        for key in keys:
+            value = self.get(key, _missing, version=version)
+            if value is not _missing:
+                found[key] = value
+        return found
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        for key, value in data.items():
+            self.set(key, value, timeout=timeout, version=version)
+        return []
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self.delete(key, version=version)
+
+    def clear(self):
+        self.shared.clear()
+        with self._tier.lock:
+            self._tier.entries.clear()
+        # the generation went with L2, start from a new one
+        self._bump()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
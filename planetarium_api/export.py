@@ -0,0 +1,129 @@
+"""
+Streaming NDJSON / CSV exports.
+
+An export walks its queryset with `.iterator(chunk_size=EXPORT_CHUNK_SIZE)`,
+turns each chunk of rows into dicts (one bulk query per chunk for related
+names, see PlanetReadSerializer.serialize_rows) and writes them out as they
+are produced through a `StreamingHttpResponse`: memory stays at one chunk
+whatever the size of the table, and the first rows leave before the last are read.
+Under ASGI the response gets an async iterator stepping the chunks in the
+request's sync thread; Django would read a sync iterator whole before sending.
+
+The format is negotiated by DRF: `?format=ndjson` / `?format=csv` or the
+Accept header (`application/x-ndjson`, `text/csv`), NDJSON by default.
+"""
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+
+from . import replicas
+
+# list values (terrains, climates) in a CSV cell
+CSV_LIST_SEPARATOR = '|'
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # exports stream past the renderer, only error bodies get here
+        return json.dumps(data, cls=DjangoJSONEncoder).encode() + b'\n'
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # error bodies only: one header line, one row
+        data = data if isinstance(data, dict) else {'detail': data}
+        return ''.join(csv_lines([[data]], list(data))).encode()
+
+
+RENDERERS = (NDJSONRenderer, CSVRenderer)
+
+
+class Echo:
+    """
+    File-like object handing back what csv.writer writes to it.
+    """
+    def write(self, value):
+        return value
+
+
+def chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 500)
+
+
+def chunks(queryset, size=None):
+    """
+    Lists of at most `size` rows of `queryset`, read with a chunked cursor.
+    """
+    size = size or chunk_size()
+    rows = queryset.iterator(chunk_size=size)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def csv_value(value):
+    if isinstance(value, (list, tuple)):
+        return CSV_LIST_SEPARATOR.join(str(item) for item in value)
+    return value
+
+
+def csv_lines(batches, fields):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for batch in batches:
+        yield ''.join(writer.writerow([csv_value(row[field]) for field in fields]) for row in batch)
+
+
+def ndjson_lines(batches):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for batch in batches:
+        yield ''.join(encoder.encode(row) + '\n' for row in batch)
+
+
+async def aiterate(iterable):
+    """
+    `iterable` as an async iterator, each step run in the request's sync thread
+    (the one holding its database connection).
+    """
+    iterator = iter(iterable)
+    step = sync_to_async(next)
+    while True:
+        item = await step(iterator, StopIteration)
+        if item is StopIteration:
+            return
+        yield item
+
+
+def export_response(request, batches, fields, export_format, filename):
+    """
+    StreamingHttpResponse writing `batches` (an iterable of lists of dicts) one
+    chunk at a time, as CSV with `fields` as columns or as NDJSON.
+    """
+    if export_format == CSVRenderer.format:
+        renderer, content = CSVRenderer, csv_lines(batches, fields)
+    else:
+        renderer, content = NDJSONRenderer, ndjson_lines(batches)
+    # the body is read after the view returned, keep reading from the request's replica
+    content = replicas.stream_from(replicas.read_alias(), content)
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        content = aiterate(content)
+    response = StreamingHttpResponse(content, content_type=f'{renderer.media_type}; charset={renderer.charset}')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{renderer.format}"'
+    return response
@@ -0,0 +1,71 @@
+"""
+Per-request metrics shared by RequestTimingMiddleware and the code it measures.
+
+Instrumented code calls `timed('serialize')` or `count('cache_hit')`; both do
+nothing unless the middleware started a recording for the current request.
+The recording lives in a context variable, so concurrent requests (threads or
+async tasks) never see each other's numbers.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Durations (seconds) and counters collected while serving one request.
+    """
+    # SQL kept for the slow request log, the count and time are always exact
+    MAX_STATEMENTS = 100
+
+    def __init__(self):
+        self.durations = {}
+        self.counts = {}
+        self.queries = 0
+        self.query_time = 0.0
+        self.statements = []
+
+    def add_time(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def incr(self, name, amount=1):
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def record_query(self, sql, seconds):
+        self.queries += 1
+        self.query_time += seconds
+        if len(self.statements) < self.MAX_STATEMENTS:
+            self.statements.append((sql, seconds))
+
+
+def start(metrics):
+    return _current.set(metrics)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def timed(name):
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_time(name, time.perf_counter() - started)
+
+
+def count(name, amount=1):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.incr(name, amount)
@@ -0,0 +1,246 @@
+"""
+Prometheus style request metrics, served as text by `/metrics`.
+
+Every thread records into its own shard (plain dicts that no other thread
+writes), so the request path takes no lock; the exporter sums the shards.
+With METRICS_MULTIPROC_DIR set each process (e.g. gunicorn worker) also
+writes its totals to `<dir>/metrics_<pid>.json` every METRICS_FLUSH_INTERVAL
+seconds and at exit (temp file + rename, readers never see half a file),
+and `/metrics` adds up the files of all processes.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Shard:
+    """
+    Counters written by a single thread.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.requests = {}  # (route, method, status) -> count
+        self.latency = {}   # (route, method) -> [bucket counts..., +Inf count, sum]
+        self.queries = {}   # route -> [queries, seconds]
+        self.cache = {}     # 'hit' / 'miss' -> count
+
+    def observe(self, route, method, status, seconds, bucket, queries, query_seconds, cache_hits, cache_misses):
+        key = (route, method, str(status))
+        self.requests[key] = self.requests.get(key, 0) + 1
+        histogram = self.latency.get((route, method))
+        if histogram is None:
+            histogram = self.latency[(route, method)] = [0] * self.size + [0.0]
+        histogram[bucket] += 1
+        histogram[-1] += seconds
+        db = self.queries.get(route)
+        if db is None:
+            db = self.queries[route] = [0, 0.0]
+        db[0] += queries
+        db[1] += query_seconds
+        if cache_hits:
+            self.cache['hit'] = self.cache.get('hit', 0) + cache_hits
+        if cache_misses:
+            self.cache['miss'] = self.cache.get('miss', 0) + cache_misses
+
+
+class Registry:
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or getattr(settings, 'METRICS_LATENCY_BUCKETS', DEFAULT_BUCKETS))
+        self._local = threading.local()
+        self._shards = []
+        # only taken when a thread records its first request
+        self._shards_lock = threading.Lock()
+
+    def shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = Shard(len(self.buckets) + 1)
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def observe(self, route, method, status, seconds, queries=0, query_seconds=0.0, cache_hits=0, cache_misses=0):
+        bucket = bisect_left(self.buckets, seconds)
+        self.shard().observe(route, method, status, seconds, bucket, queries, query_seconds, cache_hits, cache_misses)
+
+    def reset(self):
+        with self._shards_lock:
+            for shard in self._shards:
+                shard.__init__(shard.size)
+
+    def snapshot(self):
+        """
+        JSON friendly totals of every thread of this process.
+        """
+        requests, latency, queries, cache = {}, {}, {}, {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            # list() copies in one step, safe while the owner thread keeps writing
+            for key, count in list(shard.requests.items()):
+                requests[key] = requests.get(key, 0) + count
+            for key, histogram in list(shard.latency.items()):
+                merge(latency.setdefault(key, [0] * (shard.size + 1)), histogram)
+            for key, db in list(shard.queries.items()):
+                merge(queries.setdefault(key, [0, 0.0]), db)
+            for key, count in list(shard.cache.items()):
+                cache[key] = cache.get(key, 0) + count
+        return {
+            'buckets': list(self.buckets),
+            'requests': [[*key, count] for key, count in requests.items()],
+            'latency': [[*key, histogram] for key, histogram in latency.items()],
+            'queries': [[key, *db] for key, db in queries.items()],
+            'cache': cache,
+        }
+
+
+def merge(into, values):
+    for index, value in enumerate(values):
+        into[index] += value
+
+
+registry = Registry()
+
+# multiprocess
+
+_next_flush = 0.0
+_flush_lock = threading.Lock()
+
+
+def multiproc_dir():
+    directory = getattr(settings, 'METRICS_MULTIPROC_DIR', None)
+    return Path(directory) if directory else None
+
+
+def write_snapshot(directory, snapshot, pid=None):
+    directory.mkdir(parents=True, exist_ok=True)
+    descriptor, temp = tempfile.mkstemp(dir=directory, prefix='.metrics_', suffix='.tmp')
+    with os.fdopen(descriptor, 'w') as handle:
+        json.dump(snapshot, handle)
+    os.replace(temp, directory / f'metrics_{pid or os.getpid()}.json')
+
+
+def flush(force=False):
+    """
+    Write this process' snapshot for the other workers, at most once per interval.
+    """
+    global _next_flush
+    directory = multiproc_dir()
+    if directory is None or (not force and time.monotonic() < _next_flush):
+        return
+    # a flush already running in another thread is good enough
+    if not _flush_lock.acquire(blocking=False):
+        return
+    try:
+        _next_flush = time.monotonic() + getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+        write_snapshot(directory, registry.snapshot())
+    finally:
+        _flush_lock.release()
+
+
+atexit.register(flush, force=True)
+
+
+def collect():
+    """
+    Snapshots of this process and, in multiprocess mode, of every other one.
+    """
+    snapshots = [registry.snapshot()]
+    directory = multiproc_dir()
+    if directory is not None and directory.is_dir():
+        own = f'metrics_{os.getpid()}.json'
+        for path in sorted(directory.glob('metrics_*.json')):
+            if path.name == own:
+                continue
+            try:
+                snapshots.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                # a file removed by a cleanup, skip it
+                continue
+    return snapshots
+
+
+# exposition
+
+def _labels(**labels):
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels.items()
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(snapshots):
+    requests, latency, queries, cache = {}, {}, {}, {}
+    buckets = snapshots[0]['buckets']
+    for snapshot in snapshots:
+        if snapshot['buckets'] != buckets:
+            continue
+        for route, method, status, count in snapshot['requests']:
+            requests[(route, method, status)] = requests.get((route, method, status), 0) + count
+        for route, method, histogram in snapshot['latency']:
+            merge(latency.setdefault((route, method), [0] * len(histogram)), histogram)
+        for route, count, seconds in snapshot['queries']:
+            merge(queries.setdefault(route, [0, 0.0]), [count, seconds])
+        for result, count in snapshot['cache'].items():
+            cache[result] = cache.get(result, 0) + count
+
+    lines = [
+        '# HELP planetarium_http_requests_total Requests served, by route, method and status.',
+        '# TYPE planetarium_http_requests_total counter',
+    ]
+    for (route, method, status), count in sorted(requests.items()):
+        lines.append(f'planetarium_http_requests_total{_labels(route=route, method=method, status=status)} {count}')
+
+    lines += [
+        '# HELP planetarium_http_request_duration_seconds Request latency, by route and method.',
+        '# TYPE planetarium_http_request_duration_seconds histogram',
+    ]
+    for (route, method), histogram in sorted(latency.items()):
+        cumulative = 0
+        for bound, count in zip([*buckets, '+Inf'], histogram[:-1]):
+            cumulative += count
+            labels = _labels(route=route, method=method, le=bound if bound == '+Inf' else _number(float(bound)))
+            lines.append(f'planetarium_http_request_duration_seconds_bucket{labels} {cumulative}')
+        labels = _labels(route=route, method=method)
+        lines.append(f'planetarium_http_request_duration_seconds_sum{labels} {_number(histogram[-1])}')
+        lines.append(f'planetarium_http_request_duration_seconds_count{labels} {cumulative}')
+
+    lines += [
+        '# HELP planetarium_db_queries_total Database queries run while serving requests, by route.',
+        '# TYPE planetarium_db_queries_total counter',
+    ]
+    lines += [f'planetarium_db_queries_total{_labels(route=route)} {db[0]}' for route, db in sorted(queries.items())]
+    lines += [
+        '# HELP planetarium_db_query_seconds_total Time spent in database queries, by route.',
+        '# TYPE planetarium_db_query_seconds_total counter',
+    ]
+    lines += [f'planetarium_db_query_seconds_total{_labels(route=route)} {_number(db[1])}' for route, db in sorted(queries.items())]
+
+    hits, misses = cache.get('hit', 0), cache.get('miss', 0)
+    lines += [
+        '# HELP planetarium_cache_requests_total Planet cache lookups, by result.',
+        '# TYPE planetarium_cache_requests_total counter',
+        f'planetarium_cache_requests_total{_labels(result="hit")} {hits}',
+        f'planetarium_cache_requests_total{_labels(result="miss")} {misses}',
+        '# HELP planetarium_cache_hit_ratio Share of planet cache lookups served from the cache.',
+        '# TYPE planetarium_cache_hit_ratio gauge',
+        f'planetarium_cache_hit_ratio {_number(hits / (hits + misses) if hits + misses else 0.0)}',
+        '# HELP planetarium_metrics_processes Processes whose metrics are included.',
+        '# TYPE planetarium_metrics_processes gauge',
+        f'planetarium_metrics_processes {len(snapshots)}',
+    ]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,145 @@
+import json
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import request_started
+from django.db import connections
+
+from . import instrumentation, metrics
+
+logger = logging.getLogger('planetarium_api.requests')
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper timing every query into the metrics of the request in
+    context: contextvars follow sync_to_async, so the queries of async views,
+    run in another thread, land in their request too.
+    """
+    recorded = instrumentation.current()
+    if recorded is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorded.record_query(sql, time.perf_counter() - started)
+
+
+def install_query_recorder(**kwargs):
+    """
+    Add `record_query` to this thread's connections, once per connection.
+
+    Connected to `request_started`, which runs in the thread the request's
+    queries will run in: the WSGI worker thread, or under ASGI the request's
+    thread sensitive sync thread, a new one for every request.
+    """
+    for connection in connections.all():
+        if record_query not in connection.execute_wrappers:
+            connection.execute_wrappers.append(record_query)
+
+
+class RequestTimingMiddleware:
+    """
+    Records DB query count and time, serializer time, cache hits/misses and the
+    total time of every request (see planetarium_api/instrumentation.py).
+
+    The numbers go out as a `Server-Timing` header (REQUEST_SERVER_TIMING) and a
+    JSON log line on the `planetarium_api.requests` logger. Requests slower than
+    REQUEST_SLOW_MS are, for a REQUEST_SLOW_SAMPLE_RATE share of them, logged
+    again as a warning with their SQL.
+
+    With METRICS_ENABLED the same numbers feed the per-route counters and
+    latency histograms served by `/metrics` (planetarium_api/metrics.py).
+
+    With both REQUEST_INSTRUMENTATION and METRICS_ENABLED off the middleware
+    removes itself at startup, so it costs nothing at all. It is sync and async
+    capable: under ASGI the async views are not pushed to a thread by it.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.log_requests = getattr(settings, 'REQUEST_INSTRUMENTATION', False)
+        self.collect_metrics = getattr(settings, 'METRICS_ENABLED', False)
+        if not (self.log_requests or self.collect_metrics):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'REQUEST_SERVER_TIMING', True)
+        self.slow_ms = getattr(settings, 'REQUEST_SLOW_MS', 500)
+        self.sample_rate = getattr(settings, 'REQUEST_SLOW_SAMPLE_RATE', 0.1)
+        request_started.connect(install_query_recorder, dispatch_uid='planetarium_api.install_query_recorder')
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorded = instrumentation.RequestMetrics()
+        token = instrumentation.start(recorded)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            instrumentation.stop(token)
+        return self.report(request, response, recorded, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        recorded = instrumentation.RequestMetrics()
+        token = instrumentation.start(recorded)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            instrumentation.stop(token)
+        return self.report(request, response, recorded, time.perf_counter() - started)
+
+    def report(self, request, response, recorded, total):
+        if self.collect_metrics:
+            match = request.resolver_match
+            metrics.registry.observe(
+                # unresolved paths share one label, 404 scans must not add series
+                match.view_name if match else 'unmatched', request.method, response.status_code, total,
+                queries=recorded.queries, query_seconds=recorded.query_time,
+                cache_hits=recorded.counts.get('cache_hit', 0), cache_misses=recorded.counts.get('cache_miss', 0),
+            )
+            metrics.flush()
+        if not self.log_requests:
+            return response
+
+        if self.server_timing:
+            response['Server-Timing'] = self.server_timing_header(recorded, total)
+        record = self.summary(request, response, recorded, total)
+        logger.info(json.dumps(record))
+        if record['duration_ms'] >= self.slow_ms and random.random() < self.sample_rate:
+            record['sql'] = [{'sql': sql, 'ms': round(seconds * 1000, 2)} for sql, seconds in recorded.statements]
+            logger.warning(json.dumps(record))
+        return response
+
+    def server_timing_header(self, metrics, total):
+        entries = [f'db;dur={metrics.query_time * 1000:.2f};desc="{metrics.queries} queries"']
+        entries += [f'{name};dur={seconds * 1000:.2f}' for name, seconds in metrics.durations.items()]
+        if metrics.counts:
+            counts = ' '.join(f'{name}={value}' for name, value in sorted(metrics.counts.items()))
+            entries.append(f'count;desc="{counts}"')
+        entries.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(entries)
+
+    def summary(self, request, response, metrics, total):
+        match = request.resolver_match
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'duration_ms': round(total * 1000, 2),
+            'db_queries': metrics.queries,
+            'db_ms': round(metrics.query_time * 1000, 2),
+        }
+        record.update((f'{name}_ms', round(seconds * 1000, 2)) for name, seconds in metrics.durations.items())
+        record.update(metrics.counts)
+        return record
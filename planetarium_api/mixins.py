@@ -1,5 +1,12 @@
+import hashlib
+
 from django.conf import settings
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated, AllowAny
+
+from . import replicas
 
 
 class OptionalAuthMixin:
@@ -13,3 +20,60 @@ class OptionalAuthMixin:
         else:
             permission_classes = [AllowAny]
         return [permission() for permission in permission_classes]
+
+
+class ConditionalGetMixin:
+    """
+    Mixin adding ETag / Last-Modified support to DRF views.
+    Call `conditional_response()` with cheap validators (counts, timestamps, ids)
+    before serializing: it returns the 304/412 response to send as is, or None
+    and the validators are then added to the normal 200 response.
+    """
+    def conditional_response(self, request, *validators, last_modified=None):
+        # the same query can be rendered as JSON or as the browsable API
+        source = repr((request.get_full_path(), getattr(request, 'accepted_media_type', None)) + validators)
+        headers = {'ETag': quote_etag(hashlib.sha256(source.encode()).hexdigest()[:32])}
+        timestamp = None
+        if last_modified is not None:
+            timestamp = int(last_modified.timestamp())
+            headers['Last-Modified'] = http_date(timestamp)
+        self.conditional_headers = headers
+        candidate = HttpResponse(headers=headers)
+        response = get_conditional_response(request, etag=headers['ETag'], last_modified=timestamp, response=candidate)
+        return None if response is candidate else response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if response.status_code == 200:
+            for header, value in getattr(self, 'conditional_headers', {}).items():
+                response.headers.setdefault(header, value)
+        return response
+
+
+class ReplicaReadMixin:
+    """
+    Mixin routing the reads of safe-method requests to a read replica
+    (planetarium_api/replicas.py), unless the client wrote within the
+    read-your-writes window; successful writes start that window.
+    """
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        alias = None
+        if request.method in SAFE_METHODS and not replicas.is_pinned(request):
+            alias = replicas.choose_replica()
+        self.read_alias = alias
+        self._read_alias_token = replicas.route_reads(alias)
+
+    def read_from_primary(self, read):
+        with replicas.use_primary():
+            return read()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_read_alias_token', None)
+        if token is not None:
+            replicas.restore(token)
+            self._read_alias_token = None
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            replicas.pin(request, response)
+        return response
@@ -0,0 +1,168 @@
+"""
+Read replica routing.
+
+Safe-method requests of the views using ReplicaReadMixin (PlanetViewSet,
+GoodreadsViewSet) read from one of DATABASE_READ_REPLICAS; everything else,
+and every write, goes to the primary (`default`).
+
+Read-your-writes: a successful write pins its client to the primary for
+READ_YOUR_WRITES_SECONDS, through a cookie and, for authenticated users, a
+cache key, so the client does not read its own write back from a replica
+that has not caught up yet.
+
+Replica health is checked with a query on django_migrations, at most once
+every REPLICA_HEALTH_CHECK_INTERVAL seconds per replica and process; requests
+fall back to the primary when no replica is healthy.
+"""
+import contextvars
+import itertools
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+PRIMARY = 'default'
+PIN_COOKIE = 'db_primary_until'
+
+# alias reads are routed to, None for the primary
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+_health = {}  # alias -> (healthy, checked at)
+_turns = itertools.count()
+
+
+def replica_aliases():
+    return list(getattr(settings, 'DATABASE_READ_REPLICAS', ()))
+
+
+def pin_seconds():
+    return getattr(settings, 'READ_YOUR_WRITES_SECONDS', 5)
+
+
+class ReplicaRouter:
+    """
+    Routes reads to the replica chosen for the current request, writes to the primary.
+    """
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the primary's rows
+        databases = {PRIMARY, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas are copies of the primary, never migrated on their own
+        if db in replica_aliases():
+            return False
+        return None
+
+
+def is_healthy(alias):
+    interval = getattr(settings, 'REPLICA_HEALTH_CHECK_INTERVAL', 5)
+    healthy, checked_at = _health.get(alias, (None, 0.0))
+    if healthy is not None and time.monotonic() - checked_at < interval:
+        return healthy
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1 FROM django_migrations LIMIT 1')
+        healthy = True
+    except DatabaseError:
+        connections[alias].close()
+        healthy = False
+    _health[alias] = (healthy, time.monotonic())
+    return healthy
+
+
+def reset_health():
+    _health.clear()
+
+
+def choose_replica():
+    """
+    Next healthy replica, round robin, or None (the primary).
+    """
+    aliases = replica_aliases()
+    if not aliases:
+        return None
+    start = next(_turns)
+    for offset in range(len(aliases)):
+        alias = aliases[(start + offset) % len(aliases)]
+        if is_healthy(alias):
+            return alias
+    return None
+
+
+def pin_key(user):
+    return f'db_primary_pin_{user.pk}'
+
+
+def is_pinned(request):
+    try:
+        if float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time():
+            return True
+    except ValueError:
+        pass
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_authenticated and cache.get(pin_key(user)))
+
+
+def pin(request, response):
+    """
+    Keep the client of a write on the primary for the read-your-writes window.
+    """
+    seconds = pin_seconds()
+    if seconds <= 0:
+        return
+    response.set_cookie(PIN_COOKIE, f'{time.time() + seconds:.3f}', max_age=seconds, httponly=True, samesite='Lax')
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        cache.set(pin_key(user), 1, timeout=seconds)
+
+
+def read_alias():
+    return _read_alias.get()
+
+
+def route_reads(alias):
+    """
+    Send the reads of the current context to `alias` (None: the primary); returns the token for `restore`.
+    """
+    return _read_alias.set(alias)
+
+
+def restore(token):
+    _read_alias.reset(token)
+
+
+@contextmanager
+def use_primary():
+    token = _read_alias.set(None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def stream_from(alias, iterable):
+    """
+    Iterate `iterable` with reads routed to `alias`, for streamed responses
+    consumed after the view returned. The route is set around each step, a
+    streamed body may be consumed from other contexts (ASGI).
+    """
+    iterator = iter(iterable)
+    while True:
+        token = _read_alias.set(alias)
+        try:
+            item = next(iterator, StopIteration)
+        finally:
+            _read_alias.reset(token)
+        if item is StopIteration:
+            return
+        yield item
@@ -0,0 +1,42 @@
+import shutil
+import tempfile
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from django.utils.module_loading import import_string
+
+from planetarium_api.cache_backend import TwoTierCache
+
+
+@contextmanager
+def isolated_caches():
+    """
+    Point the caches that are not two-tier (the shared tier: the `.cache`
+    directory or Redis) at a temporary directory for the run, so the tests
+    neither read the entries of earlier runs nor empty a cache in use.
+    """
+    directory = tempfile.mkdtemp(prefix='planetarium-test-cache-')
+    try:
+        with override_settings(CACHES={
+            alias: params if issubclass(import_string(params['BACKEND']), TwoTierCache) else {
+                'BACKEND': 'planetarium_api.cache_backend.FileCache',
+                'LOCATION': f'{directory}/{alias}',
+            }
+            for alias, params in settings.CACHES.items()
+        }):
+            yield directory
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._isolated_caches = ExitStack()
+        self._isolated_caches.enter_context(isolated_caches())
+
+    def teardown_test_environment(self, **kwargs):
+        self._isolated_caches.close()
+        super().teardown_test_environment(**kwargs)
@@ -14,10 +14,15 @@ import os
 from dotenv import load_dotenv
 from pathlib import Path
 
+from planetarium_api.sqlite import sqlite_options
+
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Load environment variables from .env file, before any setting reads them
+load_dotenv()
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -59,12 +64,21 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',  # default globally
     ),
+    # DRF's session and basic auth, then bearer tokens from /auth/token/;
+    # session first keeps anonymous requests on a 403, as before
+    'DEFAULT_AUTHENTICATION_CLASSES': (
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+        'rest_framework_simplejwt.authentication.JWTAuthentication',
+    ),
     # documentation
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 
 }
 
 MIDDLEWARE = [
+    # outermost, so its total covers every other middleware; removes itself when disabled
+    'planetarium_api.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -97,13 +111,41 @@ WSGI_APPLICATION = 'planetarium_api.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# the SQLite file: the committed db.sqlite3 (demo data) unless DB_PATH points elsewhere
+DB_PATH = os.getenv("DB_PATH")
+
+# SQLite performance profile (planetarium_api/sqlite.py): `tuned` (WAL, synchronous=NORMAL,
+# busy_timeout, cache/mmap, IMMEDIATE transactions) or `default` (SQLite's own settings).
+# WAL is written into the file itself, so the committed db.sqlite3 keeps `default` unless asked
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "tuned" if DB_PATH else "default").lower()
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': DB_PATH or BASE_DIR / 'db.sqlite3',
+        'OPTIONS': sqlite_options(SQLITE_PROFILE),
+        # persistent connections, checked before reuse; planetarium_api/asgi.py sets 0, connections
+        # are per request thread there
+        'CONN_MAX_AGE': int(os.getenv("DB_CONN_MAX_AGE", 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Read replicas (planetarium_api/replicas.py): comma separated SQLite files kept in sync with
+# db.sqlite3 (e.g. by litestream or sqlite3 .backup), registered as replica_1, replica_2, ...
+# Safe-method requests of the planets and goodreads viewsets read from them, writes go to `default`.
+DATABASE_READ_REPLICAS = []
+for number, path in enumerate(filter(None, os.getenv("DATABASE_REPLICAS", "").split(",")), start=1):
+    alias = f'replica_{number}'
+    DATABASES[alias] = {**DATABASES['default'], 'NAME': path.strip(), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_READ_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['planetarium_api.replicas.ReplicaRouter']
+# seconds a client stays on the primary after a write, so it reads its own writes
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", 5))
+# seconds a replica health check result is reused
+REPLICA_HEALTH_CHECK_INTERVAL = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -148,7 +190,94 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 # for testing purposes: set to False to allow public access
-# Load environment variables from .env file
-load_dotenv()
 DJANGO_ENV = os.getenv("DJANGO_ENV", "development")
-API_AUTH_REQUIRED = DJANGO_ENV.lower() == "production"
\ No newline at end of file
+API_AUTH_REQUIRED = DJANGO_ENV.lower() == "production"
+
+# Caches (planetarium_api/cache_backend.py): a per-process LRU in front of a cache shared by
+# every worker, the `.cache` directory or Redis when CACHE_REDIS_URL is set
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+CACHES = {
+    'default': {
+        'BACKEND': 'planetarium_api.cache_backend.TwoTierCache',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'L1_MAX_ENTRIES': int(os.getenv("CACHE_L1_MAX_ENTRIES", 500)),
+            # seconds a value is served from the process without asking the shared cache
+            'L1_TIMEOUT': 5,
+            # seconds between reads of the shared write generation: how long another worker's
+            # write may go unseen; 0 reads it before every get
+            'GENERATION_CHECK_INTERVAL': 1,
+            # read from the shared cache only: the planet versions and list/facet generations, which
+            # must be current in every worker the moment they are bumped (the cached payloads are
+            # keyed by them), and the planet cache fill locks, polled by waiting requests
+            'L2_ONLY_PREFIXES': ['planet_version_', 'planet_list_generation', 'planet_facets_generation'],
+            'L2_ONLY_SUFFIXES': [':lock'],
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+    } if CACHE_REDIS_URL else {
+        'BACKEND': 'planetarium_api.cache_backend.FileCache',
+        'LOCATION': os.getenv("CACHE_DIR", BASE_DIR / '.cache'),
+    },
+}
+# the shared cache outlives the processes, test runs use a temporary one (planetarium_api/runner.py)
+TEST_RUNNER = 'planetarium_api.runner.TestRunner'
+
+# planet detail read-through cache (planets/cache.py)
+PLANET_CACHE_TIMEOUT = int(os.getenv("PLANET_CACHE_TIMEOUT", 60 * 15))
+# how long a cache fill may hold the per-key lock, and how long others wait for it
+PLANET_CACHE_LOCK_TIMEOUT = 10
+PLANET_CACHE_LOCK_WAIT = 2.0
+# planet list response cache (planets/cache.py): seconds an entry lives, 0 turns it off,
+# and the largest entry stored (pickled bytes)
+PLANET_LIST_CACHE_TIMEOUT = int(os.getenv("PLANET_LIST_CACHE_TIMEOUT", 60))
+PLANET_LIST_CACHE_MAX_BYTES = 256 * 1024
+
+# SWAPI import (planets/services.py, planets/jobs.py)
+SWAPI_GRAPHQL_URL = os.getenv("SWAPI_GRAPHQL_URL", "https://swapi-graphql.netlify.app/graphql")
+SWAPI_TIMEOUT = 30
+# run sync jobs in a worker thread; False runs them inline after commit
+PLANET_SYNC_ASYNC = True
+# an active job older than this is considered abandoned
+PLANET_SYNC_STALE_AFTER = 10 * 60
+# POST /api/v1/planets/bulk/ (planets/bulk.py): items accepted per request
+PLANET_BULK_MAX_ITEMS = 10000
+
+# goodreads network_books?depth=N: friend graph walk limits (goodreads/network.py)
+GOODREADS_NETWORK_MAX_DEPTH = 4
+GOODREADS_NETWORK_MAX_VISITED = 10000
+GOODREADS_NETWORK_TIME_BUDGET_MS = 250
+# goodreads recommendations: an owner n hops away weighs DECAY ** (n - 1)
+GOODREADS_RECOMMENDATION_DECAY = 0.5
+GOODREADS_RECOMMENDATIONS_MAX_LIMIT = 100
+
+# streaming exports (planetarium_api/export.py): rows read, serialized and written per chunk
+EXPORT_CHUNK_SIZE = 500
+
+# per-request timing (planetarium_api/middleware.py): Server-Timing header and
+# JSON log lines on the planetarium_api.requests logger
+REQUEST_INSTRUMENTATION = os.getenv("REQUEST_INSTRUMENTATION", "false").lower() == "true"
+REQUEST_SERVER_TIMING = True
+# share of the requests slower than REQUEST_SLOW_MS logged again with their SQL
+REQUEST_SLOW_MS = 500
+REQUEST_SLOW_SAMPLE_RATE = 0.1
+
+# GET /metrics, Prometheus text format (planetarium_api/metrics.py)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+# with several worker processes (gunicorn), a directory they all share; empty it on deploy
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR") or None
+METRICS_FLUSH_INTERVAL = 5
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'planetarium_api.requests': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
@@ -0,0 +1,48 @@
+"""
+SQLite connection profiles, applied by DATABASES OPTIONS on every new connection
+(settings.SQLITE_PROFILE) and compared by `manage.py stress_sqlite`.
+
+`tuned`:
+* WAL journal: readers no longer wait for a writer, nor the writer for readers
+* synchronous=NORMAL: with WAL, fsync at checkpoints only, still crash safe
+* busy_timeout: a writer waits for the lock instead of failing with "database is locked"
+* a 64 MiB page cache per connection and up to 256 MiB of the file read through mmap
+* IMMEDIATE transactions: the write lock is taken when the transaction begins, so two
+  read-then-write transactions queue on busy_timeout instead of one of them failing
+  on the lock upgrade, which no busy timeout can retry
+
+`default`: SQLite's own rollback journal, synchronous=FULL and deferred transactions.
+
+Kept free of Django imports, settings.py reads it.
+"""
+PROFILES = {
+    'default': {
+        'pragmas': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+        'transaction_mode': 'DEFERRED',
+    },
+    'tuned': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,
+            'cache_size': -64000,
+            'mmap_size': 256 * 1024 * 1024,
+            'temp_store': 'MEMORY',
+        },
+        'transaction_mode': 'IMMEDIATE',
+    },
+}
+
+
+def sqlite_options(profile, **pragmas):
+    """
+    DATABASES OPTIONS for a profile, `pragmas` override or extend its pragmas.
+    """
+    if profile not in PROFILES:
+        raise ValueError(f'Unknown SQLite profile {profile!r}, use one of {", ".join(PROFILES)}')
+    settings = PROFILES[profile]
+    pragmas = {**settings['pragmas'], **pragmas}
+    return {
+        'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in pragmas.items()),
+        'transaction_mode': settings['transaction_mode'],
+    }
@@ -1,5 +1,38 @@
+import asyncio
+import json
+import os
+import pickle
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
 import unittest
-from planets.tests import PlanetAPITestCase
+from unittest import mock
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db import connection, connections
+from django.test import SimpleTestCase, override_settings
+from django.core.asgi import get_asgi_application
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from planets import cache as planet_cache, facets
+from planets.models import Planet
+from goodreads.models import Book, GoodreadsAccount, UserBook
+from django.contrib.auth.models import User
+from planetarium_api import metrics, replicas
+from planetarium_api.cache_backend import GENERATION_KEY, FileCache, TwoTierCache
+from planetarium_api.sqlite import sqlite_options
+from planets.tests import (  # noqa: F401
+    PlanetAPITestCase, PlanetAsyncViewTestCase, PlanetBulkTestCase, PlanetExportTestCase, PlanetFacetTestCase,
+    PlanetListCacheTestCase, PlanetMaskTestCase, PlanetQueryBudgetTestCase, PlanetSearchTestCase,
+)
 from goodreads.tests import GoodreadsAPITestCase
 
 
@@ -10,4 +43,555 @@ def test_run_planet_tests():
 
 def test_run_goodreads_tests():
     suite = unittest.TestLoader().loadTestsFromTestCase(GoodreadsAPITestCase)
-    unittest.TextTestRunner().run(suite)
\ No newline at end of file
+    unittest.TextTestRunner().run(suite)
+
+
+@override_settings(REQUEST_INSTRUMENTATION=True, REQUEST_SERVER_TIMING=True)
+class RequestTimingMiddlewareTestCase(APITestCase):
+    def setUp(self):
+        Planet.objects.create(name='Earth', population=7000000000)
+        # the middleware chain is built on a client's first request
+        self.client = self.client_class()
+
+    def test_server_timing_and_log_line(self):
+        url = '/api/v1/planets/Earth/'
+        with self.assertLogs('planetarium_api.requests', 'INFO') as logs:
+            response = self.client.get(url)
+        header = response['Server-Timing']
+        self.assertIn('db;dur=', header)
+        self.assertIn('serialize;dur=', header)
+        self.assertIn('count;desc="cache_miss=1"', header)
+        self.assertIn('total;dur=', header)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['view'], record['status'], record['cache_miss']), ('planet-detail', 200, 1))
+        self.assertGreater(record['db_queries'], 0)
+
+        with self.assertLogs('planetarium_api.requests', 'INFO'):
+            response = self.client.get(url)
+        self.assertIn('count;desc="cache_hit=1"', response['Server-Timing'])
+        self.assertIn('db;dur=0.00;desc="0 queries"', response['Server-Timing'])
+
+    @override_settings(REQUEST_SLOW_MS=0, REQUEST_SLOW_SAMPLE_RATE=1)
+    def test_slow_requests_log_their_sql(self):
+        with self.assertLogs('planetarium_api.requests', 'WARNING') as logs:
+            self.client_class().get('/api/v1/planets/')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertTrue(any('FROM "planets"' in query['sql'] for query in record['sql']))
+
+    def test_disabled(self):
+        with override_settings(REQUEST_INSTRUMENTATION=False):
+            response = self.client_class().get('/api/v1/planets/Earth/')
+        self.assertNotIn('Server-Timing', response)
+
+    async def test_async_views(self):
+        with self.assertLogs('planetarium_api.requests', 'INFO') as logs:
+            response = await self.async_client_class().get('/api/v1/async/planets/Earth/')
+        self.assertIn('count;desc="cache_miss=1"', response['Server-Timing'])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['view'], record['status']), ('async-planet-detail', 200))
+        self.assertGreater(record['db_queries'], 0)
+
+
+@override_settings(REQUEST_INSTRUMENTATION=True)
+class ASGIRequestTimingTestCase(APITransactionTestCase):
+    """
+    Through the real ASGI handler, which runs the sync work of every request
+    in a thread of its own, unlike the test clients.
+    """
+    names = ['Mercury', 'Venus', 'Earth', 'Mars', 'Jupiter', 'Saturn']
+
+    def setUp(self):
+        Planet.objects.bulk_create(Planet(name=name) for name in self.names)
+
+    async def asgi_get(self, application, path):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+            'headers': [(b'host', b'testserver')], 'server': ('testserver', 80), 'client': ('127.0.0.1', 1),
+        }
+        messages = []
+        requests = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+        async def receive():
+            if requests:
+                return requests.pop()
+            # no disconnect: the handler cancels this wait once it has responded
+            await asyncio.Event().wait()
+
+        async def send(message):
+            messages.append(message)
+
+        await application(scope, receive, send)
+        return messages[0]['status']
+
+    def test_every_request_records_its_queries(self):
+        application = get_asgi_application()
+        # a planet per request, so none of them is served from the detail cache
+        paths = [
+            f'/api/v1/async/planets/{name}/' if i % 2 else f'/api/v1/planets/{name}/' for i, name in enumerate(self.names)
+        ]
+
+        async def serve():
+            return [await self.asgi_get(application, path) for path in paths]
+
+        # asyncio.run, not an async test: under async_to_sync every sync_to_async
+        # call would go back to the test's own thread
+        with self.assertLogs('planetarium_api.requests', 'INFO') as logs:
+            statuses = asyncio.run(serve())
+        self.assertEqual(statuses, [200] * len(paths))
+        records = [json.loads(record.getMessage()) for record in logs.records]
+        self.assertEqual([record['path'] for record in records], paths)
+        for record in records:
+            self.assertGreater(record['db_queries'], 0, record)
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_MULTIPROC_DIR=None)
+class MetricsTestCase(APITestCase):
+    def setUp(self):
+        Planet.objects.create(name='Earth', population=7000000000)
+        metrics.registry.reset()
+        self.client = self.client_class()
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_route_counters_and_histograms(self):
+        self.client.get('/api/v1/planets/')
+        self.client.get('/api/v1/planets/')
+        self.client.get('/api/v1/planets/Earth/')
+        self.client.get('/api/v1/planets/Earth/')
+        self.client.get('/no-such-page/')
+        text = self.scrape()
+        self.assertIn('planetarium_http_requests_total{route="planet-list",method="GET",status="200"} 2', text)
+        self.assertIn('planetarium_http_requests_total{route="unmatched",method="GET",status="404"} 1', text)
+        self.assertIn('planetarium_http_request_duration_seconds_bucket{route="planet-list",method="GET",le="+Inf"} 2', text)
+        self.assertIn('planetarium_http_request_duration_seconds_count{route="planet-detail",method="GET"} 2', text)
+        self.assertRegex(text, r'planetarium_db_queries_total\{route="planet-list"\} [1-9]')
+        self.assertIn('planetarium_cache_requests_total{result="hit"} 1', text)
+        self.assertIn('planetarium_cache_hit_ratio 0.5', text)
+
+    def test_threads_record_into_their_own_shard(self):
+        registry = metrics.Registry(buckets=(0.1, 1.0))
+
+        def work():
+            for _ in range(1000):
+                registry.observe('planet-list', 'GET', 200, 0.05, queries=2)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot['requests'], [['planet-list', 'GET', '200', 4000]])
+        self.assertEqual(snapshot['latency'][0][2][:3], [4000, 0, 0])
+        self.assertEqual(snapshot['queries'], [['planet-list', 8000, 0.0]])
+
+    def test_multiprocess_aggregation(self):
+        other = metrics.Registry()
+        other.observe('planet-list', 'GET', 200, 0.2, queries=3, cache_misses=1)
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_MULTIPROC_DIR=directory):
+            # another worker's snapshot, plus a half written temp file that must be ignored
+            metrics.write_snapshot(Path(directory), other.snapshot(), pid=999999)
+            Path(directory, '.metrics_partial.tmp').write_text('{')
+            self.client.get('/api/v1/planets/')
+            metrics.flush(force=True)
+            self.assertTrue(Path(directory, f'metrics_{os.getpid()}.json').exists())
+            text = self.scrape()
+        self.assertIn('planetarium_http_requests_total{route="planet-list",method="GET",status="200"} 2', text)
+        self.assertIn('planetarium_cache_requests_total{result="miss"} 1', text)
+        self.assertIn('planetarium_metrics_processes 2', text)
+
+    def test_disabled(self):
+        with override_settings(METRICS_ENABLED=False):
+            self.assertEqual(self.client_class().get('/metrics').status_code, 404)
+
+
+class SQLiteProfileTestCase(APITestCase):
+    def test_connection_pragmas(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        tuned = type(connections['default'])(
+            {**connection.settings_dict, 'NAME': os.path.join(directory, 'tuned.sqlite3'), 'OPTIONS': sqlite_options('tuned')},
+            alias='tuned',
+        )
+        try:
+            with tuned.cursor() as cursor:
+                pragmas = {
+                    name: cursor.execute(f'PRAGMA {name}').fetchone()[0]
+                    for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'temp_store')
+                }
+        finally:
+            tuned.close()
+        # synchronous 1 = NORMAL, temp_store 2 = MEMORY
+        self.assertEqual(
+            pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000, 'cache_size': -64000, 'temp_store': 2}
+        )
+        self.assertEqual(tuned.transaction_mode, 'IMMEDIATE')
+
+    def configured(self, code, **variables):
+        """What `code` prints, run against the settings in a fresh interpreter."""
+        unset = ('DB_PATH', 'SQLITE_PROFILE', 'DB_CONN_MAX_AGE', 'DATABASE_REPLICAS', 'READ_YOUR_WRITES_SECONDS')
+        env = {key: value for key, value in os.environ.items() if key not in unset}
+        env.update(DJANGO_SETTINGS_MODULE='planetarium_api.settings', **variables)
+        return subprocess.run(
+            [sys.executable, '-c', code], env=env, cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.split()
+
+    def test_committed_database_keeps_the_default_profile(self):
+        code = 'from django.conf import settings; print(settings.SQLITE_PROFILE)'
+        self.assertEqual(self.configured(code), ['default'])
+        self.assertEqual(self.configured(code, DB_PATH='/data/planetarium.sqlite3'), ['tuned'])
+
+    def test_dotenv_configures_the_database(self):
+        # stands for a .env file setting DB_PATH
+        code = (
+            'import os, dotenv; dotenv.load_dotenv = lambda: os.environ.update(DB_PATH="/data/planetarium.sqlite3"); '
+            'from django.conf import settings; print(settings.DATABASES["default"]["NAME"], settings.SQLITE_PROFILE)'
+        )
+        self.assertEqual(self.configured(code), ['/data/planetarium.sqlite3', 'tuned'])
+
+    def test_dotenv_configures_the_replicas(self):
+        code = (
+            'import os, dotenv; dotenv.load_dotenv = lambda: os.environ.update('
+            'DATABASE_REPLICAS="/data/replica.sqlite3", READ_YOUR_WRITES_SECONDS="9"); '
+            'from django.conf import settings; '
+            'print(*settings.DATABASE_READ_REPLICAS, settings.DATABASES["replica_1"]["NAME"], settings.READ_YOUR_WRITES_SECONDS)'
+        )
+        self.assertEqual(self.configured(code), ['replica_1', '/data/replica.sqlite3', '9'])
+
+    def test_asgi_closes_connections_after_each_request(self):
+        code = 'from django.conf import settings; print(settings.DATABASES["default"]["CONN_MAX_AGE"])'
+        self.assertEqual(self.configured(code), ['60'])
+        self.assertEqual(self.configured('import planetarium_api.asgi; ' + code), ['0'])
+
+
+class SQLiteOptionsTestCase(SimpleTestCase):
+    def test_options(self):
+        options = sqlite_options('tuned', busy_timeout=100)
+        self.assertIn('PRAGMA journal_mode=WAL', options['init_command'].split(';'))
+        self.assertIn('PRAGMA busy_timeout=100', options['init_command'].split(';'))
+        self.assertEqual(sqlite_options('default')['transaction_mode'], 'DEFERRED')
+        with self.assertRaises(ValueError):
+            sqlite_options('fast')
+
+
+REPLICA_ALIASES = ['replica_1', 'replica_2']
+
+
+@override_settings(DATABASE_READ_REPLICAS=REPLICA_ALIASES, READ_YOUR_WRITES_SECONDS=5, PLANET_LIST_CACHE_TIMEOUT=0)
+class ReplicaRoutingTestCase(APITestCase):
+    """
+    Two SQLite files, copies of the test database, serve as replicas; each test
+    seeds rows in one database only to see where the reads went.
+    """
+    @classmethod
+    def setUpClass(cls):
+        # the schema is copied before the class transaction begins, each test starts from fresh copies
+        cls.replica_dir = tempfile.mkdtemp()
+        cls.template = os.path.join(cls.replica_dir, 'template.sqlite3')
+        connection.ensure_connection()
+        target = sqlite3.connect(cls.template)
+        connection.connection.backup(target)
+        target.close()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.replica_dir)
+        super().tearDownClass()
+
+    def add_replica(self, alias, path):
+        # a connection outside DATABASES, left out of the test transactions
+        primary = connections['default']
+        replica = connections[alias] = primary.__class__({**primary.settings_dict, 'NAME': path}, alias)
+        self.addCleanup(connections.__delitem__, alias)
+        self.addCleanup(replica.close)
+
+    def setUp(self):
+        replicas.reset_health()
+        for alias in REPLICA_ALIASES:
+            path = os.path.join(self.replica_dir, f'{alias}.sqlite3')
+            shutil.copy(self.template, path)
+            self.add_replica(alias, path)
+            Planet.objects.using(alias).create(name=f'Replicated {alias}', population=1)
+        self.client = self.client_class()
+
+    def listed_names(self, response):
+        self.assertEqual(response.status_code, 200)
+        return {planet['name'] for planet in response.json()['results']}
+
+    def test_reads_go_to_replicas_round_robin(self):
+        Planet.objects.create(name='Primary', population=1)
+        seen = set()
+        for _ in REPLICA_ALIASES:
+            names = self.listed_names(self.client.get('/api/v1/planets/'))
+            self.assertEqual(len(names), 1)
+            seen |= names
+        self.assertEqual(seen, {f'Replicated {alias}' for alias in REPLICA_ALIASES})
+        # the detail cache is filled from the primary
+        self.assertEqual(self.client.get('/api/v1/planets/Primary/').status_code, 200)
+
+    def test_read_your_writes(self):
+        planet = {'name': 'Written', 'population': 3, 'terrains': [], 'climates': []}
+        response = self.client.post('/api/v1/planets/', planet, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+        self.assertEqual(self.listed_names(self.client.get('/api/v1/planets/')), {'Written'})
+        self.assertEqual(self.client.get('/api/v1/planets/Written/').status_code, 200)
+        # another client reads from a replica
+        self.assertNotIn('Written', self.listed_names(self.client_class().get('/api/v1/planets/')))
+
+    def test_list_cache_fills_from_primary(self):
+        Planet.objects.create(name='Primary', population=1)
+        with override_settings(PLANET_LIST_CACHE_TIMEOUT=60):
+            response = self.client.get('/api/v1/planets/?page_size=7')
+            self.assertEqual(response['X-Cache'], 'MISS')
+            self.assertEqual(self.listed_names(response), {'Primary'})
+            response = self.client_class().get('/api/v1/planets/?page_size=7')
+            self.assertEqual((response['X-Cache'], self.listed_names(response)), ('HIT', {'Primary'}))
+
+    def test_unhealthy_replica_falls_back(self):
+        Planet.objects.create(name='Primary', population=1)
+        self.add_replica('replica_3', os.path.join(self.replica_dir, 'missing', 'db.sqlite3'))
+        with override_settings(DATABASE_READ_REPLICAS=['replica_3']):
+            self.assertEqual(self.listed_names(self.client.get('/api/v1/planets/')), {'Primary'})
+            self.assertFalse(replicas.is_healthy('replica_3'))
+
+    def test_exports_and_goodreads_read_from_replicas(self):
+        response = self.client.get('/api/v1/planets/export/?format=ndjson')
+        names = {json.loads(line)['name'] for line in b''.join(response.streaming_content).splitlines()}
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names < {f'Replicated {alias}' for alias in REPLICA_ALIASES})
+
+        user = User.objects.create(username='primary_reader')
+        GoodreadsAccount.objects.create(user=user)
+        for alias in REPLICA_ALIASES:
+            book = Book.objects.using(alias).create(name='Dune', author='Frank Herbert')
+            replica_user = User.objects.using(alias).create(username='replica_reader')
+            account = GoodreadsAccount.objects.using(alias).create(user=replica_user)
+            UserBook.objects.using(alias).create(goodreads_account=account, book=book)
+        self.assertEqual(self.client.get('/api/v1/goodreads/primary_reader/').status_code, 404)
+        response = self.client.get('/api/v1/goodreads/replica_reader/network_books/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([book['name'] for book in response.json()['user_books']], ['Dune'])
+
+
+class TwoTierCacheTestCase(SimpleTestCase):
+    """
+    Two TwoTierCache instances on one file based L2, with their own L1
+    (LOCATION), stand for two worker processes. They read the shared
+    generation before every get unless a test says otherwise.
+    """
+    def setUp(self):
+        self.directory = directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        shared = {'BACKEND': 'planetarium_api.cache_backend.FileCache', 'LOCATION': directory}
+        override = override_settings(CACHES={**settings.CACHES, 'two_tier_shared': shared})
+        override.enable()
+        self.addCleanup(override.disable)
+        self.shared = caches['two_tier_shared']
+        self.first, self.second = self.worker(f'{directory}/first'), self.worker(f'{directory}/second')
+
+    def worker(self, location, **options):
+        options = {'SHARED': 'two_tier_shared', 'GENERATION_CHECK_INTERVAL': 0, 'L2_ONLY_SUFFIXES': [':lock'], **options}
+        return TwoTierCache(location, {'OPTIONS': options})
+
+    def generation(self):
+        return self.shared.get(GENERATION_KEY)
+
+    def test_tests_use_a_temporary_shared_tier(self):
+        shared = caches[caches['default'].shared_alias]
+        self.assertIsInstance(shared, FileCache)
+        self.assertEqual(Path(shared._dir).name, caches['default'].shared_alias)
+        self.assertTrue(Path(shared._dir).parent.name.startswith('planetarium-test-cache-'))
+
+    def test_hot_keys_are_served_from_l1(self):
+        worker = self.worker(f'{self.directory}/hot', GENERATION_CHECK_INTERVAL=60)
+        worker.set('planet', {'name': 'Earth'})
+        with mock.patch.object(self.shared, 'get', wraps=self.shared.get) as shared_get:
+            value = worker.get('planet')
+            value['name'] = 'changed'
+            self.assertEqual(worker.get('planet'), {'name': 'Earth'})
+        shared_get.assert_not_called()
+
+    def test_threads_share_l1(self):
+        # caches[alias] is one instance per thread, their L1 is the process's
+        self.first.set('planet', 1)
+        same_process = self.worker(f'{self.directory}/first')
+        with mock.patch.object(self.shared, 'get', wraps=self.shared.get) as shared_get:
+            self.assertEqual(same_process.get('planet'), 1)
+        self.assertEqual({call.args[0] for call in shared_get.call_args_list}, {GENERATION_KEY})
+
+    def test_writes_of_other_workers_are_seen(self):
+        self.first.set('planet', 1)
+        self.assertEqual(self.second.get('planet'), 1)
+        self.first.set('planet', 2)
+        self.assertEqual(self.second.get('planet'), 2)
+        self.second.incr('planet')
+        self.assertEqual(self.first.get('planet'), 3)
+        self.first.delete('planet')
+        self.assertIsNone(self.second.get('planet'))
+
+        self.assertTrue(self.first.add('lock', 1))
+        self.assertFalse(self.second.add('lock', 1))
+        self.first.delete('lock')
+        self.assertTrue(self.second.add('lock', 1))
+
+        self.first.set('planet', 4)
+        self.second.clear()
+        self.assertIsNone(self.first.get('planet'))
+
+    def test_counters_are_current_in_every_process(self):
+        # the settings' key lists, and the default check interval: the shared generation is not read again
+        options = settings.CACHES['default']['OPTIONS']
+        first, second = (
+            self.worker(f'{self.directory}/{name}', GENERATION_CHECK_INTERVAL=60,
+                        L2_ONLY_PREFIXES=options['L2_ONLY_PREFIXES'], L2_ONLY_SUFFIXES=options['L2_ONLY_SUFFIXES'])
+            for name in ('counters-first', 'counters-second')
+        )
+        counters = [planet_cache.version_key('Earth'), planet_cache.LIST_GENERATION_KEY, facets.GENERATION_KEY]
+        for cache in (first, second):
+            with mock.patch.object(planet_cache, 'cache', cache), mock.patch.object(facets, 'cache', cache):
+                versions = (planet_cache.get_version('Earth'), planet_cache.list_generation(), facets.generation())
+                cache.set(planet_cache.data_key('Earth'), {'name': 'Earth'})
+        self.assertEqual(versions, (1, 1, 1))
+        self.assertEqual(second.get(planet_cache.data_key('Earth', 1)), {'name': 'Earth'})
+
+        with mock.patch.object(planet_cache, 'cache', first), mock.patch.object(facets, 'cache', first):
+            planet_cache.invalidate('Earth')
+            planet_cache._bump_list_generation()
+            facets._bump()
+            planet_cache.set_planet('Earth', {'name': 'Earth', 'population': 1})
+        with mock.patch.object(planet_cache, 'cache', second), mock.patch.object(facets, 'cache', second):
+            self.assertEqual((planet_cache.get_version('Earth'), planet_cache.list_generation(), facets.generation()),
+                             (2, 2, 2))
+            self.assertEqual(second.get(planet_cache.data_key('Earth', 2)), {'name': 'Earth', 'population': 1})
+        self.assertEqual([first.get(key) for key in counters], [2, 2, 2])
+
+    def test_only_writes_l1_can_serve_stale_bump_the_generation(self):
+        self.first.set('planet', 1)
+        self.assertEqual(self.second.get('planet'), 1)
+        generation = self.generation()
+        # reads, new keys, add and the L2 only fill locks leave every L1 alone
+        self.first.get('planet')
+        self.first.set('planet_data:v1', {'name': 'Earth'})
+        self.first.add('planet_version', 1)
+        self.assertTrue(self.first.add('planet_data:v1:lock', 1))
+        self.assertEqual(self.second.get('planet_data:v1:lock'), 1)
+        self.first.delete('planet_data:v1:lock')
+        self.assertIsNone(self.second.get('planet_data:v1:lock'))
+        self.first.delete('never_set')
+        self.assertEqual(self.generation(), generation)
+        self.assertNotIn(self.second._l1_key('planet_data:v1:lock', None), self.second._tier.entries)
+        self.assertIn(self.second._l1_key('planet', None), self.second._tier.entries)
+
+        self.first.incr('planet_version')
+        self.assertEqual(self.generation(), generation + 1)
+        self.assertEqual(self.second.get('planet_version'), 2)
+
+    def test_generation_is_read_every_interval(self):
+        second = self.worker(f'{self.directory}/second', GENERATION_CHECK_INTERVAL=0.1)
+        self.first.set('planet', 1)
+        self.assertEqual(second.get('planet'), 1)
+        self.first.set('planet', 2)
+        self.assertEqual(second.get('planet'), 1)
+        time.sleep(0.11)
+        self.assertEqual(second.get('planet'), 2)
+
+    def test_l1_is_bounded(self):
+        worker = self.worker(f'{self.directory}/bounded', L1_MAX_ENTRIES=2, L1_TIMEOUT=0.05)
+        for key in ('a', 'b', 'c'):
+            worker.set(key, key)
+        self.assertEqual(list(worker._tier.entries), [worker._l1_key('b', None), worker._l1_key('c', None)])
+        # a write behind the backend's back (no generation bump) shows once the L1 entry expired
+        self.shared.set('c', 'direct')
+        self.assertEqual(worker.get('c'), 'c')
+        time.sleep(0.06)
+        self.assertEqual(worker.get('c'), 'direct')
+
+    def test_file_cache_writes_are_small_and_compatible(self):
+        value = {'name': 'Earth', 'residents': ['x' * 40] * 50, 'blob': bytes(range(256)) * 300}
+        stock = FileBasedCache(self.directory, {})
+        peaks = []
+        for backend in (stock, self.shared):
+            backend.set('planet', value)
+            tracemalloc.start()
+            try:
+                backend.set('planet', value)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+        # the stock backend's zlib compressor alone takes about 270 KiB
+        self.assertLess(peaks[1], peaks[0] / 2)
+        self.assertEqual(stock.get('planet'), value)
+
+    def test_file_cache_rewrites_in_place(self):
+        self.shared.set('planet', 'x' * 100, timeout=None)
+        inode = os.stat(self.shared._key_to_file('planet')).st_ino
+        self.shared.set('planet', 'short')
+        self.assertEqual(self.shared.get('planet'), 'short')
+        self.shared.set('version', 1, timeout=None)
+        self.assertEqual(self.shared.incr('version', 300), 301)
+        self.assertEqual(os.stat(self.shared._key_to_file('planet')).st_ino, inode)
+        stock = FileBasedCache(self.directory, {})
+        self.assertEqual((stock.get('planet'), stock.get('version')), ('short', 301))
+        # incr keeps the expiry, FileBasedCache's resets it to the default timeout
+        with open(self.shared._key_to_file('version'), 'rb') as f:
+            self.assertIsNone(pickle.load(f))
+        with self.assertRaises(ValueError):
+            self.shared.incr('missing')
+
+    def test_file_cache_add(self):
+        self.assertTrue(self.shared.add('lock', 1))
+        self.assertFalse(self.shared.add('lock', 2))
+        self.shared.set('expired', 1, timeout=None)
+        with mock.patch.object(self.shared, 'get_backend_timeout', return_value=time.time() - 1):
+            self.shared.set('expired', 2)
+        self.assertTrue(self.shared.add('expired', 3))
+        self.assertEqual((self.shared.get('lock'), self.shared.get('expired')), (1, 3))
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted(
+            os.path.basename(self.shared._key_to_file(key)) for key in ('lock', 'expired')
+        ))
+
+    def test_file_cache_add_is_atomic_across_processes(self):
+        code = (
+            'import sys, time\n'
+            'from django.conf import settings\n'
+            'settings.configure()\n'
+            'from planetarium_api.cache_backend import FileCache\n'
+            'cache = FileCache(sys.argv[1], {})\n'
+            'while time.time() < float(sys.argv[2]):\n'
+            '    pass\n'
+            'print(sum(cache.add(f"lock{i}", 1, timeout=None) for i in range(100)))\n'
+        )
+        start = str(time.time() + 1)
+        processes = [
+            subprocess.Popen([sys.executable, '-c', code, self.directory, start], stdout=subprocess.PIPE,
+                             cwd=settings.BASE_DIR, text=True)
+            for _ in range(4)
+        ]
+        wins = [int(process.communicate()[0]) for process in processes]
+        # every lock taken exactly once
+        self.assertEqual(sum(wins), 100)
+
+    def test_file_cache_incr_is_atomic(self):
+        self.shared.set('version', 0, timeout=None)
+
+        def bump():
+            # an instance per thread, like separate processes
+            backend = FileCache(self.directory, {})
+            for _ in range(50):
+                backend.incr('version')
+
+        threads = [threading.Thread(target=bump) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.shared.get('version'), 200)
@@ -17,7 +17,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from planets.api_views import CustomTokenObtainPairView
-from planets.views import PlanetServiceView
+from planets.views import PlanetServiceView, PlanetSyncJobView
+from planetarium_api.views import metrics_view
+from planets import async_views as planet_async_views
+from goodreads import async_views as goodreads_async_views
 
 # API documentation
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
@@ -27,8 +30,18 @@ urlpatterns = [
     path('auth/token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     # Service endpoint
     path('planets-service/', PlanetServiceView.as_view(), name='planets-service'),
+    path('planets-service/jobs/<int:job_id>/', PlanetSyncJobView.as_view(), name='planets-service-job'),
     path('api/v1/', include('planets.urls')),
     path('api/v1/', include('goodreads.urls')),
+    # async-native reads for ASGI servers, same payloads as their DRF counterparts
+    path('api/v1/async/planets/', planet_async_views.planet_list, name='async-planet-list'),
+    path('api/v1/async/planets/<str:name>/', planet_async_views.planet_detail, name='async-planet-detail'),
+    path(
+        'api/v1/async/goodreads/<str:user_username>/network_books/',
+        goodreads_async_views.network_books, name='async-network-books',
+    ),
+    # Prometheus scrape endpoint
+    path('metrics', metrics_view, name='metrics'),
 
     # API documentation endpoints
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
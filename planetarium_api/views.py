@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+from . import metrics
+
+
+def metrics_view(request):
+    """
+    GET /metrics: Prometheus text exposition of the request metrics.
+    """
+    if not getattr(settings, 'METRICS_ENABLED', False):
+        raise Http404('Metrics are disabled.')
+    return HttpResponse(metrics.render(metrics.collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
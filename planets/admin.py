@@ -39,3 +39,11 @@ class ClimateAdmin(admin.ModelAdmin):
     list_display = ('name',)
     search_fields = ('name',)
     ordering = ('name',)
+
+
+@admin.register(models.PlanetSyncJob)
+class PlanetSyncJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'stage', 'total', 'created', 'updated', 'unchanged', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    ordering = ('-created_at',)
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
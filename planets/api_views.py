@@ -1,43 +1,199 @@
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
+from django.conf import settings
 from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import Count, Max, Prefetch, Q
+from django.utils.dateparse import parse_datetime
 # filtering and searching
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
+from .filters import PlanetFilter
+from .search import PlanetSearchFilter, PlanetOrderingFilter
 # pagination
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.utils.urls import replace_query_param
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import json
+from urllib.parse import urlencode
 # models and serializers
-from .models import Planet
-from .serializers import PlanetSerializer, CustomTokenObtainPairSerializer
-from planetarium_api.mixins import OptionalAuthMixin
+from .models import Planet, Terrain, Climate
+from .serializers import PlanetSerializer, PlanetReadSerializer, CustomTokenObtainPairSerializer
+from planetarium_api import instrumentation
+from planetarium_api import export as streaming
+from planetarium_api.parsers import NDJSONParser
+from planetarium_api.mixins import OptionalAuthMixin, ConditionalGetMixin, ReplicaReadMixin
 from rest_framework_simplejwt.views import TokenObtainPairView
 # cache
-from django.core.cache import cache
+from . import cache as planet_cache
+from . import bulk as planet_bulk
+from . import facets
 
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
 
 
+class PlanetCursorPagination(BasePagination):
+    """
+    Keyset pagination on (<ordering field>, id), no COUNT and no OFFSET.
+    The keyset follows the ordering chosen by OrderingFilter, unknown
+    orderings fall back to id.
+    example:
+    api/v1/planets/?cursor= => first page
+    api/v1/planets/?cursor=<next>&ordering=-updated_at&page_size=5
+    """
+    cursor_query_param = 'cursor'
+    keyset_fields = ('name', 'created_at', 'updated_at')
+    datetime_fields = ('created_at', 'updated_at')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, page_size):
+        self.page_size = page_size
+
+    def get_keyset(self, queryset):
+        term = (list(queryset.query.order_by) or ['id'])[0]
+        if not isinstance(term, str):
+            return 'id', False
+        field = term.lstrip('-')
+        if field != 'id' and field not in self.keyset_fields:
+            return 'id', False
+        return field, term.startswith('-')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            tokens = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            value, pk, reverse = tokens['v'], int(tokens['id']), bool(tokens.get('r'))
+            if tokens['f'] != self.field:
+                raise ValueError('cursor was issued for another ordering')
+            if self.field in self.datetime_fields:
+                value = parse_datetime(value)
+                if value is None:
+                    raise ValueError('bad datetime')
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return (value, pk), reverse
+
+    def encode_cursor(self, row, reverse):
+        value = row[self.field] if isinstance(row, dict) else getattr(row, self.field)
+        pk = row['id'] if isinstance(row, dict) else row.pk
+        if self.field in self.datetime_fields:
+            value = value.isoformat()
+        tokens = {'f': self.field, 'v': value, 'id': pk}
+        if reverse:
+            tokens['r'] = 1
+        encoded = urlsafe_b64encode(json.dumps(tokens, separators=(',', ':')).encode()).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.field, descending = self.get_keyset(queryset)
+        position, reverse = self.decode_cursor(request)
+        # walking backwards flips the sort, results are flipped back below
+        backwards = descending != reverse
+        order = '-' if backwards else ''
+        if self.field == 'id':
+            queryset = queryset.order_by(f'{order}id')
+        else:
+            queryset = queryset.order_by(f'{order}{self.field}', f'{order}id')
+        if position is not None:
+            value, pk = position
+            lookup = 'lt' if backwards else 'gt'
+            condition = Q(**{f'id__{lookup}': pk})
+            if self.field != 'id':
+                condition = Q(**{f'{self.field}__{lookup}': value}) | (Q(**{self.field: value}) & condition)
+            queryset = queryset.filter(condition)
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+        self.has_next = position is not None if reverse else has_more
+        self.has_previous = has_more if reverse else position is not None
+        self.rows = rows
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next or not self.rows:
+            return None
+        return self.encode_cursor(self.rows[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.rows:
+            return None
+        return self.encode_cursor(self.rows[0], reverse=True)
+
+    def get_paginated_response(self, data, facets=None):
+        payload = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data
+        }
+        if facets is not None:
+            payload['facets'] = facets
+        return Response(payload)
+
+
 class PlanetPagination(PageNumberPagination):
+    """
+    Page number pagination, or keyset pagination when ?cursor= is present.
+    example:
+    api/v1/planets/?page=2 => get page 2
+    api/v1/planets/?page=3&page_size=5 => page 3, with 5 results per page
+    api/v1/planets/?cursor= => keyset pagination, see PlanetCursorPagination
+    api/v1/planets/?facets=terrains,climates => adds per terrain/climate counts as `facets`
+    """
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 20
     page_query_param = 'page'
+    cursor_pagination_class = PlanetCursorPagination
+    cursor = None
+    # facet -> name -> planet count, set by PlanetViewSet.list for ?facets=
+    facets = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_pagination_class.cursor_query_param in request.query_params:
+            self.cursor = self.cursor_pagination_class(self.get_page_size(request))
+            return self.cursor.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        parameters.append({
+            'name': self.cursor_pagination_class.cursor_query_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Keyset pagination cursor, pass an empty value for the first page.',
+            'schema': {'type': 'string'},
+        })
+        return parameters
 
     def get_paginated_response(self, data):
-        return Response({
+        if self.cursor is not None:
+            return self.cursor.get_paginated_response(data, self.facets)
+        payload = {
             'count': self.page.paginator.count,
             'next': self.get_next_link(),
             'previous': self.get_previous_link(),
             'total_pages': self.page.paginator.num_pages,
             'current_page': self.page.number,
             'results': data
-        })
+        }
+        if self.facets is not None:
+            payload['facets'] = self.facets
+        return Response(payload)
 
 
-class PlanetViewSet(OptionalAuthMixin, ModelViewSet):
+class PlanetViewSet(OptionalAuthMixin, ConditionalGetMixin, ReplicaReadMixin, ModelViewSet):
     """
     Handles list, retrieve, create, update, and delete for planets.
 
@@ -56,27 +212,30 @@ class PlanetViewSet(OptionalAuthMixin, ModelViewSet):
     api/v1/planets/?page=2
     api/v1/planets/?page=3&page_size=5
     api/v1/planets/?limit=5&offset=10
+    api/v1/planets/?cursor=&ordering=-updated_at
     api/v1/planets/?climates__name=Arid
     api/v1/planets/?terrains__name=Rocky
     api/v1/planets/?population__gte=10&population__lte=500
+    api/v1/planets/?terrains__all=desert,mountains&climates__any=arid,hot&facets=terrains,climates
+    api/v1/planets/export/?format=csv&climates__name=Arid => every matching planet, streamed
+    POST api/v1/planets/bulk/ => create/update/delete many planets in one request
     """
-    queryset = Planet.objects.all()
+    # prefetch the slug fields so a page costs a fixed number of queries
+    queryset = Planet.objects.prefetch_related(
+        Prefetch('terrains', queryset=Terrain.objects.only('name')),
+        Prefetch('climates', queryset=Climate.objects.only('name')),
+    )
     serializer_class = PlanetSerializer
     lookup_field = 'name'
     pagination_class = PlanetPagination
 
-    filter_backends = (DjangoFilterBackend, SearchFilter, OrderingFilter)
-    filterset_fields = {
-        'name': ['icontains', 'exact'],
-        'population': ['exact', 'gte', 'lte'],
-        'created_at': ['exact', 'gte', 'lte'],
-        'updated_at': ['exact', 'gte', 'lte'],
-        'climates__name': ['exact', 'icontains'],
-        'terrains__name': ['exact', 'icontains'],
-    }
+    # ?search= goes through the full-text index (planets/search.py), best match first
+    filter_backends = (DjangoFilterBackend, facets.PlanetFacetFilter, PlanetSearchFilter, PlanetOrderingFilter)
+    filterset_class = PlanetFilter
     search_fields = ('name', 'climates__name', 'terrains__name', 'population', 'created_at', 'updated_at')
     ordering_fields = ('name', 'created_at', 'updated_at')
     ordering = ('id',)
+    export_fields = ('id', 'name', 'population', 'terrains', 'climates', 'created_at', 'updated_at')
 
     def get_object(self):
         try:
@@ -84,6 +243,141 @@ class PlanetViewSet(OptionalAuthMixin, ModelViewSet):
         except Http404:
             raise Http404(f"Planet '{self.kwargs['name']}' not found")
 
+    def get_read_queryset(self):
+        """
+        Filtered queryset as `values()` rows for PlanetReadSerializer.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        return queryset.prefetch_related(None).values(*PlanetReadSerializer.value_fields)
+
+    def get_object_row(self):
+        try:
+            row = get_object_or_404(self.get_read_queryset(), **{self.lookup_field: self.kwargs[self.lookup_field]})
+        except Http404:
+            raise Http404(f"Planet '{self.kwargs['name']}' not found")
+        self.check_object_permissions(self.request, row)
+        return row
+
+    """
+    List planets through the read-only fast serializer
+    GET:    /api/v1/planets/
+    Whole responses are cached per canonical query (see list_cache_query) until
+    any planet, terrain or climate write, or PLANET_LIST_CACHE_TIMEOUT.
+    """
+    def list(self, request, *args, **kwargs):
+        requested_facets = self.get_facets(request)
+        query = self.list_cache_query(request)
+        if query is None:
+            return self.build_list(request, requested_facets)
+        key = planet_cache.list_key(query)
+        entry = planet_cache.get_list(key)
+        if entry is None:
+            # the entry outlives the request, fill it from the primary rather than a lagging replica
+            response = self.read_from_primary(lambda: self.build_list(request, requested_facets))
+            if response.status_code == status.HTTP_200_OK:
+                planet_cache.set_list(key, self.list_entry)
+            response['X-Cache'] = 'MISS'
+            return response
+        not_modified = self.conditional_response(request, *entry['validators'], last_modified=entry['last_modified'])
+        if not_modified is not None:
+            return not_modified
+        return Response(entry['data'], headers={'X-Cache': 'HIT'})
+
+    def build_list(self, request, requested_facets):
+        """
+        The list response; a 200 leaves its payload and ETag validators in `self.list_entry`.
+        """
+        queryset = self.get_read_queryset()
+        cursor_mode = PlanetCursorPagination.cursor_query_param in request.query_params
+        if not cursor_mode:
+            # count + newest updated_at identify the filtered set, answer 304 before paginating
+            state = queryset.aggregate(count=Count('id'), last_modified=Max('updated_at'))
+            validators, last_modified = (state['count'], state['last_modified']), state['last_modified']
+            not_modified = self.conditional_response(request, *validators, last_modified=last_modified)
+            if not_modified is not None:
+                return not_modified
+        page = self.paginate_queryset(queryset)
+        if cursor_mode:
+            # keyset pages are validated by their own rows, so still no COUNT
+            stamps = [(row['id'], row['updated_at']) for row in page]
+            validators = (stamps, self.paginator.cursor.has_next)
+            last_modified = max((stamp for _, stamp in stamps), default=None)
+            not_modified = self.conditional_response(request, *validators, last_modified=last_modified)
+            if not_modified is not None:
+                return not_modified
+        if page is not None:
+            if requested_facets:
+                self.paginator.facets = facets.facet_counts(request.query_params, queryset, requested_facets)
+            response = self.get_paginated_response(PlanetReadSerializer(page, many=True).data)
+        else:
+            response = Response(PlanetReadSerializer(queryset, many=True).data)
+        self.list_entry = {'data': response.data, 'validators': validators, 'last_modified': last_modified}
+        return response
+
+    def list_cache_query(self, request):
+        """
+        Canonical form of a list request, None when the list cache is off.
+        Parameters are sorted, blank ones and defaults (page 1, the default
+        page size, ordering by id) dropped and page_size clamped, so equivalent
+        URLs share one entry. Repeated values keep their order, the last wins.
+        """
+        if not planet_cache.list_cache_enabled():
+            return None
+        paginator = self.paginator
+        params = {
+            name: values for name, values in request.query_params.lists()
+            # an empty cursor asks for the first keyset page
+            if name != 'format' and (values != [''] or name == PlanetCursorPagination.cursor_query_param)
+        }
+        if params.get(paginator.page_query_param) == ['1']:
+            del params[paginator.page_query_param]
+        page_size = paginator.get_page_size(request)
+        params.pop(paginator.page_size_query_param, None)
+        if page_size != paginator.page_size:
+            params[paginator.page_size_query_param] = [str(page_size)]
+        # with ?search= the default ordering is the rank, not id
+        if params.get('ordering') == ['id'] and 'search' not in params:
+            del params['ordering']
+        # links in the payload are absolute
+        return f'{request.get_host()}?{urlencode(sorted(params.items()), doseq=True)}'
+
+    def get_facets(self, request):
+        requested = facets.split_names(request.query_params.get('facets', ''))
+        unknown = sorted(set(requested) - set(facets.FACETS))
+        if unknown:
+            raise ValidationError({'facets': f'Unknown facets: {", ".join(unknown)}. Use {", ".join(facets.FACETS)}.'})
+        return list(dict.fromkeys(requested))
+
+    """
+    Stream every planet of the filtered list, unpaginated, as NDJSON or CSV
+    GET:    /api/v1/planets/export/?format=ndjson
+    GET:    /api/v1/planets/export/?format=csv   terrains/climates joined with '|'
+    Takes the list filters, search and ordering; rows are read and written
+    one chunk (EXPORT_CHUNK_SIZE) at a time, see planetarium_api/export.py.
+    """
+    @action(detail=False, methods=['get'], url_path='export', renderer_classes=streaming.RENDERERS)
+    def export(self, request, *args, **kwargs):
+        batches = (PlanetReadSerializer.serialize_rows(rows) for rows in streaming.chunks(self.get_read_queryset()))
+        return streaming.export_response(request, batches, self.export_fields, request.accepted_renderer.format, 'planets')
+
+    """
+    Retrieve a planet by name, served from the planet cache when warm
+    GET:    /api/v1/planets/<name>/
+    Both list and retrieve send ETag/Last-Modified and honour If-None-Match/If-Modified-Since.
+    """
+    def retrieve(self, request, *args, **kwargs):
+        # the cache outlives the request, fill it from the primary rather than a lagging replica
+        data, hit = planet_cache.get_or_fill(
+            self.kwargs[self.lookup_field],
+            lambda: self.read_from_primary(lambda: PlanetReadSerializer(self.get_object_row()).data)
+        )
+        not_modified = self.conditional_response(
+            request, data['id'], data['updated_at'], last_modified=parse_datetime(data['updated_at'])
+        )
+        if not_modified is not None:
+            return not_modified
+        return Response(data, headers={'X-Cache': 'HIT' if hit else 'MISS'})
+
     """
     Create a new planet
     POST:   /api/v1/planets/
@@ -94,13 +388,16 @@ class PlanetViewSet(OptionalAuthMixin, ModelViewSet):
         planet_name = serializer.validated_data.get('name')
         if Planet.objects.filter(name=planet_name).exists():
             raise Http404(f"Planet '{planet_name}' already exists.")
-        serializer.save()
+        # one transaction: the search document is refreshed once, on commit
+        with transaction.atomic():
+            serializer.save()
         # update cache
-        cache_key = f'planet_data_{planet_name}'
-        cache.set(cache_key, serializer.data, timeout=60 * 15)
+        with instrumentation.timed('serialize'):
+            data = serializer.data
+        planet_cache.set_planet(planet_name, data)
 
         return Response(
-            {"message": f"Planet '{planet_name}' was created successfully.", "planet": serializer.data},
+            {"message": f"Planet '{planet_name}' was created successfully.", "planet": data},
             status=status.HTTP_201_CREATED
         )
 
@@ -113,10 +410,40 @@ class PlanetViewSet(OptionalAuthMixin, ModelViewSet):
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data, partial=False)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        cache_key = f'planet_data_{instance.name}'
-        cache.set(cache_key, serializer.data, timeout=60 * 15)
-        return Response(serializer.data)
+        with transaction.atomic():
+            serializer.save()
+        # drop prefetched terrains/climates so the response reflects the update
+        instance._prefetched_objects_cache = {}
+        with instrumentation.timed('serialize'):
+            data = serializer.data
+        planet_cache.set_planet(instance.name, data)
+        return Response(data)
+
+    """
+    Create, update and delete many planets in one request, see planets/bulk.py
+    POST:   /api/v1/planets/bulk/                a JSON list, or NDJSON with Content-Type: application/x-ndjson
+    POST:   /api/v1/planets/bulk/?atomic=false   write the valid items and report the invalid ones
+    Items: {"op": "create" | "update" | "delete", "name": ..., "population": ..., "terrains": [...], "climates": [...]}
+    200 when every item was written, 400 when an atomic batch was refused, 207 for a partial success,
+    409 when concurrent writes kept conflicting with the batch.
+    """
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=(JSONParser, NDJSONParser))
+    def bulk(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of items.']})
+        max_items = getattr(settings, 'PLANET_BULK_MAX_ITEMS', 10000)
+        if len(items) > max_items:
+            raise ValidationError({'non_field_errors': [f'At most {max_items} items per request.']})
+        atomic = request.query_params.get('atomic', 'true').lower() not in ('false', '0', 'no')
+        result = planet_bulk.apply(items, atomic=atomic)
+        if not result['errors']:
+            response_status = status.HTTP_200_OK
+        elif atomic:
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_207_MULTI_STATUS
+        return Response(result, status=response_status)
 
     """
     Delete a planet by name
@@ -124,7 +451,7 @@ class PlanetViewSet(OptionalAuthMixin, ModelViewSet):
     """
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
-        cache.delete(f'planet_data_{instance.name}')
+        # the post_delete signal bumps the cache version for this planet
         instance.delete()
         return Response(
             {"message": f"Planet '{instance.name}' was deleted successfully."},
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PlanetsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'planets'
+
+    def ready(self):
+        # cache invalidation hooks
+        from . import signals  # noqa: F401
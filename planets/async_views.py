@@ -0,0 +1,91 @@
+"""
+Async-native planet reads, served next to the DRF views under /api/v1/async/.
+
+Same payloads as PlanetViewSet.list/retrieve, read through the async ORM
+(`acount`, `aget`, `async for`) and the async cache API. The list takes the
+PlanetFilter filters, `ordering`, `page` and `page_size`; search, facets,
+cursors and conditional GETs stay on the DRF endpoint.
+"""
+from math import ceil
+
+from django.views.decorators.http import require_GET
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from planetarium_api.async_support import json_response, optional_auth
+
+from . import cache as planet_cache
+from .api_views import PlanetPagination, PlanetViewSet
+from .filters import PlanetFilter
+from .models import Planet
+from .serializers import PlanetReadSerializer
+
+
+def get_ordering(params):
+    """
+    The valid terms of ?ordering=, like OrderingFilter, else the view's default.
+    """
+    allowed = set(PlanetViewSet.ordering_fields)
+    terms = [term.strip() for term in params.get('ordering', '').split(',') if term.strip()]
+    terms = [term for term in terms if term.lstrip('-') in allowed]
+    return terms or list(PlanetViewSet.ordering)
+
+
+def get_page_size(params):
+    try:
+        size = int(params[PlanetPagination.page_size_query_param])
+    except (KeyError, ValueError):
+        return PlanetPagination.page_size
+    if size <= 0:
+        return PlanetPagination.page_size
+    return min(size, PlanetPagination.max_page_size)
+
+
+@require_GET
+@optional_auth
+async def planet_list(request):
+    filterset = PlanetFilter(request.GET, queryset=Planet.objects.all())
+    if not filterset.is_valid():
+        return json_response(filterset.errors, status=400)
+    queryset = filterset.qs.order_by(*get_ordering(request.GET)).values(*PlanetReadSerializer.value_fields)
+
+    page_size = get_page_size(request.GET)
+    count = await queryset.acount()
+    total_pages = max(1, ceil(count / page_size))
+    page = request.GET.get(PlanetPagination.page_query_param, '1')
+    try:
+        page = total_pages if page in PlanetPagination.last_page_strings else int(page)
+    except ValueError:
+        page = 0
+    if not 1 <= page <= total_pages:
+        return json_response({'detail': 'Invalid page.'}, status=404)
+
+    start = (page - 1) * page_size
+    rows = [row async for row in queryset[start:start + page_size]]
+    url = request.build_absolute_uri()
+    previous = None
+    if page > 1:
+        previous = remove_query_param(url, 'page') if page == 2 else replace_query_param(url, 'page', page - 1)
+    return json_response({
+        'count': count,
+        'next': replace_query_param(url, 'page', page + 1) if page < total_pages else None,
+        'previous': previous,
+        'total_pages': total_pages,
+        'current_page': page,
+        'results': await PlanetReadSerializer.aserialize_rows(rows),
+    })
+
+
+@require_GET
+@optional_auth
+async def planet_detail(request, name):
+    async def load():
+        row = await Planet.objects.values(*PlanetReadSerializer.value_fields).aget(name=name)
+        return (await PlanetReadSerializer.aserialize_rows([row]))[0]
+
+    try:
+        data, hit = await planet_cache.aget_or_fill(name, load)
+    except Planet.DoesNotExist:
+        return json_response({'detail': f"Planet '{name}' not found"}, status=404)
+    response = json_response(data)
+    response['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
@@ -0,0 +1,176 @@
+"""
+Bulk planet writes, POST /api/v1/planets/bulk/.
+
+A batch of create/update/delete items is validated in one pass: the shape of
+each item by PlanetBulkItemSerializer, then the terrain/climate names and the
+planet names of the whole batch with a few IN queries. The writes are a
+bulk_create, a bulk_update, bulk through table rewrites (planets/ingest.py)
+and DELETEs by id, in a single transaction, so the query count grows with the
+CHUNK_SIZE chunks of the batch, not with its items.
+
+With `atomic` an invalid item fails the whole batch and nothing is written;
+otherwise the valid items are written and the invalid ones reported.
+
+The names are checked inside the write transaction. A planet created or
+deleted concurrently between the check and the write (possible where the
+transaction does not lock up front, unlike SQLite's IMMEDIATE mode) makes
+the write fail with an IntegrityError; the batch is then checked and written
+again, the conflicting items now reported as per item errors.
+"""
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .ingest import CHUNK_SIZE, chunked, resolve_names, rewrite_relations
+from .models import Planet, Terrain, Climate
+from .serializers import PlanetBulkItemSerializer
+from .signals import planets_bulk_changed
+
+RELATIONS = {'terrains': Terrain, 'climates': Climate}
+# check-and-write rounds before a batch racing other writers is given up
+WRITE_ATTEMPTS = 3
+
+
+class BulkConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The planets kept changing while the batch was written, retry the request.'
+    default_code = 'conflict'
+
+
+def check_shapes(items):
+    """
+    Result dict per item, and the (result, validated data) pairs of the valid ones.
+    """
+    serializer = PlanetBulkItemSerializer()
+    results, valid = [], []
+    for index, item in enumerate(items):
+        result = {'index': index, 'name': item.get('name') if isinstance(item, dict) else None}
+        results.append(result)
+        try:
+            data = serializer.run_validation(item)
+        except ValidationError as exc:
+            result.update(status='error', errors=exc.detail)
+            continue
+        result['op'] = data['op']
+        valid.append((result, data))
+    return results, valid
+
+
+def check_names(valid):
+    """
+    Resolve the batch's terrain/climate names and planets, flag the items they
+    make invalid. Returns the related ids by relation and the stored planets.
+    """
+    related_ids = {
+        relation: resolve_names(
+            model, {name for _, data in valid for name in data.get(relation, ())}, create_missing=False
+        )
+        for relation, model in RELATIONS.items()
+    }
+    existing = {}
+    for chunk in chunked({data['name'] for _, data in valid}):
+        rows = Planet.objects.filter(name__in=chunk).values_list('name', 'id', 'population')
+        existing.update((name, (planet_id, population)) for name, planet_id, population in rows)
+    seen = set()
+    for result, data in valid:
+        name, errors = data['name'], {}
+        if name in seen:
+            errors['name'] = ['Duplicate name in this request.']
+        elif data['op'] == 'create' and name in existing:
+            errors['name'] = [f"Planet '{name}' already exists."]
+        elif data['op'] != 'create' and name not in existing:
+            errors['name'] = [f"Planet '{name}' not found."]
+        seen.add(name)
+        for relation in RELATIONS:
+            unknown = [value for value in data.get(relation, ()) if value not in related_ids[relation]]
+            if unknown:
+                errors[relation] = [f'Object with name={value} does not exist.' for value in unknown]
+        if errors:
+            result.update(status='error', errors=errors)
+    return related_ids, existing
+
+
+def apply(items, atomic=True):
+    """
+    Validate and write a batch of planet items, returns the per item results and counts.
+    """
+    results, valid = check_shapes(items)
+    for _ in range(WRITE_ATTEMPTS):
+        for result, _data in valid:
+            for key in ('status', 'errors', 'id'):
+                result.pop(key, None)
+        try:
+            with transaction.atomic():
+                by_op, planet_ids = write(valid, atomic)
+        except IntegrityError:
+            # a concurrent writer got in between the check and the write: check again
+            continue
+        break
+    else:
+        raise BulkConflict()
+
+    for op, status_name in (('create', 'created'), ('update', 'updated'), ('delete', 'deleted')):
+        for result, data in by_op[op]:
+            result.update(status=status_name, id=planet_ids[data['name']])
+    return {
+        'atomic': atomic,
+        'created': len(by_op['create']),
+        'updated': len(by_op['update']),
+        'deleted': len(by_op['delete']),
+        'errors': sum(1 for result in results if result.get('status') == 'error'),
+        'results': results,
+    }
+
+
+def write(valid, atomic):
+    """
+    Check the names of the valid items and write them, in the caller's transaction.
+    Returns the written items by op and the planet ids by name.
+    """
+    related_ids, existing = check_names(valid)
+    checked = [(result, data) for result, data in valid if 'status' not in result]
+    if len(checked) < len(valid) and atomic:
+        for result, _ in checked:
+            result['status'] = 'skipped'
+        checked = []
+
+    by_op = {'create': [], 'update': [], 'delete': []}
+    for result, data in checked:
+        by_op[data['op']].append((result, data))
+
+    planet_ids = {name: planet_id for name, (planet_id, _) in existing.items()}
+    if by_op['create']:
+        Planet.objects.bulk_create(
+            [Planet(name=data['name'], population=data['population']) for _, data in by_op['create']],
+            batch_size=CHUNK_SIZE,
+        )
+        for chunk in chunked(data['name'] for _, data in by_op['create']):
+            planet_ids.update(Planet.objects.filter(name__in=chunk).values_list('name', 'id'))
+    if by_op['update']:
+        now = timezone.now()
+        Planet.objects.bulk_update(
+            [
+                Planet(
+                    pk=planet_ids[data['name']], updated_at=now,
+                    population=data.get('population', existing[data['name']][1]),
+                )
+                for _, data in by_op['update']
+            ],
+            ['population', 'updated_at'],
+            batch_size=CHUNK_SIZE,
+        )
+    written = by_op['create'] + by_op['update']
+    for relation in RELATIONS:
+        # relations left out of an update are kept
+        rewrite_relations(relation, {
+            planet_ids[data['name']]: frozenset(related_ids[relation][value] for value in data[relation])
+            for _, data in written if relation in data and (data[relation] or data['op'] == 'update')
+        })
+    if by_op['delete']:
+        for chunk in chunked(planet_ids[data['name']] for _, data in by_op['delete']):
+            # post_delete drops the cached payloads and search documents
+            Planet.objects.filter(pk__in=chunk).delete()
+    if written:
+        planets_bulk_changed.send(sender=Planet, names=[data['name'] for _, data in written])
+    return by_op, planet_ids
@@ -0,0 +1,291 @@
+"""
+Read-through cache for planet detail responses.
+
+Keys are versioned per planet: `planet_version_<name>` holds a counter and the
+payload lives under `planet_data_<name>:v<version>`. Invalidating a planet only
+bumps its counter, so stale payloads are never read again and simply expire.
+A miss takes a short lock (`cache.add`) so only one request fills a cold key.
+
+The `a`-prefixed functions are the same on the async cache API, for the async
+views (planets/async_views.py).
+
+List responses are cached whole under `planet_list:g<generation>:<query hash>`.
+The generation is global: any planet, terrain or climate write bumps it (see
+`invalidate_lists`), so a cached page never outlives the data it was built from.
+"""
+import asyncio
+import hashlib
+import pickle
+import threading
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from planetarium_api import instrumentation
+
+
+def _timeout():
+    return getattr(settings, 'PLANET_CACHE_TIMEOUT', 60 * 15)
+
+
+def _lock_timeout():
+    return getattr(settings, 'PLANET_CACHE_LOCK_TIMEOUT', 10)
+
+
+def _lock_wait():
+    return getattr(settings, 'PLANET_CACHE_LOCK_WAIT', 2.0)
+
+
+class CacheStats:
+    """
+    Per-process hit/miss counters for the planet cache.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.fills = 0
+
+    def record(self, hit=False, fill=False):
+        instrumentation.count('cache_hit' if hit else 'cache_miss')
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            if fill:
+                self.fills += 1
+
+    def as_dict(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'fills': self.fills,
+                'hit_ratio': self.hits / total if total else 0.0,
+            }
+
+
+stats = CacheStats()
+
+
+def _safe_name(name):
+    # planet names contain spaces, which memcached style backends reject
+    return quote(str(name), safe='')
+
+
+def version_key(name):
+    return f'planet_version_{_safe_name(name)}'
+
+
+def get_version(name):
+    version = cache.get(version_key(name))
+    if version is None:
+        cache.add(version_key(name), 1, timeout=None)
+        version = cache.get(version_key(name), 1)
+    return version
+
+
+async def aget_version(name):
+    version = await cache.aget(version_key(name))
+    if version is None:
+        await cache.aadd(version_key(name), 1, timeout=None)
+        version = await cache.aget(version_key(name), 1)
+    return version
+
+
+def data_key(name, version=None):
+    if version is None:
+        version = get_version(name)
+    return f'planet_data_{_safe_name(name)}:v{version}'
+
+
+async def adata_key(name):
+    return data_key(name, await aget_version(name))
+
+
+def invalidate(*names):
+    """
+    Bump the version of every given planet so its cached payload is skipped.
+    """
+    for name in names:
+        if not name:
+            continue
+        key = version_key(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # key missing: start above the default version so old payloads die
+            cache.set(key, 2, timeout=None)
+
+
+def set_planet(name, data):
+    cache.set(data_key(name), dict(data), timeout=_timeout())
+
+
+def get_or_fill(name, loader):
+    """
+    Return `(data, hit)` for a planet, calling `loader()` on a miss.
+
+    Only the request holding the fill lock calls the loader; concurrent misses
+    for the same key poll the cache until the fill lands or the wait runs out,
+    then fall back to loading themselves.
+    """
+    key = data_key(name)
+    data = cache.get(key)
+    if data is not None:
+        stats.record(hit=True)
+        return data, True
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, timeout=_lock_timeout()):
+        try:
+            # a fill may have landed between the miss and taking the lock
+            data = cache.get(key)
+            hit = data is not None
+            if not hit:
+                data = dict(loader())
+                cache.set(key, data, timeout=_timeout())
+        finally:
+            cache.delete(lock_key)
+        stats.record(hit=hit, fill=not hit)
+        return data, hit
+
+    deadline = time.monotonic() + _lock_wait()
+    delay = 0.005
+    while time.monotonic() < deadline:
+        time.sleep(delay)
+        data = cache.get(key)
+        if data is not None:
+            stats.record(hit=True)
+            return data, True
+        if cache.get(lock_key) is None:
+            # the fill may have landed after the read above
+            data = cache.get(key)
+            if data is not None:
+                stats.record(hit=True)
+                return data, True
+            # the filler gave up (e.g. 404), do not wait any longer
+            break
+        delay = min(delay * 2, 0.1)
+
+    stats.record()
+    return dict(loader()), False
+
+
+async def aget_or_fill(name, loader):
+    """
+    `get_or_fill` for async views, `loader` is a coroutine function.
+    """
+    key = await adata_key(name)
+    data = await cache.aget(key)
+    if data is not None:
+        stats.record(hit=True)
+        return data, True
+
+    lock_key = f'{key}:lock'
+    if await cache.aadd(lock_key, 1, timeout=_lock_timeout()):
+        try:
+            # a fill may have landed between the miss and taking the lock
+            data = await cache.aget(key)
+            hit = data is not None
+            if not hit:
+                data = dict(await loader())
+                await cache.aset(key, data, timeout=_timeout())
+        finally:
+            await cache.adelete(lock_key)
+        stats.record(hit=hit, fill=not hit)
+        return data, hit
+
+    deadline = time.monotonic() + _lock_wait()
+    delay = 0.005
+    while time.monotonic() < deadline:
+        await asyncio.sleep(delay)
+        data = await cache.aget(key)
+        if data is not None:
+            stats.record(hit=True)
+            return data, True
+        if await cache.aget(lock_key) is None:
+            # the fill may have landed after the read above
+            data = await cache.aget(key)
+            if data is not None:
+                stats.record(hit=True)
+                return data, True
+            break
+        delay = min(delay * 2, 0.1)
+
+    stats.record()
+    return dict(await loader()), False
+
+
+LIST_GENERATION_KEY = 'planet_list_generation'
+
+
+def _list_timeout():
+    return getattr(settings, 'PLANET_LIST_CACHE_TIMEOUT', 60)
+
+
+def _list_max_bytes():
+    return getattr(settings, 'PLANET_LIST_CACHE_MAX_BYTES', 256 * 1024)
+
+
+def list_cache_enabled():
+    return _list_timeout() > 0
+
+
+def list_generation():
+    generation = cache.get(LIST_GENERATION_KEY)
+    if generation is None:
+        cache.add(LIST_GENERATION_KEY, 1, timeout=None)
+        generation = cache.get(LIST_GENERATION_KEY, 1)
+    return generation
+
+
+def _bump_list_generation():
+    try:
+        cache.incr(LIST_GENERATION_KEY)
+    except ValueError:
+        cache.set(LIST_GENERATION_KEY, 2, timeout=None)
+
+
+def invalidate_lists():
+    """
+    Retire every cached list response: now, and once more on commit, as a
+    request filling the cache in between read the rows from before the write.
+    """
+    _bump_list_generation()
+    connection = transaction.get_connection()
+    if not any(callback is _bump_list_generation for _, callback, _ in connection.run_on_commit):
+        transaction.on_commit(_bump_list_generation)
+
+
+def list_key(query):
+    """
+    Key of the list response for `query`, a canonical query string.
+    """
+    digest = hashlib.sha256(query.encode()).hexdigest()[:32]
+    return f'planet_list:g{list_generation()}:{digest}'
+
+
+def get_list(key):
+    entry = cache.get(key)
+    instrumentation.count('list_cache_hit' if entry is not None else 'list_cache_miss')
+    return entry
+
+
+def set_list(key, entry):
+    """
+    Store a list response entry unless it is larger than PLANET_LIST_CACHE_MAX_BYTES.
+    """
+    if len(pickle.dumps(entry, pickle.HIGHEST_PROTOCOL)) > _list_max_bytes():
+        return False
+    cache.set(key, entry, timeout=_list_timeout())
+    return True
@@ -0,0 +1,230 @@
+"""
+In-memory bitmap index of planets by terrain and climate.
+
+For every terrain/climate name the index holds a bitmap of planet ids (a
+Python int, bit `id` set when the planet lists the name), built lazily from
+the through tables. AND/OR facet filters are int `&`/`|`, and facet counts
+are `(bitmap & candidates).bit_count()`: microseconds for the small
+vocabularies, no GROUP BY.
+
+`?terrains__all=a,b` / `?terrains__any=a,b` (and the climates ones) filter
+the list in SQL on the planet masks (planets/masks.py), with the name -> bit
+map of the index: no vocabulary query, no join.
+
+The index is per process and tagged with a generation counter kept in the
+Django cache (`planet_facets_generation`). planets/signals.py bumps it on m2m,
+planet delete, vocabulary and bulk changes, right away and again on commit,
+so no process keeps serving an index built from rows that changed under it.
+A bitmap costs max planet id / 8 bytes per name.
+"""
+import threading
+from functools import reduce
+from operator import and_, or_
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.db.models.lookups import Exact, GreaterThan
+from rest_framework.filters import BaseFilterBackend
+
+from planetarium_api import instrumentation
+
+from .masks import MASK_FIELDS
+from .models import Planet
+
+GENERATION_KEY = 'planet_facets_generation'
+FACETS = tuple(MASK_FIELDS)
+
+_lock = threading.Lock()
+_index = None
+
+
+def bitmap(ids, size):
+    """
+    Int with bit `id` set for every id, built through a bytearray: linear, unlike `|= 1 << id`.
+    """
+    buffer = bytearray(size // 8 + 1)
+    for pk in ids:
+        buffer[pk >> 3] |= 1 << (pk & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+class FacetIndex:
+    def __init__(self, generation, bitmaps, bits):
+        self.generation = generation
+        self.bitmaps = bitmaps  # relation -> name -> planet bitmap
+        self.bits = bits        # relation -> name -> mask bit (planets/masks.py), None past 63
+
+    @classmethod
+    def build(cls, generation):
+        bitmaps, bits = {}, {}
+        for relation in FACETS:
+            field = Planet._meta.get_field(relation)
+            target = field.m2m_reverse_field_name()
+            planets = {}
+            rows = field.remote_field.through.objects.values_list('planet_id', f'{target}__name')
+            for planet_id, name in rows.iterator(chunk_size=5000):
+                planets.setdefault(name, []).append(planet_id)
+            size = max((max(members) for members in planets.values()), default=0)
+            bitmaps[relation] = {name: bitmap(members, size) for name, members in planets.items()}
+            bits[relation] = dict(field.related_model.objects.values_list('name', 'bit'))
+        return cls(generation, bitmaps, bits)
+
+    def match(self, relation, names, require_all):
+        """
+        Bitmap of the planets listing all (AND) or any (OR) of `names`.
+        """
+        bitmaps = self.bitmaps[relation]
+        if require_all:
+            matched = None
+            for name in names:
+                members = bitmaps.get(name, 0)
+                matched = members if matched is None else matched & members
+            return matched or 0
+        matched = 0
+        for name in names:
+            matched |= bitmaps.get(name, 0)
+        return matched
+
+    def counts(self, relation, candidates=None):
+        """
+        Name -> number of planets listing it, among `candidates` (a bitmap,
+        None for every planet); most frequent first, zero counts left out.
+        """
+        counts = []
+        for name, members in self.bitmaps[relation].items():
+            count = (members if candidates is None else members & candidates).bit_count()
+            if count:
+                counts.append((name, count))
+        counts.sort(key=lambda item: (-item[1], item[0]))
+        return dict(counts)
+
+
+def generation():
+    value = cache.get(GENERATION_KEY)
+    if value is None:
+        cache.add(GENERATION_KEY, 1, timeout=None)
+        value = cache.get(GENERATION_KEY, 1)
+    return value
+
+
+def get_index():
+    """
+    The index of the current generation, rebuilt by one thread when stale.
+    """
+    global _index
+    current = generation()
+    index = _index
+    if index is not None and index.generation == current:
+        return index
+    with _lock:
+        if _index is None or _index.generation != current:
+            with instrumentation.timed('facet_index'):
+                _index = FacetIndex.build(current)
+        return _index
+
+
+def _bump():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 2, timeout=None)
+
+
+def invalidate():
+    # now, and once more on commit: a process rebuilding in between read the old rows
+    _bump()
+    connection = transaction.get_connection()
+    if not any(callback is _bump for _, callback, _ in connection.run_on_commit):
+        transaction.on_commit(_bump)
+
+
+# query parameters that do not change which planets are listed
+UNFILTERED_PARAMS = {'facets', 'page', 'page_size', 'cursor', 'ordering', 'format'}
+
+
+def filter_params(relation):
+    return f'{relation}__all', f'{relation}__any'
+
+
+def split_names(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def facet_counts(params, queryset, relations):
+    """
+    Facet counts of `relations` for the planets of the filtered `queryset`.
+
+    When the only filters are facet filters the candidates come from the
+    index alone; any other filter (population, search...) costs one query
+    for the ids of the filtered planets.
+    """
+    index = get_index()
+    facet_params = {param for relation in FACETS for param in filter_params(relation)}
+    other = [key for key, value in params.items() if value and key not in UNFILTERED_PARAMS | facet_params]
+    with instrumentation.timed('facets'):
+        if other:
+            planet_ids = list(queryset.order_by().values_list('id', flat=True))
+            candidates = bitmap(planet_ids, max(planet_ids, default=0))
+        else:
+            candidates = None
+            for relation in FACETS:
+                for param, require_all in zip(filter_params(relation), (True, False)):
+                    names = split_names(params.get(param, ''))
+                    if names:
+                        matched = index.match(relation, names, require_all)
+                        candidates = matched if candidates is None else candidates & matched
+        return {relation: index.counts(relation, candidates) for relation in relations}
+
+
+class PlanetFacetFilter(BaseFilterBackend):
+    """
+    `<relation>__all` / `<relation>__any` facet filters, comma separated names.
+    """
+    def filter_queryset(self, request, queryset, view):
+        conditions = []
+        for relation in FACETS:
+            for param, require_all in zip(filter_params(relation), (True, False)):
+                names = split_names(request.query_params.get(param, ''))
+                if names:
+                    conditions.append(self.condition(relation, names, require_all))
+        if not conditions:
+            return queryset
+        if None in conditions:
+            return queryset.none()
+        return queryset.filter(*conditions)
+
+    def condition(self, relation, names, require_all):
+        """
+        Q for the planets listing all/any of `names`, None when none can.
+        """
+        bits = get_index().bits[relation]
+        known = [name for name in names if name in bits]
+        if not known or (require_all and len(known) < len(names)):
+            return None
+        mask = sum(bits[name] for name in known if bits[name] is not None)
+        field = Planet._meta.get_field(relation)
+        # names past the 63 bits of a mask, through the join
+        conditions = [
+            Q(Exists(field.remote_field.through.objects.filter(
+                planet_id=OuterRef('pk'), **{f'{field.m2m_reverse_field_name()}__name': name}
+            )))
+            for name in known if bits[name] is None
+        ]
+        if mask:
+            masked = F(MASK_FIELDS[relation]).bitand(mask)
+            conditions.append(Q(Exact(masked, mask)) if require_all else Q(GreaterThan(masked, 0)))
+        return reduce(and_ if require_all else or_, conditions)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': param,
+                'required': False,
+                'in': 'query',
+                'description': f'Comma separated {relation}: planets listing {mode} of them.',
+                'schema': {'type': 'string'},
+            }
+            for relation in FACETS
+            for param, mode in zip(filter_params(relation), ('all', 'any'))
+        ]
@@ -0,0 +1,155 @@
+"""
+Batched planet ingestion.
+
+Replaces the per-planet get_or_create/.set() loop with a fixed number of
+set based queries: vocabulary lookups, one planet upsert and a bulk rewrite
+of the through tables, all inside a single transaction.
+"""
+import time
+
+from django.db import transaction
+
+from .masks import assign_bits
+from .models import Planet, Terrain, Climate
+from .signals import planets_bulk_changed
+
+# keep IN (...) lists well below SQLite's bound parameter limit
+CHUNK_SIZE = 500
+
+
+def chunked(values, size=CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def resolve_names(model, names, create_missing=True):
+    """
+    Map name -> id for Terrain/Climate, bulk creating the missing ones.
+    """
+    names = set(names)
+    resolved = {}
+    for chunk in chunked(names):
+        resolved.update(model.objects.filter(name__in=chunk).values_list('name', 'id'))
+    missing = names - resolved.keys()
+    if missing and create_missing:
+        model.objects.bulk_create([model(name=name) for name in sorted(missing)], ignore_conflicts=True)
+        # bulk_create skips post_save
+        assign_bits(model)
+        for chunk in chunked(missing):
+            resolved.update(model.objects.filter(name__in=chunk).values_list('name', 'id'))
+    return resolved
+
+
+def current_relations(relation, planet_ids):
+    """
+    Map planet id -> frozenset of related ids for `terrains` or `climates`.
+    """
+    field = Planet._meta.get_field(relation)
+    through = field.remote_field.through
+    target = f'{field.m2m_reverse_field_name()}_id'
+    related = {}
+    for chunk in chunked(planet_ids):
+        for planet_id, related_id in through.objects.filter(planet_id__in=chunk).values_list('planet_id', target):
+            related.setdefault(planet_id, set()).add(related_id)
+    return {planet_id: frozenset(ids) for planet_id, ids in related.items()}
+
+
+def rewrite_relations(relation, wanted):
+    """
+    Replace the through rows of every planet in `wanted` (planet id -> ids).
+    """
+    if not wanted:
+        return
+    field = Planet._meta.get_field(relation)
+    through = field.remote_field.through
+    target = f'{field.m2m_reverse_field_name()}_id'
+    for chunk in chunked(wanted):
+        through.objects.filter(planet_id__in=chunk).delete()
+    through.objects.bulk_create(
+        [through(planet_id=planet_id, **{target: related_id}) for planet_id, ids in wanted.items() for related_id in ids],
+        batch_size=CHUNK_SIZE,
+    )
+
+
+def normalize_population(value):
+    if value in (None, ''):
+        return None
+    return int(float(value))
+
+
+def ingest_planets(planets_data):
+    """
+    Upsert SWAPI style planet dicts (name, population, terrains, climates).
+
+    Empty terrain/climate lists leave the stored relations untouched, like the
+    previous get_or_create loop did. Returns created/updated/unchanged counts
+    and the wall time in milliseconds.
+    """
+    start = time.perf_counter()
+    incoming = {}
+    for planet in planets_data:
+        incoming[planet['name']] = {
+            'population': normalize_population(planet.get('population')),
+            'terrains': set(planet.get('terrains') or ()),
+            'climates': set(planet.get('climates') or ()),
+        }
+
+    created, updated, unchanged = [], [], []
+    with transaction.atomic():
+        terrain_ids = resolve_names(Terrain, {name for planet in incoming.values() for name in planet['terrains']})
+        climate_ids = resolve_names(Climate, {name for planet in incoming.values() for name in planet['climates']})
+        for planet in incoming.values():
+            planet['terrains'] = frozenset(terrain_ids[name] for name in planet['terrains'])
+            planet['climates'] = frozenset(climate_ids[name] for name in planet['climates'])
+
+        existing = {}
+        for chunk in chunked(incoming):
+            existing.update(
+                (name, (planet_id, population))
+                for name, planet_id, population in Planet.objects.filter(name__in=chunk).values_list('name', 'id', 'population')
+            )
+        existing_ids = [planet_id for planet_id, _ in existing.values()]
+        stored_terrains = current_relations('terrains', existing_ids)
+        stored_climates = current_relations('climates', existing_ids)
+
+        for name, planet in incoming.items():
+            if name not in existing:
+                created.append(name)
+                continue
+            planet_id, population = existing[name]
+            if (
+                population != planet['population']
+                or (planet['terrains'] and planet['terrains'] != stored_terrains.get(planet_id, frozenset()))
+                or (planet['climates'] and planet['climates'] != stored_climates.get(planet_id, frozenset()))
+            ):
+                updated.append(name)
+            else:
+                unchanged.append(name)
+
+        changed = created + updated
+        if changed:
+            Planet.objects.bulk_create(
+                [Planet(name=name, population=incoming[name]['population']) for name in changed],
+                update_conflicts=True,
+                unique_fields=['name'],
+                update_fields=['population', 'updated_at'],
+                batch_size=CHUNK_SIZE,
+            )
+            planet_ids = {name: planet_id for name, (planet_id, _) in existing.items()}
+            for chunk in chunked(created):
+                planet_ids.update(Planet.objects.filter(name__in=chunk).values_list('name', 'id'))
+            rewrite_relations('terrains', {
+                planet_ids[name]: incoming[name]['terrains'] for name in changed if incoming[name]['terrains']
+            })
+            rewrite_relations('climates', {
+                planet_ids[name]: incoming[name]['climates'] for name in changed if incoming[name]['climates']
+            })
+            planets_bulk_changed.send(sender=Planet, names=changed)
+
+    return {
+        'created': len(created),
+        'updated': len(updated),
+        'unchanged': len(unchanged),
+        'duration_ms': round((time.perf_counter() - start) * 1000, 2),
+    }
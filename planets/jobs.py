@@ -0,0 +1,120 @@
+"""
+Background SWAPI sync jobs.
+
+`start_sync()` records a PlanetSyncJob and hands it to a worker thread once
+the surrounding transaction commits; a sync that is already pending or
+running is returned instead of starting a second one.
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .ingest import ingest_planets
+from .models import PlanetSyncJob
+from .services import fetch_planets_service
+
+logger = logging.getLogger(__name__)
+
+_start_lock = threading.Lock()
+
+
+def _run_async():
+    return getattr(settings, 'PLANET_SYNC_ASYNC', True)
+
+
+def _stale_after():
+    return timedelta(seconds=getattr(settings, 'PLANET_SYNC_STALE_AFTER', 10 * 60))
+
+
+def job_status(job):
+    """
+    JSON friendly view of a job for the status endpoints.
+    """
+    end = job.finished_at or (timezone.now() if job.started_at else None)
+    return {
+        'job_id': job.pk,
+        'status': job.status,
+        'stage': job.stage,
+        'total': job.total,
+        'created': job.created,
+        'updated': job.updated,
+        'unchanged': job.unchanged,
+        'error': job.error or None,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+        'duration_ms': round((end - job.started_at).total_seconds() * 1000, 2) if job.started_at else None,
+    }
+
+
+def _expire_stale_job():
+    # a worker that died mid-run must not block every later sync
+    PlanetSyncJob.objects.filter(active=True, created_at__lt=timezone.now() - _stale_after()).update(
+        active=False, status=PlanetSyncJob.STATUS_FAILED, stage='abandoned',
+        error='Job did not finish in time', finished_at=timezone.now(),
+    )
+
+
+def start_sync():
+    """
+    Return `(job, started)`; `started` is False when an active job was reused.
+    """
+    with _start_lock:
+        _expire_stale_job()
+        job = PlanetSyncJob.objects.filter(active=True).first()
+        if job is not None:
+            return job, False
+        try:
+            with transaction.atomic():
+                job = PlanetSyncJob.objects.create()
+        except IntegrityError:
+            # another process won the race, share its run
+            return PlanetSyncJob.objects.get(active=True), False
+    transaction.on_commit(lambda: dispatch(job.pk))
+    return job, True
+
+
+def dispatch(job_id):
+    if _run_async():
+        threading.Thread(target=_run_in_thread, args=(job_id,), name=f'planet-sync-{job_id}', daemon=True).start()
+    else:
+        run_sync(job_id)
+
+
+def _run_in_thread(job_id):
+    close_old_connections()
+    try:
+        run_sync(job_id)
+    finally:
+        connection.close()
+
+
+def _update(job_id, **fields):
+    PlanetSyncJob.objects.filter(pk=job_id).update(**fields)
+
+
+def run_sync(job_id):
+    """
+    Fetch planets from SWAPI and ingest them, recording progress on the job.
+    """
+    _update(job_id, status=PlanetSyncJob.STATUS_RUNNING, stage='fetching', started_at=timezone.now())
+    try:
+        planets_data = fetch_planets_service()
+        _update(job_id, stage='ingesting', total=len(planets_data))
+        result = ingest_planets(planets_data)
+    except Exception as exc:
+        logger.exception('Planet sync job %s failed', job_id)
+        _update(
+            job_id, status=PlanetSyncJob.STATUS_FAILED, stage='failed', active=False,
+            error=str(exc) or exc.__class__.__name__, finished_at=timezone.now(),
+        )
+        return
+    _update(
+        job_id, status=PlanetSyncJob.STATUS_SUCCEEDED, stage='done', active=False,
+        created=result['created'], updated=result['updated'], unchanged=result['unchanged'],
+        finished_at=timezone.now(),
+    )
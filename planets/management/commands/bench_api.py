@@ -0,0 +1,286 @@
+import gc
+import itertools
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from io import StringIO
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from planets import search
+from planets.models import Planet
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'api_baseline.json'
+
+PASSWORD = 'bench-password'
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the REST API hot paths with the in-process test client on synthetic data (rolled back '
+        'afterwards): p50/p95/p99 latency, queries and allocations per request, compared with a stored baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30, help='timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--only', help='run the scenarios whose name contains this text')
+        parser.add_argument('--planets', type=int, default=500)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--output', help='write the results as JSON to this file')
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help='results JSON to compare with')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='store this run as the baseline; with --only, update just those scenarios')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='allowed relative slowdown (latency, allocations) before the run fails')
+        parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                            help='latency changes smaller than this are noise, whatever the ratio')
+        parser.add_argument('--metric', choices=['p50', 'p95', 'p99'], default='p50',
+                            help='latency percentile compared with the baseline')
+
+    def handle(self, *args, **options):
+        # the list scenarios measure the query path, `planet list cached` the list response cache
+        settings_overrides = {'DEBUG': False, 'ALLOWED_HOSTS': ['testserver'], 'PLANET_LIST_CACHE_TIMEOUT': 0}
+        with override_settings(**settings_overrides), transaction.atomic():
+            self.setup_data(options)
+            results = self.run(options)
+            transaction.set_rollback(True)
+        cache.clear()
+
+        report = {'meta': self.meta(options), 'results': results}
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, indent=2) + '\n')
+            self.stdout.write(f'results written to {options["output"]}')
+
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            self.save_baseline(report, baseline_path, options)
+        elif baseline_path.exists():
+            self.compare(report, json.loads(baseline_path.read_text()), options)
+        else:
+            self.stdout.write(f'no baseline at {baseline_path}, run with --save-baseline to create one')
+
+    # data and scenarios
+
+    def setup_data(self, options):
+        call_command(
+            'generate_synthetic', planets=options['planets'], users=options['users'],
+            books=options['users'] * 4, avg_friends=20, avg_books=20, prefix='bench', seed=1, stdout=StringIO(),
+        )
+        # search documents are refreshed on commit, which never comes here
+        search.refresh(Planet.objects.values_list('pk', flat=True))
+        User = get_user_model()
+        self.user = User.objects.create_user(username='bench', password=PASSWORD)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.planet = Planet.objects.filter(name__startswith='bench-planet-').order_by('name').first()
+        self.reader = 'bench-user-00000001'
+
+    def scenarios(self):
+        filters = ['', 'name__icontains=00001', 'population__gte=1000000', 'created_at__gte=2000-01-01T00:00:00Z']
+        searches = ['', 'search=terrain-0001']
+        orderings = ['', 'ordering=name', 'ordering=-created_at', 'ordering=updated_at']
+        for query in itertools.product(filters, searches, orderings):
+            query = '&'.join(part for part in query if part)
+            yield {'name': f'planet list ?{query}', 'path': f'/api/v1/planets/?{query}'}
+        yield {'name': 'planet list cursor', 'path': '/api/v1/planets/?cursor=&ordering=-updated_at'}
+        yield {'name': 'planet list 304', 'path': '/api/v1/planets/', 'etag': True, 'expect': 304}
+        yield {
+            'name': 'planet list cached', 'path': '/api/v1/planets/?climates__name=bench-climate-0001&ordering=name',
+            'settings': {'PLANET_LIST_CACHE_TIMEOUT': 60},
+        }
+        yield {'name': 'planet list facets', 'path': '/api/v1/planets/?facets=terrains,climates'}
+        yield {
+            'name': 'planet list facet filter',
+            'path': '/api/v1/planets/?terrains__any=bench-terrain-0001,bench-terrain-0002&facets=climates',
+        }
+
+        detail = f'/api/v1/planets/{self.planet.name}/'
+        yield {'name': 'planet detail', 'path': detail}
+        yield {'name': 'planet detail cold cache', 'path': detail, 'before': cache.clear}
+        yield {
+            'name': 'planet create', 'method': 'post', 'path': '/api/v1/planets/', 'expect': 201,
+            'data': lambda n: {'name': f'bench-new-{n}', 'population': n, 'terrains': ['bench-terrain-0000'],
+                               'climates': ['bench-climate-0000']},
+        }
+        yield {
+            'name': 'planet update', 'method': 'put', 'path': detail,
+            'data': lambda n: {'name': self.planet.name, 'population': n, 'terrains': ['bench-terrain-0001'],
+                               'climates': ['bench-climate-0001']},
+        }
+
+        network = f'/api/v1/goodreads/{self.reader}'
+        yield {'name': 'network_books', 'path': f'{network}/network_books/'}
+        yield {'name': 'network_books depth 2', 'path': f'{network}/network_books/?depth=2'}
+        yield {'name': 'recommendations', 'path': f'{network}/recommendations/?depth=2&limit=10'}
+        # password hashing dominates, a few requests are enough
+        yield {
+            'name': 'token', 'method': 'post', 'path': '/auth/token/', 'iterations': 5, 'anonymous': True,
+            'data': lambda n: {'username': 'bench', 'password': PASSWORD},
+        }
+
+    def request(self, scenario, n):
+        client = APIClient() if scenario.get('anonymous') else self.client
+        data = scenario['data'](n) if 'data' in scenario else None
+        if 'before' in scenario:
+            scenario['before']()
+        method = getattr(client, scenario.get('method', 'get'))
+        with override_settings(**scenario.get('settings', {})):
+            start = time.perf_counter()
+            response = method(scenario['path'], data, format='json', **scenario.get('headers', {}))
+            elapsed = time.perf_counter() - start
+        if response.status_code != scenario.get('expect', 200):
+            raise CommandError(f'{scenario["name"]}: unexpected status {response.status_code}: {response.content[:200]!r}')
+        return response, elapsed
+
+    def run(self, options):
+        results = {}
+        counter = itertools.count()
+        for scenario in self.scenarios():
+            if options['only'] and options['only'] not in scenario['name']:
+                continue
+            if scenario.get('etag'):
+                etag = self.client.get(scenario['path'])['ETag']
+                scenario['headers'] = {'HTTP_IF_NONE_MATCH': etag}
+            iterations = min(options['iterations'], scenario.get('iterations', options['iterations']))
+            for _ in range(min(options['warmup'], iterations)):
+                self.request(scenario, next(counter))
+
+            timings = []
+            for _ in range(iterations):
+                response, elapsed = self.request(scenario, next(counter))
+                timings.append(elapsed * 1000)
+
+            # instrumented pass, kept out of the timings
+            queries, allocations = [], []
+            for _ in range(min(3, iterations)):
+                gc.collect()
+                tracemalloc.start()
+                with CaptureQueriesContext(connection) as captured:
+                    self.request(scenario, next(counter))
+                allocations.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+                queries.append(len(captured))
+
+            results[scenario['name']] = result = self.summarize(timings)
+            result.update(
+                queries=max(queries),
+                alloc_kb=round(min(allocations) / 1024, 1),
+                bytes=len(response.content),
+            )
+            self.stdout.write(
+                f'{scenario["name"]:<72} p50 {result["p50_ms"]:8.2f}  p95 {result["p95_ms"]:8.2f}  '
+                f'p99 {result["p99_ms"]:8.2f} ms  {result["queries"]:3d} queries  {result["alloc_kb"]:9.1f} KiB'
+            )
+        return results
+
+    def summarize(self, timings):
+        if len(timings) > 1:
+            cuts = statistics.quantiles(timings, n=100, method='inclusive')
+            p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+        else:
+            p50 = p95 = p99 = timings[0]
+        return {
+            'iterations': len(timings),
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'p50_ms': round(p50, 3),
+            'p95_ms': round(p95, 3),
+            'p99_ms': round(p99, 3),
+        }
+
+    def calibrate(self):
+        # fixed CPU bound workload, best of 5: lets a baseline recorded on another
+        # (or a busier) machine be scaled before comparing latencies
+        timings = []
+        for _ in range(5):
+            start = time.perf_counter()
+            json.dumps([{'id': index, 'name': str(index) * 3} for index in range(20000)])
+            timings.append(time.perf_counter() - start)
+        return round(min(timings) * 1000, 3)
+
+    def meta(self, options):
+        return {
+            'calibration_ms': self.calibrate(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': f'{connection.vendor} {connection.Database.sqlite_version if connection.vendor == "sqlite" else ""}'.strip(),
+            'machine': platform.machine(),
+            'planets': options['planets'],
+            'users': options['users'],
+            'iterations': options['iterations'],
+        }
+
+    # regression tracking
+
+    def save_baseline(self, report, path, options):
+        """
+        With --only, update just the scenarios that ran in the existing baseline,
+        their latencies scaled to its calibration; otherwise replace it. Either
+        way, list the accepted changes for the commit message.
+        """
+        baseline = json.loads(path.read_text()) if path.exists() else None
+        metric = f'{options["metric"]}_ms'
+        # previous latencies in the units of the file being written
+        scale = 1.0
+        if baseline and options['only']:
+            speed = report['meta']['calibration_ms'] / baseline['meta']['calibration_ms']
+            results = {
+                name: {key: round(value / speed, 3) if key.endswith('_ms') else value for key, value in result.items()}
+                for name, result in report['results'].items()
+            }
+            updated = {'meta': baseline['meta'], 'results': {**baseline['results'], **results}}
+        else:
+            updated = report
+            if baseline:
+                scale = report['meta']['calibration_ms'] / baseline['meta']['calibration_ms']
+        for name in report['results']:
+            result, before = updated['results'][name], (baseline or {'results': {}})['results'].get(name)
+            if before is None:
+                self.stdout.write(
+                    f'  new      {name}: {result[metric]:.2f} ms, {result["queries"]} queries, {result["alloc_kb"]} KiB'
+                )
+                continue
+            previous = before[metric] * scale
+            self.stdout.write(
+                f'  accepted {name}: {options["metric"]} {previous:.2f} -> {result[metric]:.2f} ms '
+                f'({result[metric] / previous - 1:+.0%}), queries {before["queries"]} -> {result["queries"]}, '
+                f'allocations {before["alloc_kb"]} -> {result["alloc_kb"]} KiB'
+            )
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(updated, indent=2) + '\n')
+        self.stdout.write(self.style.SUCCESS(f'baseline saved to {path}'))
+
+    def compare(self, report, baseline, options):
+        metric, threshold = f'{options["metric"]}_ms', options['threshold']
+        if baseline.get('meta', {}).get('python') != report['meta']['python']:
+            self.stdout.write(self.style.WARNING('baseline was recorded with another Python version'))
+        # > 1 when this machine is slower than the one that recorded the baseline
+        speed = report['meta']['calibration_ms'] / baseline['meta'].get('calibration_ms', report['meta']['calibration_ms'])
+        regressions = []
+        for name, result in report['results'].items():
+            before = baseline['results'].get(name)
+            if before is None:
+                continue
+            expected = before[metric] * speed
+            slower = result[metric] - expected
+            if slower > expected * threshold and slower > options['min_delta_ms']:
+                regressions.append(f'{name}: {options["metric"]} {expected:.2f} -> {result[metric]:.2f} ms')
+            # query counts are deterministic, any increase is a regression
+            if result['queries'] > before['queries']:
+                regressions.append(f'{name}: queries {before["queries"]} -> {result["queries"]}')
+            if result['alloc_kb'] > before['alloc_kb'] * (1 + threshold):
+                regressions.append(f'{name}: allocations {before["alloc_kb"]} -> {result["alloc_kb"]} KiB')
+        if regressions:
+            raise CommandError('performance regressions against the baseline:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS(f'no regression beyond {threshold:.0%} against the baseline'))
@@ -0,0 +1,163 @@
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from importlib.util import find_spec
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from goodreads.models import GoodreadsAccount
+from planets.models import Planet
+
+# scenario -> (DRF path, async-native path), formatted with a planet name / username
+SCENARIOS = {
+    'planet list': ('/api/v1/planets/?page_size=20', '/api/v1/async/planets/?page_size=20'),
+    'planet detail': ('/api/v1/planets/{planet}/', '/api/v1/async/planets/{planet}/'),
+    'network_books': ('/api/v1/goodreads/{user}/network_books/', '/api/v1/async/goodreads/{user}/network_books/'),
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test the read endpoints over real HTTP at several concurrency levels: the DRF views under a WSGI '
+        'server, the same views under uvicorn (ASGI) and the async-native /api/v1/async/ views under uvicorn. '
+        'Reads the configured database, populate it first with generate_synthetic.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, action='append', help='concurrent clients, repeatable')
+        parser.add_argument('--requests', type=int, default=300, help='requests per scenario and concurrency level')
+        parser.add_argument('--only', help='run the scenarios whose name contains this text')
+        parser.add_argument('--wsgi-server', choices=['gunicorn', 'runserver'],
+                            help='default: gunicorn when installed, else the threaded development server')
+        parser.add_argument('--workers', type=int, default=1, help='server processes (gunicorn/uvicorn workers)')
+        parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+
+    def handle(self, *args, **options):
+        if find_spec('uvicorn') is None:
+            raise CommandError('uvicorn is not installed: pip install uvicorn')
+        planet = Planet.objects.order_by('id').values_list('name', flat=True).first()
+        user = GoodreadsAccount.objects.order_by('pk').values_list('user__username', flat=True).first()
+        if planet is None or user is None:
+            raise CommandError('no planets or goodreads accounts, run generate_synthetic first')
+        names = {'planet': quote(planet), 'user': quote(user)}
+        scenarios = {
+            name: tuple(path.format(**names) for path in paths)
+            for name, paths in SCENARIOS.items() if not options['only'] or options['only'] in name
+        }
+        levels = options['concurrency'] or [1, 8, 32]
+        wsgi_server = options['wsgi_server'] or ('gunicorn' if find_spec('gunicorn') else 'runserver')
+
+        targets = (
+            (f'wsgi ({wsgi_server})', self.wsgi_command(wsgi_server, options), 0),
+            ('asgi (uvicorn), DRF views', self.asgi_command(options), 0),
+            ('asgi (uvicorn), async views', self.asgi_command(options), 1),
+        )
+        self.stdout.write(f'{"target":<30} {"scenario":<15} {"clients":>7} {"req/s":>9} {"p50 ms":>9} '
+                          f'{"p95 ms":>9} {"p99 ms":>9} {"errors":>7}')
+        for label, command, variant in targets:
+            port = free_port()
+            with self.server(command(port), port):
+                for scenario, paths in scenarios.items():
+                    for clients in levels:
+                        result = asyncio.run(self.load(port, paths[variant], clients, options['requests']))
+                        self.stdout.write(
+                            f'{label:<30} {scenario:<15} {clients:>7} {result["rps"]:>9.1f} {result["p50"]:>9.2f} '
+                            f'{result["p95"]:>9.2f} {result["p99"]:>9.2f} {result["errors"]:>7}'
+                        )
+
+    # servers
+
+    def wsgi_command(self, server, options):
+        if server == 'gunicorn':
+            return lambda port: [
+                sys.executable, '-m', 'gunicorn', 'planetarium_api.wsgi:application', '--bind', f'127.0.0.1:{port}',
+                '--workers', str(options['workers']), '--threads', str(options['threads']), '--log-level', 'warning',
+            ]
+        return lambda port: [
+            sys.executable, str(settings.BASE_DIR / 'manage.py'), 'runserver', '--noreload', f'127.0.0.1:{port}',
+        ]
+
+    def asgi_command(self, options):
+        return lambda port: [
+            sys.executable, '-m', 'uvicorn', 'planetarium_api.asgi:application', '--port', str(port),
+            '--workers', str(options['workers']), '--log-level', 'warning', '--no-access-log',
+        ]
+
+    @contextmanager
+    def server(self, command, port):
+        process = subprocess.Popen(
+            command, cwd=settings.BASE_DIR, env=os.environ.copy(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            self.wait_for(port, process)
+            yield process
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+
+    def wait_for(self, port, process, timeout=20):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f'server exited with status {process.returncode}')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        raise CommandError(f'server did not listen on port {port} within {timeout}s')
+
+    # load
+
+    async def request(self, port, path):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        try:
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n'.encode())
+            await writer.drain()
+            response = await reader.read()
+        finally:
+            writer.close()
+        return int(response.split(b' ', 2)[1])
+
+    async def load(self, port, path, clients, total):
+        # one warm-up request fills caches and opens the DB connection
+        await self.request(port, path)
+        remaining = iter(range(total))
+        latencies, errors = [], 0
+
+        async def client():
+            nonlocal errors
+            for _ in remaining:
+                started = time.perf_counter()
+                try:
+                    status = await self.request(port, path)
+                except (OSError, ValueError, IndexError):
+                    status = None
+                latencies.append(time.perf_counter() - started)
+                if status != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+        quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        return {
+            'rps': len(latencies) / elapsed,
+            'p50': quantiles[49] * 1000,
+            'p95': quantiles[94] * 1000,
+            'p99': quantiles[98] * 1000,
+            'errors': errors,
+        }
@@ -0,0 +1,71 @@
+import statistics
+import time
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.filters import SearchFilter
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from planets import search
+from planets.api_views import PlanetViewSet
+from planets.models import Planet
+from planets.serializers import PlanetReadSerializer
+
+QUERIES = ['terrain-0001', 'climate-0003 terrain-0002', 'planet-000012', 'bench']
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare ?search= through the full-text index with the icontains SearchFilter it replaced, '
+        'on synthetic planets (rolled back afterwards)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--planets', type=int, default=20000)
+        parser.add_argument('--repeat', type=int, default=5, help='median of N runs is reported')
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--query', action='append', help='search text, repeatable')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            call_command(
+                'generate_synthetic', planets=options['planets'], users=0, books=0, prefix='bench', seed=1,
+                skip_index=True, stdout=StringIO(),
+            )
+            # documents are refreshed on commit, which never comes here
+            search.refresh(Planet.objects.values_list('pk', flat=True))
+            for text in options['query'] or QUERIES:
+                self.compare(text, options)
+            transaction.set_rollback(True)
+
+    def compare(self, text, options):
+        request = Request(APIRequestFactory().get('/api/v1/planets/', {'search': text}))
+        view = PlanetViewSet(request=request, format_kwarg=None)
+        results = {}
+        for label, backend in (('icontains', SearchFilter()), ('fts', search.PlanetSearchFilter())):
+            def page():
+                queryset = backend.filter_queryset(request, view.get_queryset(), view)
+                queryset = search.PlanetOrderingFilter().filter_queryset(request, queryset, view)
+                rows = queryset.prefetch_related(None).values(*PlanetReadSerializer.value_fields)
+                return rows.count(), PlanetReadSerializer(rows[:options['page_size']], many=True).data
+
+            with CaptureQueriesContext(connection) as queries:
+                count, _ = page()
+            results[label] = count, self.median(options['repeat'], page), len(queries)
+        (old_count, old, old_queries), (new_count, new, new_queries) = results['icontains'], results['fts']
+        self.stdout.write(
+            f'{text!r:<30} icontains {old * 1000:9.2f} ms {old_count:>7} hits {old_queries} queries  '
+            f'fts {new * 1000:9.2f} ms {new_count:>7} hits {new_queries} queries  speedup x{old / new:.1f}'
+        )
+
+    def median(self, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings)
@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Prefetch
+from planets.models import Planet, Terrain, Climate
+from planets.serializers import PlanetSerializer, PlanetReadSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare PlanetSerializer with PlanetReadSerializer on 10/100/1000 planets (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--repeat', type=int, default=5, help='best of N runs is reported')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            terrains = Terrain.objects.bulk_create([Terrain(name=f'bench-terrain-{i}') for i in range(8)])
+            climates = Climate.objects.bulk_create([Climate(name=f'bench-climate-{i}') for i in range(5)])
+            created = 0
+            for rows in sorted(options['rows']):
+                created = self.fill(created, rows, terrains, climates)
+                queryset = Planet.objects.filter(name__startswith='bench-planet-').order_by('id')[:rows]
+                slow = self.best_of(options['repeat'], lambda: PlanetSerializer(
+                    queryset.prefetch_related(
+                        Prefetch('terrains', queryset=Terrain.objects.only('name')),
+                        Prefetch('climates', queryset=Climate.objects.only('name')),
+                    ),
+                    many=True,
+                ).data)
+                fast = self.best_of(options['repeat'], lambda: PlanetReadSerializer(
+                    queryset.values(*PlanetReadSerializer.value_fields), many=True
+                ).data)
+                self.stdout.write(
+                    f'{rows:>6} rows  PlanetSerializer {slow * 1000:8.2f} ms  '
+                    f'PlanetReadSerializer {fast * 1000:8.2f} ms  speedup x{slow / fast:.1f}'
+                )
+            transaction.set_rollback(True)
+
+    def fill(self, created, rows, terrains, climates):
+        planets = Planet.objects.bulk_create([
+            Planet(name=f'bench-planet-{i:06d}', population=i * 1000) for i in range(created, rows)
+        ])
+        Planet.terrains.through.objects.bulk_create([
+            Planet.terrains.through(planet_id=planet.pk, terrain_id=terrains[(planet.pk + k) % len(terrains)].pk)
+            for planet in planets for k in range(2)
+        ])
+        Planet.climates.through.objects.bulk_create([
+            Planet.climates.through(planet_id=planet.pk, climate_id=climates[planet.pk % len(climates)].pk)
+            for planet in planets
+        ])
+        return max(created, rows)
+
+    def best_of(self, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
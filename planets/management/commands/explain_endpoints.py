@@ -0,0 +1,116 @@
+import re
+from itertools import combinations
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from goodreads.models import Friend, GoodreadsAccount, NetworkBook, UserBook
+from planets.api_views import PlanetViewSet
+from planets.filters import PlanetFilter
+from planets.models import Planet
+
+# filter value per model field, mask filters (terrains/climates names) take a vocabulary name
+SAMPLE_VALUES = {
+    'name': 'Earth',
+    'population': '1000000',
+    'created_at': '2024-01-01T00:00:00Z',
+    'updated_at': '2024-01-01T00:00:00Z',
+}
+MASK_SAMPLE = 'arid'
+ORDERINGS = ('', 'name', '-name', 'created_at', '-created_at', 'updated_at', '-updated_at')
+TEMP_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+
+def plan_details(queryset):
+    # SQLite rows are "<id> <parent> <notused> <detail>"
+    return [line.split(' ', 3)[-1] for line in queryset.explain().splitlines()]
+
+
+def scans(details, table):
+    return any(re.fullmatch(rf'SCAN {table}( USING .*)?', detail) for detail in details)
+
+
+class Command(BaseCommand):
+    help = (
+        'EXPLAIN QUERY PLAN of the planet list queries (count and one page per ordering) for every combination of '
+        'PlanetFilter filters, up to --depth filters at a time, and of the goodreads lookups by account/book. '
+        'Flags counts scanning the whole table and pages read by a full scan then sorted. Filters no index can '
+        'answer (name__icontains, the terrains/climates masks) are reported as expected scans.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--depth', type=int, default=2, help='filters combined per query')
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--fail', action='store_true', help='exit with an error when a query is flagged')
+
+    def handle(self, *args, **options):
+        self.flagged = self.expected = self.total = 0
+        self.verbose = options['verbosity'] > 1
+        filters = PlanetFilter.base_filters
+        table = Planet._meta.db_table
+        for size in range(options['depth'] + 1):
+            for names in combinations(filters, size):
+                params = {name: self.sample_value(filters[name]) for name in names}
+                indexable = any(not self.unindexable(filters[name]) for name in names)
+                expected = bool(names) and not indexable
+                label = f'planets {", ".join(names) or "(no filter)"}'
+                # the list's COUNT/MAX(updated_at) reads every matching row
+                details = plan_details(self.planet_queryset(params).order_by().values('id', 'updated_at'))
+                self.report(f'{label} count', details, ['full scan'] if scans(details, table) and names else [], expected)
+                for ordering in ORDERINGS:
+                    queryset = self.planet_queryset({**params, **({'ordering': ordering} if ordering else {})})
+                    details = plan_details(queryset[:options['page_size']])
+                    # a scan in the requested order stops at the page size, a scan then sort reads every row
+                    problems = ['full scan and sort'] if scans(details, table) and TEMP_SORT in details else []
+                    self.report(f'{label} page ordering={ordering or "id"}', details, problems, expected)
+
+        for label, queryset in self.goodreads_queries().items():
+            details = plan_details(queryset)
+            self.report(label, details, ['full scan'] if scans(details, queryset.model._meta.db_table) else [])
+
+        self.stdout.write(
+            f'{self.total} queries, {self.flagged} flagged, {self.expected} scans expected from unindexable filters'
+        )
+        if options['fail'] and self.flagged:
+            raise CommandError(f'{self.flagged} queries flagged')
+
+    def report(self, label, details, problems, expected=False):
+        self.total += 1
+        if problems and expected:
+            self.expected += 1
+            status = 'expected'
+        elif problems:
+            self.flagged += 1
+            status = 'FLAGGED'
+        else:
+            status = 'ok'
+        if status == 'FLAGGED' or self.verbose:
+            suffix = f' ({", ".join(problems)})' if problems else ''
+            self.stdout.write(f'{status:<9}{label}{suffix}')
+            for detail in details:
+                self.stdout.write(f'           {detail}')
+
+    def unindexable(self, filter_):
+        return filter_.method is not None or filter_.lookup_expr == 'icontains'
+
+    def sample_value(self, filter_):
+        return MASK_SAMPLE if filter_.method is not None else SAMPLE_VALUES[filter_.field_name]
+
+    def planet_queryset(self, params):
+        # the list endpoint's own filtering and ordering
+        request = Request(APIRequestFactory().get('/api/v1/planets/', params))
+        view = PlanetViewSet(request=request, format_kwarg=None, action='list', args=(), kwargs={})
+        return view.get_read_queryset()
+
+    def goodreads_queries(self):
+        account = GoodreadsAccount.objects.values_list('pk', flat=True).first() or 0
+        book = UserBook.objects.values_list('book_id', flat=True).first() or 0
+        return {
+            'goodreads friends of an account': Friend.objects.filter(user_id=account),
+            'goodreads accounts befriending an account': Friend.objects.filter(friend_id=account),
+            'goodreads friendship lookup': Friend.objects.filter(user_id=account, friend_id=account),
+            'goodreads books of an account': UserBook.objects.filter(goodreads_account_id=account),
+            'goodreads owners of a book': UserBook.objects.filter(book_id=book),
+            'goodreads network books of an account': NetworkBook.objects.filter(goodreads_account_id=account),
+        }
@@ -0,0 +1,251 @@
+import random
+import time
+from array import array
+from itertools import accumulate, islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+
+from goodreads import network
+from goodreads.models import Book, Friend, GoodreadsAccount, NetworkBook, UserBook
+from planets import cache as planet_cache
+from planets import facets, search
+from planets.masks import assign_bits, refresh_masks
+from planets.models import Planet, Terrain, Climate
+
+User = get_user_model()
+
+# Pareto shape of the per row degree (friends per user, books per user, ...):
+# most rows get a few, a long tail gets hundreds
+DEGREE_SHAPE = 2.0
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a large synthetic dataset (planets, users, power-law friend graph, owned books) '
+        'with chunked bulk_create, reporting rows/sec per table. The friend graph is directed on purpose: '
+        'one Friend row per friend an account picks, without the mirror row friends.add() writes, so '
+        'account.friends lists its picks and popular accounts do not become friends of nearly everyone'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--planets', type=int, default=10000)
+        parser.add_argument('--terrains', type=int, default=50)
+        parser.add_argument('--climates', type=int, default=20)
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--books', type=int, default=50000)
+        parser.add_argument('--avg-friends', type=int, default=20, help='average friends picked per account (directed)')
+        parser.add_argument('--avg-books', type=int, default=50)
+        parser.add_argument('--skew', type=float, default=1.0, help='zipf exponent of friend/book popularity')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='syn', help='name prefix of every generated row')
+        parser.add_argument('--flush', action='store_true', help='delete rows generated with the same prefix first')
+        parser.add_argument('--skip-index', action='store_true', help='do not rebuild the network books index')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = options['prefix']
+        self.totals = [0, 0.0]
+        if options['flush']:
+            self.flush_data()
+        elif self.generated_rows_exist(options):
+            raise CommandError(self.existing_rows_message())
+
+        try:
+            if options['planets']:
+                self.generate_planets(options)
+            if options['users']:
+                self.generate_goodreads(options)
+        except IntegrityError as exc:
+            raise CommandError(f'{self.existing_rows_message()} ({exc})') from exc
+
+        rows, seconds = self.totals
+        self.stdout.write(self.style.SUCCESS(
+            f'{"total":<16}{rows:>12} rows {seconds:9.2f} s {rows / seconds if seconds else 0:12.0f} rows/s'
+        ))
+
+    # helpers
+
+    def report(self, label, rows, seconds):
+        self.totals[0] += rows
+        self.totals[1] += seconds
+        self.stdout.write(f'{label:<16}{rows:>12} rows {seconds:9.2f} s {rows / seconds if seconds else 0:12.0f} rows/s')
+
+    def insert(self, label, model, rows):
+        """
+        bulk_create a (lazy) iterable of instances, `batch_size` at a time.
+        """
+        start = time.perf_counter()
+        total = 0
+        rows = iter(rows)
+        with transaction.atomic():
+            while True:
+                batch = list(islice(rows, self.batch_size))
+                if not batch:
+                    break
+                model.objects.bulk_create(batch)
+                total += len(batch)
+        self.report(label, total, time.perf_counter() - start)
+
+    def ids(self, queryset):
+        # compact int array: 8 bytes per row, whatever the row count
+        return array('q', queryset.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=self.batch_size))
+
+    def degree(self, average, cap):
+        scale = average * (DEGREE_SHAPE - 1) / DEGREE_SHAPE
+        return min(cap, round(self.rng.paretovariate(DEGREE_SHAPE) * scale))
+
+    def popularity(self, size, skew):
+        # cumulative zipf weights: index 0 is the most popular row
+        return list(accumulate(1 / (rank + 1) ** skew for rank in range(size)))
+
+    def pick(self, population, cum_weights, count, exclude=None):
+        picked = set(self.rng.choices(population, cum_weights=cum_weights, k=count))
+        picked.discard(exclude)
+        return picked
+
+    def raw_delete(self, queryset):
+        """
+        One DELETE for the rows of `queryset`, no collector and no signals.
+        """
+        meta = queryset.model._meta
+        sql, params = queryset.values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {connection.ops.quote_name(meta.db_table)} '
+                f'WHERE {connection.ops.quote_name(meta.pk.column)} IN ({sql})',
+                params,
+            )
+            return cursor.rowcount
+
+    def generated_rows_exist(self, options):
+        named = f'{self.prefix}-'
+        querysets = []
+        if options['planets']:
+            querysets += [model.objects.filter(name__startswith=named) for model in (Planet, Terrain, Climate)]
+        if options['users']:
+            querysets += [User.objects.filter(username__startswith=named), Book.objects.filter(name__startswith=named)]
+        return any(queryset.exists() for queryset in querysets)
+
+    def existing_rows_message(self):
+        return (
+            f"rows named '{self.prefix}-...' exist already: pass --flush to replace them, "
+            "or another --prefix"
+        )
+
+    def flush_data(self):
+        start = time.perf_counter()
+        deleted = 0
+        users = User.objects.filter(username__startswith=f'{self.prefix}-')
+        books = Book.objects.filter(name__startswith=f'{self.prefix}-')
+        with transaction.atomic():
+            # set based deletes of the link tables first: going through the collector
+            # would send post_delete (and update the network books index) row by row.
+            # The index is rebuilt once the new rows are in.
+            for queryset in (
+                NetworkBook.objects.filter(Q(goodreads_account__user__in=users) | Q(book__in=books)),
+                Friend.objects.filter(Q(user__user__in=users) | Q(friend__user__in=users)),
+                UserBook.objects.filter(Q(goodreads_account__user__in=users) | Q(book__in=books)),
+            ):
+                deleted += self.raw_delete(queryset)
+            for queryset in (
+                users,
+                books,
+                Planet.objects.filter(name__startswith=f'{self.prefix}-'),
+                Terrain.objects.filter(name__startswith=f'{self.prefix}-'),
+                Climate.objects.filter(name__startswith=f'{self.prefix}-'),
+            ):
+                deleted += queryset.delete()[0]
+        self.stdout.write(f'{"flush":<16}{deleted:>12} rows {time.perf_counter() - start:9.2f} s')
+
+    # planets
+
+    def generate_planets(self, options):
+        prefix = self.prefix
+        self.insert('terrains', Terrain, (Terrain(name=f'{prefix}-terrain-{i:04d}') for i in range(options['terrains'])))
+        self.insert('climates', Climate, (Climate(name=f'{prefix}-climate-{i:04d}') for i in range(options['climates'])))
+        assign_bits(Terrain)
+        assign_bits(Climate)
+        terrain_ids = list(Terrain.objects.filter(name__startswith=f'{prefix}-').values_list('pk', flat=True))
+        climate_ids = list(Climate.objects.filter(name__startswith=f'{prefix}-').values_list('pk', flat=True))
+        terrain_weights = self.popularity(len(terrain_ids), options['skew'])
+        climate_weights = self.popularity(len(climate_ids), options['skew'])
+
+        start = time.perf_counter()
+        planets = relations = 0
+        TerrainThrough, ClimateThrough = Planet.terrains.through, Planet.climates.through
+        for offset in range(0, options['planets'], self.batch_size):
+            names = [f'{prefix}-planet-{i:08d}' for i in range(offset, min(offset + self.batch_size, options['planets']))]
+            with transaction.atomic():
+                Planet.objects.bulk_create([
+                    Planet(name=name, population=self.rng.randrange(10 ** self.rng.randint(0, 11))) for name in names
+                ])
+                planet_ids = self.ids(Planet.objects.filter(name__gte=names[0], name__lte=names[-1]))
+                terrains = [
+                    TerrainThrough(planet_id=planet_id, terrain_id=terrain_id)
+                    for planet_id in planet_ids
+                    for terrain_id in self.pick(terrain_ids, terrain_weights, self.rng.randint(1, 3))
+                ]
+                climates = [
+                    ClimateThrough(planet_id=planet_id, climate_id=climate_id)
+                    for planet_id in planet_ids
+                    for climate_id in self.pick(climate_ids, climate_weights, self.rng.randint(1, 2))
+                ]
+                TerrainThrough.objects.bulk_create(terrains)
+                ClimateThrough.objects.bulk_create(climates)
+                # bulk writes skip the model signals (planets/signals.py); the planets are
+                # new, so there is no cached payload to invalidate, only masks and search
+                refresh_masks(Planet.objects.filter(pk__in=planet_ids))
+                search.schedule(planet_ids)
+            planets += len(names)
+            relations += len(terrains) + len(climates)
+        facets.invalidate()
+        planet_cache.invalidate_lists()
+        self.stdout.write(f'{"":<16}{planets} planets, {relations} terrain/climate links')
+        self.report('planets+links', planets + relations, time.perf_counter() - start)
+
+    # goodreads
+
+    def generate_goodreads(self, options):
+        prefix = self.prefix
+        password = make_password('password123')
+        self.insert('users', User, (
+            User(username=f'{prefix}-user-{i:08d}', password=password) for i in range(options['users'])
+        ))
+        user_ids = self.ids(User.objects.filter(username__startswith=f'{prefix}-user-'))
+        self.insert('accounts', GoodreadsAccount, (GoodreadsAccount(user_id=user_id) for user_id in user_ids))
+        self.insert('books', Book, (
+            Book(name=f'{prefix}-book-{i:08d}', author=f'{prefix}-author-{i % 5000:04d}') for i in range(options['books'])
+        ))
+        book_ids = self.ids(Book.objects.filter(name__startswith=f'{prefix}-book-'))
+
+        # a few accounts are followed by (and a few books owned by) almost everyone;
+        # directed on purpose, no mirror rows (see help)
+        account_weights = self.popularity(len(user_ids), options['skew'])
+        self.insert('friends', Friend, (
+            Friend(user_id=user_id, friend_id=friend_id)
+            for user_id in user_ids
+            for friend_id in self.pick(
+                user_ids, account_weights, self.degree(options['avg_friends'], len(user_ids) - 1), exclude=user_id,
+            )
+        ))
+        del account_weights
+        book_weights = self.popularity(len(book_ids), options['skew'])
+        self.insert('user books', UserBook, (
+            UserBook(goodreads_account_id=user_id, book_id=book_id)
+            for user_id in user_ids
+            for book_id in self.pick(book_ids, book_weights, self.degree(options['avg_books'], len(book_ids)))
+        ))
+
+        if not options['skip_index']:
+            # bulk_create skips the signals that maintain the network books index;
+            # the generated friendships only link generated accounts
+            start = time.perf_counter()
+            with transaction.atomic():
+                written = network.rebuild(user_ids)
+            self.report('network books', written, time.perf_counter() - start)
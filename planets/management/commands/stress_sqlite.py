@@ -0,0 +1,121 @@
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+
+from planetarium_api.sqlite import PROFILES, sqlite_options
+from planets.models import Planet
+from planets.serializers import PlanetReadSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Concurrency stress test of the SQLite profiles (planetarium_api/sqlite.py): list page reads per second '
+        'and "database is locked" errors while writer threads update planets. Runs on a copy of the configured '
+        'database, populate it first with generate_synthetic.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', action='append', choices=list(PROFILES), help='default: every profile')
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--page-size', type=int, default=20)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('stress_sqlite needs an SQLite database')
+        if not Planet.objects.exists():
+            raise CommandError('no planets, run generate_synthetic first')
+        database = connections.settings['default']
+        configured = database['NAME'], database['OPTIONS']
+        connections.close_all()
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                for profile in options['profile'] or list(PROFILES):
+                    copy = Path(directory) / f'{profile}.sqlite3'
+                    self.copy_database(configured[0], copy)
+                    database['NAME'], database['OPTIONS'] = str(copy), sqlite_options(profile)
+                    result = self.run(options)
+                    self.stdout.write(
+                        f'{profile:<8} reads/s {result["reads"] / options["seconds"]:>9.1f}  '
+                        f'read p50 {result["read_p50"]:>7.2f} ms  p95 {result["read_p95"]:>7.2f} ms  '
+                        f'writes/s {result["writes"] / options["seconds"]:>8.1f}  '
+                        f'locked errors: reads {result["read_errors"]}, writes {result["write_errors"]}'
+                    )
+                    connections.close_all()
+        finally:
+            database['NAME'], database['OPTIONS'] = configured
+
+    def copy_database(self, source, target):
+        with closing(sqlite3.connect(source)) as src, closing(sqlite3.connect(target)) as dst:
+            src.backup(dst)
+
+    def run(self, options):
+        # the first connection applies the profile (journal mode) before any thread starts
+        connection.ensure_connection()
+        planet_ids = list(Planet.objects.values_list('id', flat=True))
+        connection.close()
+        deadline = time.monotonic() + options['seconds']
+        lock = threading.Lock()
+        result = {'reads': 0, 'writes': 0, 'read_errors': 0, 'write_errors': 0, 'latencies': []}
+
+        def record(**counts):
+            with lock:
+                for key, value in counts.items():
+                    if key == 'latency':
+                        result['latencies'].append(value)
+                    else:
+                        result[key] += value
+
+        def reader(seed):
+            rng = random.Random(seed)
+            page_size = options['page_size']
+            try:
+                while time.monotonic() < deadline:
+                    offset = rng.randrange(max(1, len(planet_ids) - page_size))
+                    started = time.perf_counter()
+                    try:
+                        rows = Planet.objects.order_by('id').values(*PlanetReadSerializer.value_fields)
+                        PlanetReadSerializer.serialize_rows(list(rows[offset:offset + page_size]))
+                    except OperationalError:
+                        record(read_errors=1)
+                        continue
+                    record(reads=1, latency=time.perf_counter() - started)
+            finally:
+                connections.close_all()
+
+        def writer(seed):
+            rng = random.Random(seed)
+            try:
+                while time.monotonic() < deadline:
+                    try:
+                        # read then write in one transaction, like the update endpoint
+                        with transaction.atomic():
+                            planet = Planet.objects.get(pk=rng.choice(planet_ids))
+                            planet.population = (planet.population or 0) + 1
+                            planet.save(update_fields=['population', 'updated_at'])
+                    except OperationalError:
+                        record(write_errors=1)
+                        continue
+                    record(writes=1)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=reader, args=(seed,)) for seed in range(options['readers'])]
+        threads += [threading.Thread(target=writer, args=(seed,)) for seed in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        latencies = result.pop('latencies') or [0.0]
+        quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        result['read_p50'], result['read_p95'] = quantiles[49] * 1000, quantiles[94] * 1000
+        return result
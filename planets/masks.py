@@ -0,0 +1,82 @@
+"""
+Denormalized terrain/climate membership on Planet.
+
+Each Terrain/Climate gets a `bit` (a power of two, see `assign_bits`) and each
+planet stores the OR of its terrains' and climates' bits in `terrain_mask` /
+`climate_mask`. Filtering planets by terrain or climate name is then a lookup
+in the (small) vocabulary table plus a bitwise AND on the planets table: no
+join through the m2m tables and no DISTINCT.
+
+A 64 bit column holds 63 bits, vocabulary rows past that have no bit and
+filters on them fall back to the join (planets/filters.py).
+
+planets/signals.py keeps the masks in step with m2m changes, vocabulary
+deletes and bulk ingests.
+"""
+from functools import cache
+
+from django.db import IntegrityError, transaction
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Planet
+
+MASK_FIELDS = {'terrains': 'terrain_mask', 'climates': 'climate_mask'}
+BITS = [1 << index for index in range(63)]
+
+
+def assign_bits(model):
+    """
+    Give Terrain/Climate rows without a bit the free ones, oldest rows first,
+    and update the masks of the planets already linked to them. Returns the
+    assigned bits by row id.
+    """
+    taken = set(model.objects.exclude(bit=None).values_list('bit', flat=True))
+    free = [bit for bit in BITS if bit not in taken]
+    if not free:
+        return {}
+    assigned = {}
+    for pk, bit in zip(model.objects.filter(bit=None).order_by('id').values_list('id', flat=True)[:len(free)], free):
+        try:
+            with transaction.atomic():
+                if model.objects.filter(pk=pk, bit=None).update(bit=bit):
+                    assigned[pk] = bit
+        except IntegrityError:
+            # taken by a concurrent writer, the row keeps filtering through the join
+            continue
+    if assigned:
+        relation = next(name for name in MASK_FIELDS if Planet._meta.get_field(name).related_model is model)
+        field = Planet._meta.get_field(relation)
+        linked = field.remote_field.through.objects.filter(**{f'{field.m2m_reverse_field_name()}_id__in': list(assigned)})
+        refresh_masks(Planet.objects.filter(pk__in=linked.values('planet_id')))
+    return assigned
+
+
+@cache
+def mask_expression(relation):
+    """
+    The mask of the outer planet for `terrains` or `climates`: bits are
+    distinct powers of two and through rows unique, so SUM is a bitwise OR.
+    Built once per relation, update() resolves a copy for every statement.
+    """
+    field = Planet._meta.get_field(relation)
+    through = field.remote_field.through
+    bits = through.objects.filter(planet_id=OuterRef('pk')).values('planet_id').annotate(
+        mask=Sum(f'{field.m2m_reverse_field_name()}__bit')
+    ).values('mask')
+    return Coalesce(Subquery(bits), 0)
+
+
+def mask_updates(*relations):
+    """
+    `update()` keyword arguments recomputing the masks of `relations` (default
+    both) in the same statement.
+    """
+    return {MASK_FIELDS[relation]: mask_expression(relation) for relation in relations or MASK_FIELDS}
+
+
+def refresh_masks(planets):
+    """
+    Recompute the masks of a Planet queryset, one UPDATE.
+    """
+    return planets.update(**mask_updates())
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planets', '0004_alter_planet_climates_alter_planet_terrains'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanetSyncJob',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('stage', models.CharField(default='queued', max_length=20)),
+                ('active', models.BooleanField(default=True)),
+                ('total', models.PositiveIntegerField(blank=True, null=True)),
+                ('created', models.PositiveIntegerField(default=0)),
+                ('updated', models.PositiveIntegerField(default=0)),
+                ('unchanged', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Planet sync job',
+                'verbose_name_plural': 'Planet sync jobs',
+                'db_table': 'planet_sync_jobs',
+                'ordering': ['-created_at'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('active', True)), fields=('active',), name='unique_active_planet_sync')],
+            },
+        ),
+    ]
@@ -0,0 +1,116 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:15
+
+import django.db.models.deletion
+import planets.models
+from django.db import migrations, models
+
+SQLITE_INDEX = [
+    """
+    CREATE VIRTUAL TABLE planets_fts USING fts5(
+        name, terrains, climates,
+        content='planet_search_documents', content_rowid='planet_id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    # the name weighs the most in the `rank` column
+    "INSERT INTO planets_fts(planets_fts, rank) VALUES ('rank', 'bm25(10.0, 2.0, 2.0)')",
+    """
+    CREATE TRIGGER planet_search_documents_ai AFTER INSERT ON planet_search_documents BEGIN
+        INSERT INTO planets_fts(rowid, name, terrains, climates)
+        VALUES (new.planet_id, new.name, new.terrains, new.climates);
+    END
+    """,
+    """
+    CREATE TRIGGER planet_search_documents_ad AFTER DELETE ON planet_search_documents BEGIN
+        INSERT INTO planets_fts(planets_fts, rowid, name, terrains, climates)
+        VALUES ('delete', old.planet_id, old.name, old.terrains, old.climates);
+    END
+    """,
+    """
+    CREATE TRIGGER planet_search_documents_au AFTER UPDATE ON planet_search_documents BEGIN
+        INSERT INTO planets_fts(planets_fts, rowid, name, terrains, climates)
+        VALUES ('delete', old.planet_id, old.name, old.terrains, old.climates);
+        INSERT INTO planets_fts(rowid, name, terrains, climates)
+        VALUES (new.planet_id, new.name, new.terrains, new.climates);
+    END
+    """,
+]
+
+POSTGRES_INDEX = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX planet_search_documents_name_trgm ON planet_search_documents USING gin (name gin_trgm_ops)',
+]
+
+
+def create_search_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_INDEX, 'postgresql': POSTGRES_INDEX}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+    # backfill, the sqlite triggers fill planets_fts along the way
+    Planet = apps.get_model('planets', 'Planet')
+    PlanetSearchDocument = apps.get_model('planets', 'PlanetSearchDocument')
+    documents = {
+        planet_id: PlanetSearchDocument(planet_id=planet_id, name=name)
+        for planet_id, name in Planet.objects.values_list('id', 'name')
+    }
+    for relation in ('terrains', 'climates'):
+        names = {}
+        through = Planet._meta.get_field(relation).remote_field.through
+        target = Planet._meta.get_field(relation).m2m_reverse_field_name()
+        for planet_id, name in through.objects.order_by(f'{target}__name').values_list('planet_id', f'{target}__name'):
+            names.setdefault(planet_id, []).append(name)
+        for planet_id, values in names.items():
+            setattr(documents[planet_id], relation, ' '.join(values))
+    PlanetSearchDocument.objects.bulk_create(documents.values(), batch_size=500)
+
+
+def drop_search_index(apps, schema_editor):
+    statements = {
+        'sqlite': [
+            'DROP TRIGGER IF EXISTS planet_search_documents_ai',
+            'DROP TRIGGER IF EXISTS planet_search_documents_ad',
+            'DROP TRIGGER IF EXISTS planet_search_documents_au',
+            'DROP TABLE IF EXISTS planets_fts',
+        ],
+        'postgresql': ['DROP INDEX IF EXISTS planet_search_documents_name_trgm'],
+    }.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planets', '0005_planetsyncjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanetSearchIndex',
+            fields=[
+                ('planet', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='planets.planet')),
+                ('document', planets.models.FullTextField(db_column='planets_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'planets_fts',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='PlanetSearchDocument',
+            fields=[
+                ('planet', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='planets.planet')),
+                ('name', models.TextField()),
+                ('terrains', models.TextField(blank=True)),
+                ('climates', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Planet search document',
+                'verbose_name_plural': 'Planet search documents',
+                'db_table': 'planet_search_documents',
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:25
+
+from django.db import migrations, models
+
+# bits 0..62 of a signed 64 bit column
+BITS = [1 << index for index in range(63)]
+
+
+def backfill_masks(apps, schema_editor):
+    Planet = apps.get_model('planets', 'Planet')
+    masks = {}
+    for relation, mask_field in (('terrains', 'terrain_mask'), ('climates', 'climate_mask')):
+        field = Planet._meta.get_field(relation)
+        model = field.related_model
+        bits = dict(zip(model.objects.order_by('id').values_list('id', flat=True), BITS))
+        for pk, bit in bits.items():
+            model.objects.filter(pk=pk).update(bit=bit)
+        target = f'{field.m2m_reverse_field_name()}_id'
+        for planet_id, related_id in field.remote_field.through.objects.values_list('planet_id', target):
+            planet_masks = masks.setdefault(planet_id, {'terrain_mask': 0, 'climate_mask': 0})
+            planet_masks[mask_field] |= bits.get(related_id, 0)
+    Planet.objects.bulk_update(
+        [Planet(pk=planet_id, **planet_masks) for planet_id, planet_masks in masks.items()],
+        ['terrain_mask', 'climate_mask'], batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planets', '0006_planet_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='climate',
+            name='bit',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='planet',
+            name='climate_mask',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='planet',
+            name='terrain_mask',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='terrain',
+            name='bit',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_masks, migrations.RunPython.noop),
+    ]
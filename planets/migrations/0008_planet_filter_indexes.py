@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planets', '0007_planet_masks'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='planet',
+            index=models.Index(fields=['population'], name='planets_population_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='planet',
+            index=models.Index(fields=['created_at', 'id'], name='planets_created_at_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='planet',
+            index=models.Index(fields=['updated_at', 'id'], name='planets_updated_at_id_idx'),
+        ),
+    ]
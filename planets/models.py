@@ -13,6 +13,8 @@ Given a user, could you find all the books in their social network?
 class Terrain(models.Model):
     id = models.BigAutoField(primary_key=True)
     name = models.CharField(max_length=100, unique=True)
+    # power of two set in Planet.terrain_mask, see planets/masks.py
+    bit = models.BigIntegerField(null=True, blank=True, unique=True, editable=False)
 
     class Meta:
         ordering = ['name']
@@ -24,6 +26,8 @@ class Terrain(models.Model):
 class Climate(models.Model):
     id = models.BigAutoField(primary_key=True)
     name = models.CharField(max_length=100, unique=True)
+    # power of two set in Planet.climate_mask, see planets/masks.py
+    bit = models.BigIntegerField(null=True, blank=True, unique=True, editable=False)
 
     class Meta:
         ordering = ['name']
@@ -38,6 +42,9 @@ class Planet(models.Model):
     population = models.BigIntegerField(null=True, blank=True)
     terrains = models.ManyToManyField(Terrain, related_name='planets', blank=True)
     climates = models.ManyToManyField(Climate, related_name='planets', blank=True)
+    # OR of the terrains'/climates' bits, maintained by planets/signals.py
+    terrain_mask = models.BigIntegerField(default=0, editable=False)
+    climate_mask = models.BigIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -49,3 +56,103 @@ class Planet(models.Model):
         verbose_name = 'Planet'
         verbose_name_plural = 'Planets'
         db_table = 'planets'
+        # range filters of PlanetFilter; (field, id) also serves the orderings and the
+        # cursor pagination keyset, see `manage.py explain_endpoints`
+        indexes = [
+            models.Index(fields=['population'], name='planets_population_idx'),
+            models.Index(fields=['created_at', 'id'], name='planets_created_at_id_idx'),
+            models.Index(fields=['updated_at', 'id'], name='planets_updated_at_id_idx'),
+        ]
+
+
+class PlanetSyncJob(models.Model):
+    """
+    Background SWAPI import started by POST /planets-service/.
+    `active` is only True while the job is pending or running; the partial
+    unique constraint makes concurrent triggers share a single run.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    stage = models.CharField(max_length=20, default='queued')
+    active = models.BooleanField(default=True)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    created = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    unchanged = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'Planet sync #{self.pk} ({self.status})'
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Planet sync job'
+        verbose_name_plural = 'Planet sync jobs'
+        db_table = 'planet_sync_jobs'
+        constraints = [
+            models.UniqueConstraint(fields=['active'], condition=models.Q(active=True), name='unique_active_planet_sync')
+        ]
+
+
+class PlanetSearchDocument(models.Model):
+    """
+    Flattened search text of a planet: its name and the space separated names
+    of its terrains and climates. Refreshed by planets/search.py; on SQLite the
+    FTS5 table `planets_fts` indexes these rows through triggers.
+    """
+    planet = models.OneToOneField(Planet, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    name = models.TextField()
+    terrains = models.TextField(blank=True)
+    climates = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = 'Planet search document'
+        verbose_name_plural = 'Planet search documents'
+        db_table = 'planet_search_documents'
+
+
+class FullTextField(models.TextField):
+    """
+    The FTS5 hidden column named after its table, target of `__match`.
+    """
+
+
+@FullTextField.register_lookup
+class FullTextMatch(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', (*lhs_params, *rhs_params)
+
+
+class PlanetSearchIndex(models.Model):
+    """
+    Read-only view of the SQLite FTS5 table created by migration 0006, joined
+    to planets on rowid. `rank` is bm25 with the name weighing the most.
+    """
+    planet = models.OneToOneField(
+        Planet, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid', db_constraint=False,
+        related_name='search_index',
+    )
+    document = FullTextField(db_column='planets_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'planets_fts'
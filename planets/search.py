@@ -0,0 +1,169 @@
+"""
+Planet full-text search.
+
+Every planet has a PlanetSearchDocument: its name plus the flattened names of
+its terrains and climates. On SQLite the FTS5 table `planets_fts` indexes the
+documents through triggers (migration 0006) and `?search=` is a single join
+ranked by bm25. On PostgreSQL the documents are matched as tsvectors, ranked
+with ts_rank, with trigram similarity on the name so near misses still match.
+Any other backend keeps DRF's icontains search.
+
+Documents are refreshed on commit, once per transaction, for every planet a
+save, m2m change, vocabulary change or bulk ingest touched (planets/signals.py).
+"""
+import re
+
+from django.db import connections, transaction
+from django.db.models import F, Q
+from rest_framework.filters import OrderingFilter, SearchFilter
+
+from . import cache as planet_cache
+from .models import Planet, PlanetSearchDocument
+from .serializers import PlanetReadSerializer
+
+# trigram similarity (0..1) above which a name counts as a near miss on PostgreSQL
+TRIGRAM_THRESHOLD = 0.4
+
+_fts_tables = {}
+
+
+def refresh(planet_ids):
+    """
+    Rebuild the search documents of the given planets.
+    """
+    planet_ids = sorted(set(planet_ids))
+    size = PlanetReadSerializer.id_chunk_size
+    for start in range(0, len(planet_ids), size):
+        chunk = planet_ids[start:start + size]
+        names = dict(Planet.objects.filter(pk__in=chunk).values_list('pk', 'name'))
+        terrains = PlanetReadSerializer.related_names('terrains', list(names))
+        climates = PlanetReadSerializer.related_names('climates', list(names))
+        gone = set(chunk) - names.keys()
+        if gone:
+            PlanetSearchDocument.objects.filter(planet_id__in=gone).delete()
+        PlanetSearchDocument.objects.bulk_create(
+            [
+                PlanetSearchDocument(
+                    planet_id=planet_id,
+                    name=name,
+                    terrains=' '.join(terrains.get(planet_id, ())),
+                    climates=' '.join(climates.get(planet_id, ())),
+                )
+                for planet_id, name in names.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['planet'],
+            update_fields=['name', 'terrains', 'climates'],
+        )
+    # ?search= pages cached before the documents changed
+    planet_cache.invalidate_lists()
+
+
+class PendingRefresh:
+    """
+    on_commit callback collecting the planets to refresh, see `schedule`.
+    """
+    def __init__(self):
+        self.planet_ids = set()
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        refresh(self.planet_ids)
+
+
+def schedule(planet_ids, using=None):
+    """
+    Refresh the documents of `planet_ids` when the current transaction commits
+    (right away in autocommit). Calls made in the same transaction/savepoint
+    share one callback: a planet saved, then given terrains and climates is
+    refreshed once. A rolled back savepoint drops its callback with its ids.
+    """
+    connection = transaction.get_connection(using)
+    if connection.in_atomic_block:
+        # savepoint=False blocks (None) cannot roll back on their own
+        savepoints = set(connection.savepoint_ids) - {None}
+        for sids, callback, robust in reversed(connection.run_on_commit):
+            if isinstance(callback, PendingRefresh) and not callback.done and sids - {None} == savepoints:
+                callback.planet_ids.update(planet_ids)
+                return
+    pending = PendingRefresh()
+    pending.planet_ids.update(planet_ids)
+    transaction.on_commit(pending, using)
+
+
+def fts_available(alias):
+    if alias not in _fts_tables:
+        with connections[alias].cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'planets_fts'")
+            _fts_tables[alias] = cursor.fetchone() is not None
+    return _fts_tables[alias]
+
+
+def search_phrases(terms):
+    """
+    Words of each search term; a term's words must appear next to each other
+    (`terrain-0001` -> ['terrain', '0001']). Words only: quotes and operators
+    in user input never reach the query parsers.
+    """
+    return [words for words in (re.findall(r'\w+', term) for term in terms) if words]
+
+
+def fts_query(phrases):
+    """
+    FTS5 query matching every phrase, its last word as a prefix: `"rock"* "terrain 0001"*`.
+    """
+    return ' '.join('"{}"*'.format(' '.join(words)) for words in phrases)
+
+
+def tsquery(phrases):
+    # PostgreSQL flavour of fts_query: `rock:* & terrain <-> 0001:*`
+    return ' & '.join(' <-> '.join([*words[:-1], f'{words[-1]}:*']) for words in phrases)
+
+
+def postgres_search(queryset, phrases):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+
+    vector = (
+        SearchVector('search_document__name', weight='A', config='simple')
+        + SearchVector('search_document__terrains', 'search_document__climates', weight='B', config='simple')
+    )
+    query = SearchQuery(tsquery(phrases), search_type='raw', config='simple')
+    similarity = TrigramWordSimilarity(' '.join(word for words in phrases for word in words), 'name')
+    return queryset.annotate(
+        search_vector=vector,
+        similarity=similarity,
+        # lower is better, like bm25
+        search_rank=-(SearchRank(vector, query) + similarity),
+    ).filter(Q(search_vector=query) | Q(similarity__gte=TRIGRAM_THRESHOLD))
+
+
+class PlanetSearchFilter(SearchFilter):
+    """
+    `?search=` through the planet search index, annotating `search_rank`.
+    """
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        vendor = connections[queryset.db].vendor
+        if vendor not in ('sqlite', 'postgresql') or (vendor == 'sqlite' and not fts_available(queryset.db)):
+            return super().filter_queryset(request, queryset, view)
+        phrases = search_phrases(terms)
+        if not phrases:
+            return queryset.none()
+        if vendor == 'postgresql':
+            return postgres_search(queryset, phrases)
+        return queryset.filter(search_index__document__match=fts_query(phrases)).annotate(
+            search_rank=F('search_index__rank')
+        )
+
+
+class PlanetOrderingFilter(OrderingFilter):
+    """
+    Search results come best match first unless `?ordering=` asks otherwise.
+    """
+    def get_ordering(self, request, queryset, view):
+        if not request.query_params.get(self.ordering_param) and 'search_rank' in queryset.query.annotations:
+            return ['search_rank', 'id']
+        return super().get_ordering(request, queryset, view)
@@ -1,11 +1,21 @@
 from rest_framework import serializers
 from .models import Planet, Terrain, Climate
-from django.db import models
+from planetarium_api import instrumentation
 
 # token authentication
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
 
+# list routes of PlanetViewSet (/api/v1/planets/export/, /bulk/) share the URL
+# space of /api/v1/planets/<name>/, a planet with one of these names could not
+# be read, updated or deleted
+RESERVED_NAMES = frozenset({'export', 'bulk'})
+
+
+def reserved_name_error(name):
+    return serializers.ValidationError(f"'{name}' is reserved for /api/v1/planets/{name}/.")
+
+
 class PlanetSerializer(serializers.ModelSerializer):
     name = serializers.CharField(max_length=100)
     population = serializers.IntegerField()
@@ -25,16 +35,121 @@ class PlanetSerializer(serializers.ModelSerializer):
         model = Planet
         fields = ['id', 'name', 'population', 'terrains', 'climates', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
-        ordering = ['name']
-        verbose_name = 'Planet'
-        verbose_name_plural = 'Planets'
-        db_table = 'planet'
-        indexes = [
-            models.Index(fields=['name'], name='planet_name_idx'),
-        ]
-        constraints = [
-            models.UniqueConstraint(fields=['name'], name='unique_planet_name')
-        ]
+
+    def validate_name(self, value):
+        if value in RESERVED_NAMES and getattr(self.instance, 'name', None) != value:
+            raise reserved_name_error(value)
+        return value
+
+
+class PlanetReadSerializer:
+    """
+    Read-only fast path for planet list/retrieve.
+
+    Takes `values()` rows (see `value_fields`) instead of model instances and
+    fetches terrain/climate names for the whole batch with one query per
+    relation. Output is identical to `PlanetSerializer`, without DRF's
+    per-field bind/to_representation work.
+    """
+    value_fields = ('id', 'name', 'population', 'created_at', 'updated_at')
+    id_chunk_size = 500
+    # reused only for its timezone aware ISO 8601 formatting
+    _datetime_field = serializers.DateTimeField()
+
+    def __init__(self, instance=None, many=False, **kwargs):
+        self.instance = instance
+        self.many = many
+
+    @classmethod
+    def related_names(cls, relation, planet_ids):
+        """
+        Map planet id -> ordered list of names for `terrains` or `climates`.
+        """
+        field = Planet._meta.get_field(relation)
+        through = field.remote_field.through
+        target = field.m2m_reverse_field_name()
+        names = {}
+        for start in range(0, len(planet_ids), cls.id_chunk_size):
+            rows = through.objects.filter(
+                planet_id__in=planet_ids[start:start + cls.id_chunk_size]
+            ).order_by(f'{target}__name').values_list('planet_id', f'{target}__name')
+            for planet_id, name in rows:
+                names.setdefault(planet_id, []).append(name)
+        return names
+
+    @classmethod
+    async def arelated_names(cls, relation, planet_ids):
+        """
+        `related_names` through the async ORM.
+        """
+        field = Planet._meta.get_field(relation)
+        through = field.remote_field.through
+        target = field.m2m_reverse_field_name()
+        names = {}
+        for start in range(0, len(planet_ids), cls.id_chunk_size):
+            rows = through.objects.filter(
+                planet_id__in=planet_ids[start:start + cls.id_chunk_size]
+            ).order_by(f'{target}__name').values_list('planet_id', f'{target}__name')
+            async for planet_id, name in rows:
+                names.setdefault(planet_id, []).append(name)
+        return names
+
+    @classmethod
+    def to_representation(cls, row, terrains, climates):
+        to_datetime = cls._datetime_field.to_representation
+        population = row['population']
+        return {
+            'id': row['id'],
+            'name': str(row['name']),
+            'population': None if population is None else int(population),
+            'terrains': terrains.get(row['id'], []),
+            'climates': climates.get(row['id'], []),
+            'created_at': None if row['created_at'] is None else to_datetime(row['created_at']),
+            'updated_at': None if row['updated_at'] is None else to_datetime(row['updated_at']),
+        }
+
+    @classmethod
+    def serialize_rows(cls, rows, terrains=None, climates=None):
+        with instrumentation.timed('serialize'):
+            ids = [row['id'] for row in rows]
+            if terrains is None:
+                terrains = cls.related_names('terrains', ids)
+            if climates is None:
+                climates = cls.related_names('climates', ids)
+            return [cls.to_representation(row, terrains, climates) for row in rows]
+
+    @classmethod
+    async def aserialize_rows(cls, rows):
+        ids = [row['id'] for row in rows]
+        terrains = await cls.arelated_names('terrains', ids)
+        climates = await cls.arelated_names('climates', ids)
+        return cls.serialize_rows(rows, terrains, climates)
+
+    @property
+    def data(self):
+        if self.many:
+            return self.serialize_rows(list(self.instance))
+        return self.serialize_rows([self.instance])[0]
+
+
+class PlanetBulkItemSerializer(serializers.Serializer):
+    """
+    One item of a bulk request (planets/bulk.py). Validates the shape only,
+    terrain/climate names and planet names are looked up for the whole batch.
+    Missing fields of an `update` are left unchanged.
+    """
+    op = serializers.ChoiceField(choices=('create', 'update', 'delete'), default='create')
+    name = serializers.CharField(max_length=100)
+    population = serializers.IntegerField(required=False)
+    terrains = serializers.ListField(child=serializers.CharField(max_length=100), required=False)
+    climates = serializers.ListField(child=serializers.CharField(max_length=100), required=False)
+
+    def validate(self, attrs):
+        if attrs['op'] == 'create' and 'population' not in attrs:
+            raise serializers.ValidationError({'population': 'This field is required.'})
+        if attrs['op'] == 'create' and attrs['name'] in RESERVED_NAMES:
+            raise serializers.ValidationError({'name': reserved_name_error(attrs['name']).detail})
+        return attrs
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
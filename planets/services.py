@@ -1,8 +1,9 @@
 import requests
+from django.conf import settings
 
 
 def fetch_planets_service():
-    url = "https://swapi-graphql.netlify.app/graphql"
+    url = getattr(settings, 'SWAPI_GRAPHQL_URL', "https://swapi-graphql.netlify.app/graphql")
     query = """
     query {
       allPlanets {
@@ -19,8 +20,9 @@ def fetch_planets_service():
             url,
             json={'query': query},
             headers={'Content-Type': 'application/json'},
-            timeout=30
+            timeout=getattr(settings, 'SWAPI_TIMEOUT', 30)
         )
+    response.raise_for_status()
     data = response.json()
 
     # Extract the planet list
@@ -0,0 +1,125 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver, Signal
+from django.utils import timezone
+
+from .models import Planet, Terrain, Climate
+from . import cache as planet_cache
+from . import facets, masks, search
+
+# sent by bulk writers (planets/ingest.py) that bypass save() and m2m_changed,
+# with `names`: the planets that were created or changed
+planets_bulk_changed = Signal()
+
+
+@receiver(planets_bulk_changed)
+def planets_bulk_written(sender, names, **kwargs):
+    planet_cache.invalidate(*names)
+    masks.refresh_masks(Planet.objects.filter(name__in=names))
+    facets.invalidate()
+    search.schedule(Planet.objects.filter(name__in=names).values_list('pk', flat=True))
+
+
+@receiver(planets_bulk_changed)
+@receiver(post_save, sender=Planet)
+@receiver(post_delete, sender=Planet)
+@receiver(post_save, sender=Terrain)
+@receiver(post_delete, sender=Terrain)
+@receiver(post_save, sender=Climate)
+@receiver(post_delete, sender=Climate)
+@receiver(m2m_changed, sender=Planet.terrains.through)
+@receiver(m2m_changed, sender=Planet.climates.through)
+def planet_lists_changed(sender, action='post', **kwargs):
+    # any write can move a planet in or out of a cached list page
+    if not action.startswith('pre'):
+        planet_cache.invalidate_lists()
+
+
+@receiver(pre_save, sender=Planet)
+def planet_pre_save(sender, instance, **kwargs):
+    if instance.pk is None:
+        return
+    stored = Planet.objects.filter(pk=instance.pk).values_list('name', 'terrain_mask', 'climate_mask').first()
+    if stored is None:
+        return
+    old_name, instance.terrain_mask, instance.climate_mask = stored
+    # a rename must also drop the payload cached under the old name; the masks are
+    # maintained with UPDATEs, save() must not write back a stale in-memory copy
+    if old_name != instance.name:
+        planet_cache.invalidate(old_name)
+
+
+@receiver(post_save, sender=Planet)
+@receiver(post_delete, sender=Planet)
+def planet_changed(sender, instance, **kwargs):
+    planet_cache.invalidate(instance.name)
+
+
+@receiver(post_delete, sender=Planet)
+def planet_deleted(sender, instance, **kwargs):
+    # its through rows went with it, without m2m_changed
+    facets.invalidate()
+
+
+@receiver(post_save, sender=Planet)
+def planet_saved(sender, instance, **kwargs):
+    # the search document of a deleted planet goes with it (on_delete=CASCADE)
+    search.schedule([instance.pk])
+
+
+def touch(planets):
+    """
+    Bump updated_at (the Last-Modified/ETag source) and the masks of a Planet
+    queryset and drop the cached payloads, returns the touched ids.
+    """
+    rows = list(planets.values_list('pk', 'name'))
+    planet_ids = [pk for pk, _ in rows]
+    if rows:
+        Planet.objects.filter(pk__in=planet_ids).update(updated_at=timezone.now(), **masks.mask_updates())
+        planet_cache.invalidate(*(name for _, name in rows))
+        facets.invalidate()
+        # refreshed on commit, after the clear/delete that is about to happen
+        search.schedule(planet_ids)
+    return planet_ids
+
+
+@receiver(m2m_changed, sender=Planet.terrains.through)
+@receiver(m2m_changed, sender=Planet.climates.through)
+def planet_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            relation = 'terrains' if sender is Planet.terrains.through else 'climates'
+            # keep the in-memory instance in step, serializers read it next
+            instance.updated_at = timezone.now()
+            Planet.objects.filter(pk=instance.pk).update(
+                updated_at=instance.updated_at, **masks.mask_updates(relation)
+            )
+            planet_cache.invalidate(instance.name)
+            facets.invalidate()
+            search.schedule([instance.pk])
+        return
+    # reverse side: terrain.planets.add(...), climate.planets.clear()
+    if action == 'pre_clear':
+        instance._cleared_planet_ids = touch(instance.planets.all())
+    elif action == 'post_clear':
+        masks.refresh_masks(Planet.objects.filter(pk__in=instance.__dict__.pop('_cleared_planet_ids', ())))
+    elif action in ('post_add', 'post_remove') and pk_set:
+        touch(Planet.objects.filter(pk__in=pk_set))
+
+
+@receiver(post_save, sender=Terrain)
+@receiver(post_save, sender=Climate)
+@receiver(pre_delete, sender=Terrain)
+@receiver(pre_delete, sender=Climate)
+def vocabulary_changed(sender, instance, created=False, **kwargs):
+    # renaming or deleting a terrain/climate changes every planet that lists it
+    if created:
+        instance.bit = masks.assign_bits(sender).get(instance.pk)
+        return
+    instance._linked_planet_ids = touch(instance.planets.all())
+
+
+@receiver(post_delete, sender=Terrain)
+@receiver(post_delete, sender=Climate)
+def vocabulary_deleted(sender, instance, **kwargs):
+    # the through rows are gone now, drop the freed bit from the masks
+    masks.refresh_masks(Planet.objects.filter(pk__in=instance.__dict__.pop('_linked_planet_ids', ())))
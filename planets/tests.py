@@ -1,8 +1,22 @@
 from rest_framework.test import APITestCase
+from unittest import mock
+from django.test import override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from django.urls import reverse
 from django.contrib.auth.models import User
-from planets.models import Planet, Terrain, Climate
+from planets.models import Planet, Terrain, Climate, PlanetSyncJob
+from planets import cache as planet_cache
+from planets import facets, search
+from planets.serializers import PlanetSerializer, PlanetReadSerializer
+from planets.ingest import ingest_planets
+from rest_framework.renderers import JSONRenderer
+from asgiref.sync import sync_to_async
+from rest_framework_simplejwt.tokens import AccessToken
+import csv
+import json
+import threading
 
 
 class PlanetAPITestCase(APITestCase):
@@ -104,6 +118,42 @@ class PlanetAPITestCase(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    @override_settings(PLANET_SYNC_ASYNC=False)
+    def test_service_sync_job(self):
+        """POST /planets-service/ runs the sync as a job, with the SWAPI fetch mocked out"""
+        stub = [{'name': 'Tatooine', 'population': 200000, 'terrains': ['desert'], 'climates': ['arid']}]
+        with mock.patch('planets.jobs.fetch_planets_service', return_value=stub):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('planets-service'))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertTrue(response.json()['started'])
+
+        job_url = reverse('planets-service-job', kwargs={'job_id': response.json()['job_id']})
+        job = self.client.get(job_url).json()
+        self.assertEqual(job['status'], PlanetSyncJob.STATUS_SUCCEEDED)
+        self.assertEqual((job['total'], job['created'], job['updated']), (1, 1, 0))
+        self.assertIsNotNone(job['duration_ms'])
+        self.assertTrue(Planet.objects.filter(name='Tatooine').exists())
+        self.assertEqual(self.client.get(reverse('planets-service')).json()['last_job']['job_id'], job['job_id'])
+
+    @override_settings(PLANET_SYNC_ASYNC=False)
+    def test_service_sync_job_failure_and_dedup(self):
+        running = PlanetSyncJob.objects.create(status=PlanetSyncJob.STATUS_RUNNING)
+        response = self.client.post(reverse('planets-service'))
+        self.assertEqual(response.json()['job_id'], running.pk)
+        self.assertFalse(response.json()['started'])
+        running.delete()
+
+        with mock.patch('planets.jobs.fetch_planets_service', side_effect=ValueError('upstream down')):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('planets-service'))
+        job = PlanetSyncJob.objects.get(pk=response.json()['job_id'])
+        self.assertEqual(job.status, PlanetSyncJob.STATUS_FAILED)
+        self.assertFalse(job.active)
+        self.assertEqual(job.error, 'upstream down')
+        missing = self.client.get(reverse('planets-service-job', kwargs={'job_id': 999}))
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_unauthenticated_access(self):
         """Test what happens without authentication"""
         self.client.force_authenticate(user=None)
@@ -119,3 +169,843 @@ class PlanetAPITestCase(APITestCase):
         else:
             # If your mixin allows unauthenticated access
             self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_retrieve_planet_is_cached(self):
+        """second GET /api/v1/planets/<name>/ is served without touching the database"""
+        planet_cache.stats.reset()
+        url = reverse('planet-detail', kwargs={'name': self.planet.name})
+        first = self.client.get(url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(planet_cache.stats.as_dict()['hits'], 1)
+        self.assertEqual(planet_cache.stats.as_dict()['misses'], 1)
+
+    def test_cache_invalidated_on_m2m_change(self):
+        url = reverse('planet-detail', kwargs={'name': self.planet.name})
+        self.client.get(url)
+        self.planet.terrains.add(self.desert_terrain)
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['terrains'], ['desert', 'rocky'])
+        # reverse side of the relation
+        self.arid_climate.planets.add(self.planet)
+        response = self.client.get(url)
+        self.assertEqual(response.data['climates'], ['arid', 'temperate'])
+
+    def test_cache_invalidated_on_rename_and_delete(self):
+        old_url = reverse('planet-detail', kwargs={'name': self.planet.name})
+        self.client.get(old_url)
+        self.planet.name = 'Terra'
+        self.planet.save()
+        self.assertEqual(self.client.get(old_url).status_code, status.HTTP_404_NOT_FOUND)
+        new_url = reverse('planet-detail', kwargs={'name': 'Terra'})
+        self.client.get(new_url)
+        self.planet.delete()
+        self.assertEqual(self.client.get(new_url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_read_serializer_matches_planet_serializer(self):
+        """the fast read path renders byte-identical JSON"""
+        empty = Planet.objects.create(name="Nowhere", population=None)
+        self.planet.terrains.add(self.desert_terrain)
+        queryset = Planet.objects.order_by('id')
+        expected = JSONRenderer().render(PlanetSerializer(queryset, many=True).data)
+        fast = PlanetReadSerializer(queryset.values(*PlanetReadSerializer.value_fields), many=True).data
+        self.assertEqual(JSONRenderer().render(fast), expected)
+        single = PlanetReadSerializer(queryset.values(*PlanetReadSerializer.value_fields).get(pk=empty.pk)).data
+        self.assertEqual(JSONRenderer().render(single), JSONRenderer().render(PlanetSerializer(empty).data))
+
+    def test_cursor_pagination(self):
+        """GET /api/v1/planets/?cursor= walks keyset pages without a COUNT query"""
+        for index in range(6):
+            Planet.objects.create(name=f"Cursor {index}", population=index)
+        # identical timestamps force the id tie breaker
+        Planet.objects.update(updated_at=self.planet.updated_at)
+        url = reverse('planet-list') + '?cursor=&page_size=3&ordering=-updated_at'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertFalse(any('COUNT' in query['sql'] for query in queries.captured_queries))
+        self.assertNotIn('count', response.data)
+        self.assertIsNone(response.data['previous'])
+
+        pages = [[planet['name'] for planet in response.data['results']]]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append([planet['name'] for planet in response.data['results']])
+        expected = list(Planet.objects.order_by('-updated_at', '-id').values_list('name', flat=True))
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+
+        # and back again
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([planet['name'] for planet in response.data['results']], pages[1])
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([planet['name'] for planet in response.data['results']], pages[0])
+        self.assertIsNone(response.data['previous'])
+
+    def test_conditional_get(self):
+        """ETag / Last-Modified short-circuit to 304 until the planet changes"""
+        for url in (reverse('planet-list'), reverse('planet-list') + '?cursor=', reverse('planet-detail', kwargs={'name': 'Earth'})):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            etag, last_modified = response['ETag'], response['Last-Modified']
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, status.HTTP_304_NOT_MODIFIED)
+
+            # an M2M change bumps updated_at, so the validators move
+            self.planet.terrains.add(self.desert_terrain)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotEqual(response['ETag'], etag)
+            self.planet.terrains.remove(self.desert_terrain)
+
+    def test_cursor_pagination_rejects_bad_cursor(self):
+        response = self.client.get(reverse('planet-list') + '?cursor=garbage')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        # the page number mode is unchanged
+        response = self.client.get(reverse('planet-list') + '?page=1')
+        self.assertIn('count', response.data)
+
+    def test_ingest_planets(self):
+        """bulk ingestion reports created/updated/unchanged with a fixed query count"""
+        swapi = [
+            {'name': 'Earth', 'population': 7000000000.0, 'terrains': ['rocky'], 'climates': ['temperate']},
+            {'name': 'Tatooine', 'population': 200000, 'terrains': ['desert'], 'climates': ['arid']},
+            {'name': 'Hoth', 'population': None, 'terrains': ['tundra', 'ice caves'], 'climates': ['frozen']},
+        ]
+        result = ingest_planets(swapi)
+        self.assertEqual((result['created'], result['updated'], result['unchanged']), (2, 0, 1))
+        self.assertIn('duration_ms', result)
+        hoth = Planet.objects.get(name='Hoth')
+        self.assertEqual(sorted(hoth.terrains.values_list('name', flat=True)), ['ice caves', 'tundra'])
+        self.assertEqual(list(hoth.climates.values_list('name', flat=True)), ['frozen'])
+
+        swapi[1]['population'] = 300000
+        swapi[2]['terrains'] = ['tundra']
+        swapi += [{'name': f'Planet {index}', 'population': index, 'terrains': ['rocky'], 'climates': []} for index in range(50)]
+        with CaptureQueriesContext(connection) as queries:
+            result = ingest_planets(swapi)
+        self.assertEqual((result['created'], result['updated'], result['unchanged']), (50, 2, 1))
+        self.assertLessEqual(len(queries), 16)
+        self.assertEqual(Planet.objects.get(name='Tatooine').population, 300000)
+        self.assertEqual(list(hoth.terrains.values_list('name', flat=True)), ['tundra'])
+        self.assertEqual(Planet.objects.get(name='Planet 7').climates.count(), 0)
+
+    def test_generate_synthetic(self):
+        """the generator is deterministic per seed and leaves the network books index consistent"""
+        from io import StringIO
+        from django.core.management import CommandError, call_command
+        from goodreads import network
+        from goodreads.models import Friend, NetworkBook, UserBook
+
+        def generate():
+            out = StringIO()
+            call_command(
+                'generate_synthetic', '--flush', '--planets', '30', '--terrains', '4', '--climates', '3',
+                '--users', '40', '--books', '60', '--avg-friends', '5', '--avg-books', '4', '--batch-size', '7',
+                '--seed', '3', stdout=out,
+            )
+            return (
+                sorted(Friend.objects.values_list('user__user__username', 'friend__user__username')),
+                sorted(UserBook.objects.values_list('goodreads_account__user__username', 'book__name')),
+                out.getvalue(),
+            )
+
+        # the planets are new: masks and search documents are filled, no cached payload is invalidated
+        with mock.patch.object(planet_cache, 'invalidate') as invalidate, self.captureOnCommitCallbacks(execute=True):
+            friends, books, out = generate()
+        invalidate.assert_not_called()
+        self.assertEqual(Planet.objects.filter(name__startswith='syn-planet-').count(), 30)
+        self.assertFalse(Planet.objects.filter(name__startswith='syn-', terrains__isnull=True).exists())
+        self.assertFalse(Planet.objects.filter(name__startswith='syn-planet-', terrain_mask=0).exists())
+        self.assertEqual(
+            Planet.objects.filter(search_index__document__match=search.fts_query([['syn', 'planet']])).count(), 30
+        )
+        self.assertTrue(friends and books)
+        self.assertIn('rows/s', out)
+        index = sorted(NetworkBook.objects.values_list('goodreads_account_id', 'book_id', 'owners'))
+        network.rebuild()
+        self.assertEqual(sorted(NetworkBook.objects.values_list('goodreads_account_id', 'book_id', 'owners')), index)
+
+        again, books_again, _ = generate()
+        self.assertEqual((again, books_again), (friends, books))
+        # directed on purpose, see the command's help: no mirror rows
+        self.assertNotEqual(sorted((friend, user) for user, friend in friends), friends)
+
+        # without --flush the generated names collide: an error before anything is written
+        counts = (Planet.objects.count(), Friend.objects.count())
+        with self.assertRaisesMessage(CommandError, 'pass --flush'):
+            call_command('generate_synthetic', '--planets', '5', '--users', '5', stdout=StringIO())
+        self.assertEqual((Planet.objects.count(), Friend.objects.count()), counts)
+
+    def test_bench_api(self):
+        """the API benchmark writes JSON results and fails on a regression against the baseline"""
+        import json
+        import tempfile
+        from io import StringIO
+        from pathlib import Path
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+
+        with tempfile.TemporaryDirectory() as directory:
+            output, baseline = Path(directory) / 'results.json', Path(directory) / 'baseline.json'
+            options = {'iterations': 3, 'warmup': 1, 'only': 'planet detail', 'planets': 20, 'users': 20, 'stdout': StringIO()}
+            call_command('bench_api', output=str(output), baseline=str(baseline), save_baseline=True, **options)
+            results = json.loads(output.read_text())['results']
+            self.assertEqual(set(results), {'planet detail', 'planet detail cold cache'})
+            self.assertEqual(results['planet detail']['queries'], 0)
+            self.assertTrue({'p50_ms', 'p95_ms', 'p99_ms', 'alloc_kb'} <= set(results['planet detail']))
+            self.assertFalse(Planet.objects.filter(name__startswith='bench-').exists())
+
+            report = json.loads(baseline.read_text())
+            report['results']['planet detail cold cache']['queries'] -= 1
+            baseline.write_text(json.dumps(report))
+            with self.assertRaisesMessage(CommandError, 'planet detail cold cache: queries'):
+                call_command('bench_api', baseline=str(baseline), **options)
+
+            # re-recording one scenario leaves the others and the calibration alone
+            out = StringIO()
+            call_command('bench_api', baseline=str(baseline), save_baseline=True, **{
+                **options, 'only': 'planet detail cold', 'stdout': out,
+            })
+            updated = json.loads(baseline.read_text())
+            self.assertEqual(updated['meta'], report['meta'])
+            self.assertEqual(updated['results']['planet detail'], report['results']['planet detail'])
+            self.assertEqual(updated['results']['planet detail cold cache']['queries'], results['planet detail cold cache']['queries'])
+            self.assertIn('accepted planet detail cold cache: p50', out.getvalue())
+
+    def test_explain_endpoints(self):
+        """the filter/order paths are indexed: no list query is a full scan"""
+        from io import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command('explain_endpoints', '--depth', '1', '--fail', stdout=out)
+        self.assertIn(' 0 flagged', out.getvalue())
+
+    def test_cache_fill_runs_once_under_concurrency(self):
+        """readers missing while a fill holds the lock wait for it instead of loading"""
+        calls = []
+        filling, release = threading.Event(), threading.Event()
+        blocked = threading.Semaphore(0)
+        shared_cache = planet_cache.cache
+
+        class LockObservingCache:
+            def __getattr__(self, name):
+                return getattr(shared_cache, name)
+
+            def add(self, *args, **kwargs):
+                added = shared_cache.add(*args, **kwargs)
+                if not added:
+                    blocked.release()
+                return added
+
+        def loader():
+            calls.append(1)
+            filling.set()
+            release.wait(5)
+            return {'name': 'Cold'}
+
+        results = []
+
+        def read():
+            results.append(planet_cache.get_or_fill('Cold', loader)[0])
+
+        with mock.patch.object(planet_cache, 'cache', LockObservingCache()):
+            filler = threading.Thread(target=read)
+            filler.start()
+            self.assertTrue(filling.wait(5))
+            readers = [threading.Thread(target=read) for _ in range(4)]
+            for reader in readers:
+                reader.start()
+            # every reader lost the fill lock before the fill is let go
+            for _ in readers:
+                self.assertTrue(blocked.acquire(timeout=5))
+            release.set()
+            for thread in [filler, *readers]:
+                thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'name': 'Cold'}] * 5)
+
+
+class PlanetQueryBudgetTestCase(APITestCase):
+    """
+    Query budgets per endpoint: reads must not grow with the page size.
+    A serializer change that brings back per-row queries fails here.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='budget', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.terrains = [Terrain.objects.create(name=name) for name in ('desert', 'ocean', 'rocky')]
+        self.climates = [Climate.objects.create(name=name) for name in ('arid', 'humid', 'temperate')]
+        self.make_planets(1)
+
+    def make_planets(self, count):
+        start = Planet.objects.count()
+        for index in range(start, start + count):
+            planet = Planet.objects.create(name=f'Planet {index:03d}', population=index)
+            planet.terrains.set(self.terrains[:index % 3 + 1])
+            planet.climates.set(self.climates[:index % 3 + 1])
+
+    def assertMaxQueries(self, budget, method, url, data=None):
+        # on_commit work (search document refresh) counts too
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 400, response.content)
+        self.assertLessEqual(
+            len(queries), budget,
+            '\n'.join(query['sql'] for query in queries.captured_queries)
+        )
+        return len(queries)
+
+    def test_list_budget_is_independent_of_page_size(self):
+        url = reverse('planet-list') + '?page_size=20'
+        small = self.assertMaxQueries(5, 'get', url)
+        self.make_planets(19)
+        large = self.assertMaxQueries(5, 'get', url)
+        self.assertEqual(small, large)
+
+    def test_filtered_list_budget(self):
+        self.make_planets(19)
+        for query in ('climates__name=arid', 'terrains__name__icontains=o', 'search=Planet', 'ordering=-updated_at',
+                      'population__gte=5&population__lte=15'):
+            self.assertMaxQueries(5, 'get', reverse('planet-list') + '?page_size=20&' + query)
+
+    def test_detail_budget(self):
+        url = reverse('planet-detail', kwargs={'name': 'Planet 000'})
+        self.assertMaxQueries(3, 'get', url)
+        self.assertMaxQueries(0, 'get', url)
+
+    def test_write_budgets(self):
+        payload = {'name': 'Budget', 'population': 1, 'terrains': ['rocky', 'ocean'], 'climates': ['arid']}
+        self.assertMaxQueries(21, 'post', reverse('planet-list'), payload)
+        payload['terrains'] = ['desert']
+        self.assertMaxQueries(22, 'put', reverse('planet-detail', kwargs={'name': 'Budget'}), payload)
+        self.assertMaxQueries(7, 'delete', reverse('planet-detail', kwargs={'name': 'Budget'}))
+
+
+class PlanetSearchTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='searcher', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.ocean = Terrain.objects.create(name='ocean')
+        self.desert = Terrain.objects.create(name='desert')
+        self.frozen = Climate.objects.create(name='frozen')
+        with self.captureOnCommitCallbacks(execute=True):
+            for name, terrain in (('Kamino', self.ocean), ('Tatooine', self.desert), ('Oceanside', self.desert)):
+                Planet.objects.create(name=name, population=1).terrains.add(terrain)
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('planet-list'), {'search': query, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [planet['name'] for planet in response.data['results']]
+
+    def test_search_is_ranked(self):
+        # a name match outranks a terrain match
+        self.assertEqual(self.search('ocean'), ['Oceanside', 'Kamino'])
+        self.assertEqual(self.search('ocean', ordering='name'), ['Kamino', 'Oceanside'])
+        self.assertEqual(self.search('des tat'), ['Tatooine'])
+        self.assertEqual(self.search('desert', page_size=1), ['Tatooine'])
+
+    def test_search_ignores_query_syntax(self):
+        self.assertEqual(self.search('"*'), [])
+        self.assertEqual(self.search('ocean" OR "desert'), [])
+        self.assertEqual(self.search('kamino!'), ['Kamino'])
+
+    def test_search_follows_changes(self):
+        kamino = Planet.objects.get(name='Kamino')
+        with self.captureOnCommitCallbacks(execute=True):
+            kamino.climates.add(self.frozen)
+        self.assertEqual(self.search('frozen'), ['Kamino'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.frozen.name = 'icy'
+            self.frozen.save()
+        self.assertEqual(self.search('frozen'), [])
+        self.assertEqual(self.search('icy'), ['Kamino'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ocean.planets.clear()
+        self.assertEqual(self.search('ocean'), ['Oceanside'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.desert.delete()
+        self.assertEqual(self.search('desert'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_planets([{'name': 'Mustafar', 'population': 1, 'terrains': ['lava'], 'climates': ['hot']}])
+        self.assertEqual(self.search('lava'), ['Mustafar'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            kamino.delete()
+        self.assertEqual(self.search('icy'), [])
+
+    def test_writes_refresh_the_document_once(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('planet-list'), {
+                'name': 'Hoth', 'population': 0, 'terrains': ['ocean'], 'climates': ['frozen'],
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        refreshes = [callback for callback in callbacks if isinstance(callback, search.PendingRefresh)]
+        self.assertEqual(len(refreshes), 1)
+        refreshes[0]()
+        self.assertEqual(self.search('hoth frozen'), ['Hoth'])
+
+
+class PlanetMaskTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='masker', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.desert = Terrain.objects.create(name='desert')
+        self.ocean = Terrain.objects.create(name='ocean')
+        self.arid = Climate.objects.create(name='arid')
+        self.tatooine = Planet.objects.create(name='Tatooine', population=1)
+        self.tatooine.terrains.add(self.desert)
+        self.tatooine.climates.add(self.arid)
+        self.kamino = Planet.objects.create(name='Kamino', population=1)
+        self.kamino.terrains.add(self.ocean)
+
+    def masks(self, planet):
+        return tuple(Planet.objects.filter(pk=planet.pk).values_list('terrain_mask', 'climate_mask').get())
+
+    def names(self, query):
+        response = self.client.get(reverse('planet-list') + '?' + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(planet['name'] for planet in response.data['results'])
+
+    def test_vocabulary_gets_bits(self):
+        # one bit space per vocabulary
+        self.assertEqual({self.desert.bit, self.ocean.bit, self.arid.bit}, {1, 2})
+        ingest_planets([{'name': 'Hoth', 'population': 0, 'terrains': ['tundra'], 'climates': ['frozen']}])
+        tundra = Terrain.objects.get(name='tundra')
+        self.assertNotIn(tundra.bit, (None, self.desert.bit, self.ocean.bit))
+        self.assertEqual(self.masks(Planet.objects.get(name='Hoth')), (tundra.bit, Climate.objects.get(name='frozen').bit))
+
+    def test_masks_follow_relation_changes(self):
+        self.desert.refresh_from_db()
+        self.ocean.refresh_from_db()
+        self.arid.refresh_from_db()
+        self.assertEqual(self.masks(self.tatooine), (self.desert.bit, self.arid.bit))
+
+        self.tatooine.terrains.add(self.ocean)
+        self.assertEqual(self.masks(self.tatooine), (self.desert.bit | self.ocean.bit, self.arid.bit))
+        self.tatooine.terrains.remove(self.desert)
+        self.assertEqual(self.masks(self.tatooine), (self.ocean.bit, self.arid.bit))
+
+        self.ocean.planets.clear()
+        self.assertEqual(self.masks(self.tatooine), (0, self.arid.bit))
+        self.assertEqual(self.masks(self.kamino), (0, 0))
+        self.desert.planets.add(self.kamino)
+        self.assertEqual(self.masks(self.kamino), (self.desert.bit, 0))
+
+        self.desert.delete()
+        self.assertEqual(self.masks(self.kamino), (0, 0))
+
+        # a save with a stale in-memory copy keeps the stored masks
+        self.tatooine.population = 2
+        self.tatooine.save()
+        self.assertEqual(self.masks(self.tatooine), (0, self.arid.bit))
+
+    def test_name_filters_use_masks(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.names('terrains__name=desert'), ['Tatooine'])
+        self.assertNotIn('JOIN', queries.captured_queries[0]['sql'])
+        self.assertNotIn('DISTINCT', queries.captured_queries[0]['sql'])
+        self.assertEqual(self.names('terrains__name__icontains=E'), ['Kamino', 'Tatooine'])
+        self.assertEqual(self.names('terrains__name=Desert'), [])
+        self.assertEqual(self.names('terrains__name=lava'), [])
+        self.assertEqual(self.names('climates__name=arid&terrains__name=ocean'), [])
+        self.assertEqual(self.names('climates__name__icontains=ri&terrains__name__icontains=des'), ['Tatooine'])
+
+    def test_name_filters_past_the_mask_width(self):
+        # vocabulary without a bit (all 63 taken) is filtered through the join
+        lava = Terrain.objects.create(name='lava')
+        Terrain.objects.filter(pk=lava.pk).update(bit=None)
+        self.kamino.terrains.add(lava)
+        self.assertEqual(self.names('terrains__name=lava'), ['Kamino'])
+        self.assertEqual(self.names('terrains__name__icontains=a'), ['Kamino'])
+        self.assertEqual(self.names('terrains__name__icontains=e'), ['Kamino', 'Tatooine'])
+
+
+class PlanetFacetTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='faceter', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        terrains = {name: Terrain.objects.create(name=name) for name in ('desert', 'mountains', 'ocean')}
+        climates = {name: Climate.objects.create(name=name) for name in ('arid', 'hot', 'temperate')}
+        for name, population, planet_terrains, planet_climates in (
+            ('Tatooine', 200000, ['desert'], ['arid', 'hot']),
+            ('Jedha', 11000000, ['desert', 'mountains'], ['arid']),
+            ('Alderaan', 2000000000, ['mountains'], ['temperate']),
+            ('Kamino', 1000000000, ['ocean'], ['temperate']),
+        ):
+            planet = Planet.objects.create(name=name, population=population)
+            planet.terrains.set([terrains[terrain] for terrain in planet_terrains])
+            planet.climates.set([climates[climate] for climate in planet_climates])
+
+    def get(self, query):
+        response = self.client.get(reverse('planet-list') + '?' + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        return response.data
+
+    def test_facet_counts(self):
+        data = self.get('facets=terrains,climates')
+        self.assertEqual(data['facets'], {
+            'terrains': {'desert': 2, 'mountains': 2, 'ocean': 1},
+            'climates': {'arid': 2, 'temperate': 2, 'hot': 1},
+        })
+        self.assertNotIn('facets', self.get(''))
+        self.assertEqual(self.get('facets=climates&terrains__any=desert,ocean')['facets'], {
+            'climates': {'arid': 2, 'hot': 1, 'temperate': 1},
+        })
+        # other filters narrow the counts too
+        data = self.get('facets=terrains&population__gte=1000000&climates__name=temperate')
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['facets'], {'terrains': {'mountains': 1, 'ocean': 1}})
+        self.assertEqual(self.get('facets=terrains&cursor=')['facets']['terrains']['desert'], 2)
+
+        response = self.client.get(reverse('planet-list') + '?facets=moons')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_facet_filters(self):
+        def names(query):
+            return sorted(planet['name'] for planet in self.get(query)['results'])
+
+        self.assertEqual(names('terrains__all=desert,mountains'), ['Jedha'])
+        self.assertEqual(names('terrains__any=desert,mountains'), ['Alderaan', 'Jedha', 'Tatooine'])
+        self.assertEqual(names('terrains__any=mountains&climates__all=arid'), ['Jedha'])
+        self.assertEqual(names('terrains__all=desert,lava'), [])
+        self.assertEqual(names('terrains__any=ocean,lava'), ['Kamino'])
+        self.assertEqual(names('terrains__any=lava'), [])
+        self.assertEqual(names('climates__all=arid,hot&terrains__any=desert'), ['Tatooine'])
+        data = self.get('terrains__all=desert&facets=climates')
+        self.assertEqual(data['facets'], {'climates': {'arid': 2, 'hot': 1}})
+
+    def test_index_is_reused_and_invalidated(self):
+        self.get('facets=terrains')
+        with CaptureQueriesContext(connection) as queries:
+            self.get('facets=terrains,climates&terrains__any=desert')
+        with CaptureQueriesContext(connection) as baseline:
+            self.get('terrains__any=desert')
+        self.assertEqual(len(queries), len(baseline))
+        self.assertFalse(any('GROUP BY' in query['sql'] for query in queries.captured_queries))
+
+        index = facets.get_index()
+        kamino = Planet.objects.get(name='Kamino')
+        kamino.terrains.add(Terrain.objects.get(name='desert'))
+        self.assertIsNot(facets.get_index(), index)
+        self.assertEqual(self.get('facets=terrains')['facets']['terrains']['desert'], 3)
+        kamino.delete()
+        self.assertEqual(self.get('facets=terrains')['facets']['terrains'], {'desert': 2, 'mountains': 2})
+        Terrain.objects.get(name='mountains').delete()
+        self.assertEqual(self.get('facets=terrains')['facets']['terrains'], {'desert': 2})
+
+
+@override_settings(PLANET_LIST_CACHE_TIMEOUT=60)
+class PlanetListCacheTestCase(APITestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.arid = Climate.objects.create(name='arid')
+        for index in range(3):
+            Planet.objects.create(name=f'Planet {index}', population=index).climates.add(self.arid)
+
+    def get(self, query, **headers):
+        response = self.client.get(reverse('planet-list') + query, **headers)
+        self.assertIn(response.status_code, (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED))
+        return response
+
+    def test_equivalent_queries_share_an_entry(self):
+        first = self.get('?climates__name=arid&page_size=50')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        equivalent = ('?page=1&climates__name=arid&page_size=20&ordering=id&name=', '?page_size=20&climates__name=arid')
+        for query in equivalent:
+            with self.assertNumQueries(0):
+                response = self.get(query)
+            self.assertEqual(response['X-Cache'], 'HIT')
+            self.assertEqual(response.json(), first.json())
+        self.assertEqual(self.get('?climates__name=arid&page_size=5')['X-Cache'], 'MISS')
+        self.assertEqual(self.get('?climates__name=arid&ordering=-name')['X-Cache'], 'MISS')
+
+    def test_hits_answer_conditional_requests(self):
+        miss = self.get('?ordering=name')
+        hit = self.get('?ordering=name')
+        self.assertEqual((miss['X-Cache'], hit['X-Cache']), ('MISS', 'HIT'))
+        self.assertEqual((hit['ETag'], hit['Last-Modified']), (miss['ETag'], miss['Last-Modified']))
+        with self.assertNumQueries(0):
+            response = self.get('?ordering=name', HTTP_IF_NONE_MATCH=miss['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_writes_retire_cached_pages(self):
+        def names():
+            response = self.get('?climates__name=arid')
+            return response['X-Cache'], [planet['name'] for planet in response.json()['results']]
+
+        self.assertEqual(names(), ('MISS', ['Planet 0', 'Planet 1', 'Planet 2']))
+        self.assertEqual(names()[0], 'HIT')
+        Planet.objects.create(name='Planet 3', population=3).climates.add(self.arid)
+        self.assertEqual(names(), ('MISS', ['Planet 0', 'Planet 1', 'Planet 2', 'Planet 3']))
+        Planet.objects.get(name='Planet 0').delete()
+        self.assertEqual(names(), ('MISS', ['Planet 1', 'Planet 2', 'Planet 3']))
+        self.arid.name = 'dry'
+        self.arid.save()
+        self.assertEqual(self.get('?climates__name=arid').json()['results'], [])
+
+    def test_entry_size_limit_and_switch(self):
+        with override_settings(PLANET_LIST_CACHE_MAX_BYTES=100):
+            self.get('')
+            self.assertEqual(self.get('')['X-Cache'], 'MISS')
+        with override_settings(PLANET_LIST_CACHE_TIMEOUT=0):
+            self.assertNotIn('X-Cache', self.get(''))
+
+
+class PlanetExportTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='exporter', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        desert = Terrain.objects.create(name='desert')
+        mountains = Terrain.objects.create(name='mountains')
+        arid = Climate.objects.create(name='arid')
+        for index in range(25):
+            planet = Planet.objects.create(name=f'Planet {index:02d}', population=index)
+            planet.terrains.set([desert, mountains] if index % 2 else [desert])
+            planet.climates.set([arid])
+
+    def export(self, query):
+        response = self.client.get(reverse('planet-export') + '?' + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_ndjson_export(self):
+        response, body = self.export('population__gte=20')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="planets.ndjson"')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['name'] for row in rows], [f'Planet {index}' for index in range(20, 25)])
+        # same rows as the list endpoint, unpaginated
+        listed = self.client.get(reverse('planet-list') + '?population__gte=20').json()['results']
+        self.assertEqual(rows, listed)
+
+    def test_csv_export(self):
+        response, body = self.export('format=csv&terrains__all=mountains&ordering=-name')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = list(csv.reader(body.splitlines()))
+        self.assertEqual(lines[0], ['id', 'name', 'population', 'terrains', 'climates', 'created_at', 'updated_at'])
+        self.assertEqual(len(lines), 13)
+        self.assertEqual(lines[1][1:5], ['Planet 23', '23', 'desert|mountains', 'arid'])
+
+    def test_list_route_names_are_reserved(self):
+        from planets.api_views import PlanetViewSet
+        from planets.serializers import RESERVED_NAMES
+
+        list_routes = {action.url_path for action in PlanetViewSet.get_extra_actions() if not action.detail}
+        self.assertEqual(RESERVED_NAMES, list_routes)
+        planet = {'population': 1, 'terrains': ['desert'], 'climates': ['arid']}
+        response = self.client.post(reverse('planet-list'), {**planet, 'name': 'export'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()['name'], ["'export' is reserved for /api/v1/planets/export/."])
+        response = self.client.put(reverse('planet-detail', args=['Planet 00']), {**planet, 'name': 'export'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Planet.objects.filter(name='export').exists())
+
+    @override_settings(EXPORT_CHUNK_SIZE=10)
+    async def test_asgi_export_streams(self):
+        # a sync iterator would be read whole by Django's ASGI handler before sending
+        response = await self.async_client.get(reverse('planet-export') + '?format=csv')
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        # the header line, then one chunk of rows at a time
+        self.assertEqual([len(chunk.splitlines()) for chunk in chunks], [1, 10, 10, 5])
+        expected = await sync_to_async(self.export)('format=csv')
+        self.assertEqual(b''.join(chunks).decode(), expected[1])
+
+    @override_settings(EXPORT_CHUNK_SIZE=10)
+    def test_queries_per_chunk(self):
+        with CaptureQueriesContext(connection) as queries:
+            _, body = self.export('')
+        self.assertEqual(len(body.splitlines()), 25)
+        # the planet rows, then terrains and climates once per chunk of 10
+        self.assertEqual(len(queries), 1 + 3 * 2)
+
+
+class PlanetBulkTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='bulker', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        for name in ('desert', 'ocean'):
+            Terrain.objects.create(name=name)
+        for name in ('arid', 'temperate'):
+            Climate.objects.create(name=name)
+        self.url = reverse('planet-bulk')
+
+    def post(self, items, query='', expected=status.HTTP_200_OK):
+        response = self.client.post(self.url + query, items, format='json')
+        self.assertEqual(response.status_code, expected, response.content)
+        return response.data
+
+    def items(self, prefix, count):
+        return [
+            {'name': f'{prefix} {index}', 'population': index, 'terrains': ['desert'], 'climates': ['arid']}
+            for index in range(count)
+        ]
+
+    def test_bulk_create_update_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            data = self.post(self.items('Planet', 3))
+        self.assertEqual((data['created'], data['errors']), (3, 0))
+        self.assertEqual([result['status'] for result in data['results']], ['created'] * 3)
+        planet = Planet.objects.get(name='Planet 1')
+        self.assertEqual(data['results'][1]['id'], planet.pk)
+        self.assertEqual(list(planet.terrains.values_list('name', flat=True)), ['desert'])
+        self.assertEqual(planet.terrain_mask, Terrain.objects.get(name='desert').bit)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            data = self.post([
+                {'op': 'update', 'name': 'Planet 1', 'terrains': ['ocean']},
+                {'op': 'update', 'name': 'Planet 2', 'population': 42},
+                {'op': 'delete', 'name': 'Planet 0'},
+            ])
+        self.assertEqual((data['updated'], data['deleted']), (2, 1))
+        self.assertFalse(Planet.objects.filter(name='Planet 0').exists())
+        planet = Planet.objects.get(name='Planet 1')
+        self.assertEqual((planet.population, list(planet.terrains.values_list('name', flat=True))), (1, ['ocean']))
+        planet = Planet.objects.get(name='Planet 2')
+        # fields left out of an update are kept
+        self.assertEqual((planet.population, list(planet.climates.values_list('name', flat=True))), (42, ['arid']))
+        self.assertEqual(self.client.get(reverse('planet-list') + '?search=ocean').data['count'], 1)
+
+    def test_atomic_and_partial(self):
+        Planet.objects.create(name='Earth', population=1)
+        items = self.items('New', 2) + [
+            {'name': 'Earth', 'population': 2},
+            {'name': 'Lava', 'population': 1, 'terrains': ['lava']},
+            {'op': 'update', 'name': 'Nowhere'},
+            {'op': 'explode', 'name': 'Mars'},
+            {'name': 'New 0', 'population': 3},
+        ]
+        data = self.post(items, expected=status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            [result['status'] for result in data['results']],
+            ['skipped', 'skipped', 'error', 'error', 'error', 'error', 'error'],
+        )
+        self.assertEqual(data['results'][3]['errors'], {'terrains': ['Object with name=lava does not exist.']})
+        self.assertEqual(data['results'][6]['errors'], {'name': ['Duplicate name in this request.']})
+        self.assertFalse(Planet.objects.filter(name__startswith='New').exists())
+
+        data = self.post(items, '?atomic=false', expected=status.HTTP_207_MULTI_STATUS)
+        self.assertEqual((data['created'], data['errors']), (2, 5))
+        self.assertEqual(Planet.objects.filter(name__startswith='New').count(), 2)
+
+    def test_ndjson_body(self):
+        body = '\n'.join(json.dumps(item) for item in self.items('Line', 2)) + '\n\n'
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 2)
+        response = self.client.post(self.url, '{"name": "a"}\nnot json', content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('line 2', response.data['detail'])
+        self.assertEqual(self.post({'name': 'a'}, expected=status.HTTP_400_BAD_REQUEST)['non_field_errors'][0],
+                         'Expected a list of items.')
+
+    def test_concurrent_create(self):
+        from planets import bulk
+
+        Planet.objects.create(name='Race 1', population=1)
+        check_names, stale_checks = bulk.check_names, []
+
+        def stale_check(valid, races=1):
+            # the check misses 'Race 1', as if another request created it right after
+            if len(stale_checks) >= races:
+                return check_names(valid)
+            stale_checks.append(1)
+            Planet.objects.filter(name='Race 1').update(name='Race hidden')
+            checked = check_names(valid)
+            Planet.objects.filter(name='Race hidden').update(name='Race 1')
+            return checked
+
+        with mock.patch.object(bulk, 'check_names', stale_check):
+            data = self.post(self.items('Race', 3), '?atomic=false', expected=status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([result['status'] for result in data['results']], ['created', 'error', 'created'])
+        self.assertEqual(data['results'][1]['errors'], {'name': ["Planet 'Race 1' already exists."]})
+        self.assertEqual(Planet.objects.filter(name__startswith='Race').count(), 3)
+
+        stale_checks.clear()
+        with mock.patch.object(bulk, 'check_names', lambda valid: stale_check(valid, races=bulk.WRITE_ATTEMPTS)):
+            self.post(self.items('Again', 1) + [{'name': 'Race 1', 'population': 1}], expected=status.HTTP_409_CONFLICT)
+        self.assertFalse(Planet.objects.filter(name__startswith='Again').exists())
+
+    def test_reserved_names(self):
+        data = self.post([{'name': 'bulk', 'population': 1}], expected=status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(data['results'][0]['errors'], {'name': ["'bulk' is reserved for /api/v1/planets/bulk/."]})
+        # one created before the names were reserved can still be removed
+        Planet.objects.create(name='export', population=1)
+        self.assertEqual(self.post([{'op': 'delete', 'name': 'export'}])['deleted'], 1)
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        counts = []
+        for prefix, count in (('Small', 5), ('Large', 50)):
+            with CaptureQueriesContext(connection) as queries:
+                self.post(self.items(prefix, count))
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class PlanetAsyncViewTestCase(APITestCase):
+    def setUp(self):
+        desert = Terrain.objects.create(name='desert')
+        arid = Climate.objects.create(name='arid')
+        for index in range(12):
+            planet = Planet.objects.create(name=f'Planet {index:02d}', population=index * 10)
+            planet.terrains.set([desert] if index % 3 else [])
+            planet.climates.set([arid])
+        planet_cache.stats.reset()
+
+    async def assertSamePayload(self, query):
+        response = await self.async_client.get('/api/v1/async/planets/' + query)
+        expected = await sync_to_async(self.client.get)('/api/v1/planets/' + query)
+        self.assertEqual(response.status_code, expected.status_code)
+        data = response.json()
+        for link in ('next', 'previous'):
+            if data.get(link):
+                data[link] = data[link].replace('/async/', '/')
+        self.assertEqual(data, expected.json())
+        return data
+
+    async def test_list_matches_the_drf_view(self):
+        data = await self.assertSamePayload('')
+        self.assertEqual((data['count'], len(data['results'])), (12, 10))
+        data = await self.assertSamePayload('?page=2&page_size=3&ordering=-name&terrains__name=desert&population__gte=20')
+        self.assertEqual([planet['name'] for planet in data['results']], ['Planet 07', 'Planet 05', 'Planet 04'])
+        await self.assertSamePayload('?page=last&page_size=5')
+        await self.assertSamePayload('?page=9')
+        await self.assertSamePayload('?population=many')
+
+    async def test_detail_goes_through_the_cache(self):
+        response = await self.async_client.get('/api/v1/async/planets/Planet 03/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        expected = await sync_to_async(self.client.get)('/api/v1/planets/Planet 03/')
+        self.assertEqual(expected['X-Cache'], 'HIT')
+        self.assertEqual(response.json(), expected.json())
+        response = await self.async_client.get('/api/v1/async/planets/Planet 03/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        response = await self.async_client.get('/api/v1/async/planets/Nowhere/')
+        self.assertEqual((response.status_code, response.json()), (404, {'detail': "Planet 'Nowhere' not found"}))
+
+    @override_settings(API_AUTH_REQUIRED=True)
+    async def test_auth_required(self):
+        response = await self.async_client.get('/api/v1/async/planets/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        user = await User.objects.acreate(username='reader')
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+        response = await self.async_client.get('/api/v1/async/planets/', headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = await sync_to_async(self.client_class().get)('/api/v1/planets/', headers=headers)
+        self.assertEqual(expected.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['results'], expected.json()['results'])
+        response = await self.async_client.get('/api/v1/async/planets/', headers={'Authorization': 'Bearer nope'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
@@ -1,43 +1,40 @@
-
 # service view
 from django.http import JsonResponse
+from django.urls import reverse
+from django.utils.decorators import method_decorator
 from django.views import View
-from .services import fetch_planets_service
-from .models import Planet, Terrain, Climate
-from django.db import transaction
+from django.views.decorators.csrf import csrf_exempt
+from .jobs import start_sync, job_status
+from .models import Planet, PlanetSyncJob
 
 
+@method_decorator(csrf_exempt, name='dispatch')
 class PlanetServiceView(View):
-    def get(self, request):
-        planets_data = fetch_planets_service()
-
-        for planet in planets_data:
-            # Use transaction to avoid partial saves
-            with transaction.atomic():
-                planet_obj, created = Planet.objects.get_or_create(
-                    name=planet['name'],
-                    defaults={'population': planet['population']}
-                )
-                if planet.get('terrains'):
-                    terrain_objects = []
-                    for terrain_name in planet['terrains']:
+    """
+    POST: /planets-service/ => start (or join) a background SWAPI sync, returns the job id
+    GET:  /planets-service/ => status of the latest sync job
+    """
+    def post(self, request):
+        job, started = start_sync()
+        data = job_status(job)
+        data['started'] = started
+        data['status_url'] = request.build_absolute_uri(reverse('planets-service-job', kwargs={'job_id': job.pk}))
+        return JsonResponse(data, status=202)
 
-                        terrain, _ = Terrain.objects.get_or_create(name=terrain_name)
-                        terrain_objects.append(terrain)
-                    planet_obj.terrains.set(terrain_objects)
-                if planet.get('climates'):
-                    climate_objects = []
-                    for climate_name in planet['climates']:
-                        # important: to avoid duplicates, get or create climate
-                        climate, _ = Climate.objects.get_or_create(name=climate_name)
-                        climate_objects.append(climate)
-                    planet_obj.climates.set(climate_objects)
+    def get(self, request):
+        job = PlanetSyncJob.objects.first()
+        return JsonResponse({
+            'total_planets': Planet.objects.count(),
+            'last_job': job_status(job) if job else None,
+        })
 
-        # Fetch all planet objects from the database, to double check adding new ones
-        data = Planet.objects.all().values()
 
-        return JsonResponse({
-            'status': 'success',
-            'total_planets': len(data),
-            'planets': list(data)
-        }, safe=False)
+class PlanetSyncJobView(View):
+    """
+    GET: /planets-service/jobs/<job_id>/ => progress, duration and counts of a sync job
+    """
+    def get(self, request, job_id):
+        job = PlanetSyncJob.objects.filter(pk=job_id).first()
+        if job is None:
+            return JsonResponse({'detail': f"Sync job '{job_id}' not found"}, status=404)
+        return JsonResponse(job_status(job))